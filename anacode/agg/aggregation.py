@@ -1039,12 +1039,74 @@ class DatasetLoader(object):
 
         return cls(**kwargs)
 
+    @classmethod
+    def from_parquet(cls, path, columns=None):
+        """Initializes DatasetLoader from parquet files present in given
+        path. You could have obtained these by using
+        :class:`anacode.api.writers.ParquetWriter` to write your request
+        results. Needs optional pyarrow dependency.
+
+        :param path: Path to folder where AnacodeAPI analysis is stored in
+         parquet files
+        :type path: str
+        :param columns: Optionally maps table names to lists of columns that
+         should be loaded; other columns are not read from disk at all
+        :type columns: dict
+        :return: :class:`anacode.agg.DatasetLoader` -- DatasetLoader with found
+         parquet files loaded into data frames
+        """
+        log = logging.getLogger(__name__)
+        log.debug('Going to init ApiDataset from parquet files in %s', path)
+        columns = columns or {}
+        kwargs = {}
+        loaded = []
+
+        for call, files in CSV_FILES.items():
+            for file_name in files:
+                name = file_name[:-4]
+                parts = [pd.read_parquet(part_path, columns=columns.get(name))
+                         for _, part_path in writers.parquet_parts(path, name)]
+                if len(parts) == 1:
+                    kwargs[name] = parts[0]
+                    loaded.append(name)
+                elif parts:
+                    kwargs[name] = pd.concat(parts, ignore_index=True)
+                    loaded.append(name)
+                else:
+                    kwargs[name] = None
+
+        if len(loaded) == 0:
+            raise ValueError('No relevant parquet files in %s', path)
+        else:
+            log.info('Loaded %d parquet files', len(loaded))
+            log.debug('Loaded parquet files are: %s', loaded)
+
+        return cls(**kwargs)
+
+    @classmethod
+    def from_sqlite(cls, path):
+        """Initializes DatasetLoader from sqlite database written by
+        :class:`anacode.api.writers.SQLiteWriter`. Tables are not loaded into
+        memory up front; filtering by document ids and counting of concepts
+        and entities run as SQL queries and other aggregations load only the
+        tables they need.
+
+        :param path: Path to sqlite database
+        :type path: str
+        :return: :class:`anacode.agg.sql.SQLiteDatasetLoader` -- DatasetLoader
+         reading from the database
+        """
+        from anacode.agg.sql import SQLiteDatasetLoader
+        return SQLiteDatasetLoader(path)
+
     @classmethod
     def from_writer(cls, writer):
         """Initializes DatasetLoader from writer instance that was used to store
-        anacode analysis. Accepts both
-        :class:`anacode.api.writers.DataFrameWriter` and
-        :class:`anacode.api.writers.CSVWriter`.
+        anacode analysis. Accepts
+        :class:`anacode.api.writers.DataFrameWriter`,
+        :class:`anacode.api.writers.CSVWriter`,
+        :class:`anacode.api.writers.ParquetWriter` and
+        :class:`anacode.api.writers.SQLiteWriter`.
 
         :param writer: Writer that was used by
          :class:`anacode.api.client.Analyzer` to store analysis
@@ -1054,6 +1116,10 @@ class DatasetLoader(object):
         """
         if isinstance(writer, writers.CSVWriter):
             return cls.from_path(writer.target_dir)
+        elif isinstance(writer, writers.ParquetWriter):
+            return cls.from_parquet(writer.target_dir)
+        elif isinstance(writer, writers.SQLiteWriter):
+            return cls.from_sqlite(writer.path)
         elif isinstance(writer, writers.DataFrameWriter):
             return cls(**writer.frames)
         else:
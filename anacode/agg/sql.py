@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""Datasets backed by sqlite database written by
+:class:`anacode.api.writers.SQLiteWriter`. Counts and top-n aggregations run
+as SQL queries so only their results are loaded into memory. Other
+aggregations load the tables they need into data frames on first use.
+
+"""
+import sqlite3
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+import numpy as np
+import pandas as pd
+
+from anacode import codes
+from anacode.api.writers import HEADERS, COLUMN_TYPES
+from anacode.agg.aggregation import DatasetLoader, ConceptsDataset, \
+    ABSADataset, CategoriesDataset, SentimentDataset, NoRelevantData, \
+    _capitalize
+
+
+def _connect(path):
+    try:
+        return sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)),
+                               uri=True, check_same_thread=False)
+    except sqlite3.OperationalError:
+        raise ValueError('Can not open sqlite database {}'.format(path))
+
+
+def _read_table(db, name, where='', params=()):
+    frame = pd.read_sql_query(
+        'SELECT * FROM {} {} ORDER BY rowid'.format(name, where), db,
+        params=params)
+    for column in frame.columns:
+        if COLUMN_TYPES.get(column) is bool:
+            frame[column] = frame[column].astype(bool)
+    return frame
+
+
+def _reindex(counts, items):
+    if not isinstance(items, (tuple, list, set)):
+        items = [items]
+    return counts.reindex(list(items)).rename('Count').replace(np.nan, 0)
+
+
+def _type_prefix(column, prefix):
+    """SQL condition for values of *column* starting with *prefix*. Unlike
+    LIKE it is case sensitive the same way as pandas' str.startswith.
+    """
+    if not prefix:
+        return '1', ()
+    return 'substr({}, 1, ?) = ?'.format(column), (len(prefix), prefix)
+
+
+class _Tables(object):
+    """Lazily loaded tables of sqlite database. Tables are read whole on
+    first access and kept in memory; assigned frames replace database
+    content.
+    """
+    def __init__(self, db, names):
+        self._db = db
+        self._names = set(names)
+        self._frames = {}
+
+    def __contains__(self, name):
+        return name in self._names or name in self._frames
+
+    def loaded(self, name):
+        return name in self._frames
+
+    def __getitem__(self, name):
+        if name not in self._frames:
+            if name not in self._names:
+                return None
+            self._frames[name] = _read_table(self._db, name)
+        return self._frames[name]
+
+    def __setitem__(self, name, frame):
+        self._frames[name] = frame
+
+
+def _table_property(table):
+    def get(self):
+        return self._tables[table]
+
+    def set(self, frame):
+        self._tables[table] = frame
+    return property(get, set)
+
+
+class SQLiteConceptsDataset(ConceptsDataset):
+    """Concepts dataset whose frequency counts and most and least common
+    concepts are computed by sqlite.
+    """
+    _concepts = _table_property('concepts')
+    _surface_strings = _table_property('concepts_surface_strings')
+
+    def __init__(self, db, tables):
+        """
+
+        :param db: Connection to database written by SQLiteWriter
+        :type db: sqlite3.Connection
+        :param tables: Lazily loaded tables of the database
+        """
+        self._db = db
+        self._tables = tables
+        rows = db.execute('SELECT DISTINCT concept_type FROM concepts')
+        self._concept_filter = {row[0] for row in rows}
+        self._concept_filter.add('')
+
+    def _check_type(self, concept_type):
+        if concept_type not in self._concept_filter:
+            msg = '"{}" not valid filter string'.format(concept_type)
+            raise ValueError(msg)
+
+    def _counts(self, concept_type, order='', n=None, concepts=None):
+        where, params = ['1'], []
+        if concept_type:
+            where.append('concept_type = ?')
+            params.append(concept_type)
+        if concepts is not None:
+            where.append('concept IN ({})'.format(
+                ', '.join('?' * len(concepts))))
+            params.extend(concepts)
+        sql = 'SELECT concept, SUM(freq) AS count FROM concepts WHERE {} ' \
+              'GROUP BY concept'.format(' AND '.join(where))
+        if order:
+            sql += ' ORDER BY count {}, concept LIMIT ?'.format(order)
+            params.append(n)
+        rows = self._db.execute(sql, params).fetchall()
+        return pd.Series([count for _, count in rows],
+                         index=[concept for concept, _ in rows],
+                         dtype=float)
+
+    def _total(self, concept_type):
+        sql, params = 'SELECT SUM(freq) FROM concepts', ()
+        if concept_type:
+            sql, params = sql + ' WHERE concept_type = ?', (concept_type,)
+        return self._db.execute(sql, params).fetchone()[0] or 0
+
+    def concept_frequency(self, concept, concept_type='', normalize=False):
+        """Same as :meth:`ConceptsDataset.concept_frequency` computed by
+        sqlite.
+        """
+        self._check_type(concept_type)
+        concepts = concept if isinstance(concept, (tuple, list, set)) \
+            else [concept]
+        counts = self._counts(concept_type, concepts=list(concepts))
+        result = _reindex(counts, concepts)
+        result.index.name = _capitalize(concept_type) or 'Concept'
+        if normalize:
+            result = result.astype(float) / self._total(concept_type)
+        else:
+            result = result.astype(int)
+        result._plot_id = codes.CONCEPT_FREQUENCY
+        return result
+
+    def _common(self, n, concept_type, normalize, order, plot_id):
+        self._check_type(concept_type)
+        result = self._counts(concept_type, order, n).astype(int)
+        result = result.rename('Count')
+        result.index.name = _capitalize(concept_type) or 'Concept'
+        if normalize:
+            result = result.astype(float) / self._total(concept_type)
+        result._plot_id = plot_id
+        return result
+
+    def most_common_concepts(self, n=15, concept_type='', normalize=False):
+        """Same as :meth:`ConceptsDataset.most_common_concepts` computed by
+        sqlite.
+        """
+        return self._common(n, concept_type, normalize, 'DESC',
+                            codes.MOST_COMMON_CONCEPTS)
+
+    def least_common_concepts(self, n=15, concept_type='', normalize=False):
+        """Same as :meth:`ConceptsDataset.least_common_concepts` computed by
+        sqlite.
+        """
+        return self._common(n, concept_type, normalize, 'ASC',
+                            codes.LEAST_COMMON_CONCEPTS)
+
+
+class SQLiteABSADataset(ABSADataset):
+    """ABSA dataset whose entity frequency counts and most and least common
+    entities are computed by sqlite.
+    """
+    _entities = _table_property('absa_entities')
+    _normalized_texts = _table_property('absa_normalized_texts')
+    _relations = _table_property('absa_relations')
+    _relations_entities = _table_property('absa_relations_entities')
+    _evaluations = _table_property('absa_evaluations')
+    _evaluations_entities = _table_property('absa_evaluations_entities')
+
+    def __init__(self, db, tables):
+        """
+
+        :param db: Connection to database written by SQLiteWriter
+        :type db: sqlite3.Connection
+        :param tables: Lazily loaded tables of the database
+        """
+        self._db = db
+        self._tables = tables
+
+    def _counts(self, entity_type, order='', n=None, entities=None):
+        condition, params = _type_prefix('entity_type', entity_type)
+        params = list(params)
+        where = [condition, 'entity_name IS NOT NULL']
+        if entities is not None:
+            where.append('entity_name IN ({})'.format(
+                ', '.join('?' * len(entities))))
+            params.extend(entities)
+        sql = 'SELECT entity_name, COUNT(*) AS count FROM absa_entities ' \
+              'WHERE {} GROUP BY entity_name'.format(' AND '.join(where))
+        if order:
+            sql += ' ORDER BY count {}, entity_name LIMIT ?'.format(order)
+            params.append(n)
+        rows = self._db.execute(sql, params).fetchall()
+        return pd.Series([count for _, count in rows],
+                         index=[entity for entity, _ in rows], dtype=float)
+
+    def _total(self, entity_type):
+        condition, params = _type_prefix('entity_type', entity_type)
+        return self._db.execute(
+            'SELECT COUNT(*) FROM absa_entities WHERE {} AND '
+            'entity_name IS NOT NULL'.format(condition), params).fetchone()[0]
+
+    def entity_frequency(self, entity, entity_type='', normalize=False):
+        """Same as :meth:`ABSADataset.entity_frequency` computed by sqlite.
+        """
+        entities = entity if isinstance(entity, (tuple, list, set)) \
+            else [entity]
+        counts = self._counts(entity_type, entities=list(entities))
+        if normalize:
+            counts = counts / (self._total(entity_type) or 1)
+        result = _reindex(counts, entities)
+        result.index.name = _capitalize(entity_type) or 'Entity'
+        if not normalize:
+            result = result.astype(int)
+        result._plot_id = codes.ENTITY_FREQUENCY
+        return result
+
+    def _common(self, n, entity_type, normalize, order, plot_id):
+        result = self._counts(entity_type, order, n).rename('Count')
+        if normalize:
+            result = result / (self._total(entity_type) or 1)
+        else:
+            result = result.astype(int)
+        result.index.name = _capitalize(entity_type) or 'Entity'
+        result._plot_id = plot_id
+        return result
+
+    def most_common_entities(self, n=15, entity_type='', normalize=False):
+        """Same as :meth:`ABSADataset.most_common_entities` computed by
+        sqlite.
+        """
+        return self._common(n, entity_type, normalize, 'DESC',
+                            codes.MOST_COMMON_ENTITIES)
+
+    def least_common_entities(self, n=15, entity_type='', normalize=False):
+        """Same as :meth:`ABSADataset.least_common_entities` computed by
+        sqlite.
+        """
+        return self._common(n, entity_type, normalize, 'ASC',
+                            codes.LEAST_COMMON_ENTITIES)
+
+
+class SQLiteDatasetLoader(DatasetLoader):
+    """Dataset loader reading sqlite database written by
+    :class:`anacode.api.writers.SQLiteWriter`. Tables are loaded into data
+    frames only when aggregation needs them; :meth:`filter` selects documents
+    with SQL query and frequency and most and least common concepts and
+    entities are counted by sqlite.
+
+    """
+    _categories = _table_property('categories')
+    _concepts = _table_property('concepts')
+    _concepts_surface_strings = _table_property('concepts_surface_strings')
+    _sentiments = _table_property('sentiments')
+    _absa_entities = _table_property('absa_entities')
+    _absa_normalized_texts = _table_property('absa_normalized_texts')
+    _absa_relations = _table_property('absa_relations')
+    _absa_relations_entities = _table_property('absa_relations_entities')
+    _absa_evaluations = _table_property('absa_evaluations')
+    _absa_evaluations_entities = _table_property('absa_evaluations_entities')
+
+    def __init__(self, path):
+        """Raises ValueError if database has no data.
+
+        :param path: Path to sqlite database
+        :type path: str
+        """
+        self.path = path
+        self._db = _connect(path)
+        names = [name for name in HEADERS if self._has_rows(name)]
+        self._tables = _Tables(self._db, names)
+        self.has_categories = 'categories' in names
+        self.has_concepts = 'concepts' in names or \
+            'concepts_surface_strings' in names
+        self.has_sentiments = 'sentiments' in names
+        self.has_absa = any(name.startswith('absa_') for name in names)
+        if not (self.has_categories or self.has_concepts or
+                self.has_sentiments or self.has_absa):
+            raise ValueError('No relevant data in {}'.format(path))
+
+    def _has_rows(self, name):
+        try:
+            return self._db.execute(
+                'SELECT 1 FROM {} LIMIT 1'.format(name)).fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def __getitem__(self, item):
+        if item not in HEADERS:
+            raise KeyError('Don\'t recognize "{}" dataset'.format(item))
+        return self._tables[item]
+
+    def _in_database(self, *names):
+        return all(not self._tables.loaded(name) for name in names)
+
+    @property
+    def concepts(self):
+        """Creates concepts dataset if data is available. Counts are computed
+        by sqlite unless concepts were modified in memory, for example by
+        :meth:`remove_concepts`.
+
+        :return: :class:`anacode.agg.aggregations.ConceptsDataset` --
+        """
+        if not self.has_concepts:
+            raise NoRelevantData('Concepts data not available!')
+        if 'concepts' in self._tables and \
+                self._in_database('concepts', 'concepts_surface_strings'):
+            return SQLiteConceptsDataset(self._db, self._tables)
+        return ConceptsDataset(self._concepts,
+                               self._concepts_surface_strings)
+
+    @property
+    def categories(self):
+        """Creates new CategoriesDataset if data is available.
+
+        :return: :class:`anacode.agg.aggregations.CategoriesDataset` --
+        """
+        if not self.has_categories:
+            raise NoRelevantData('Categories data not available!')
+        return CategoriesDataset(self._categories)
+
+    @property
+    def sentiments(self):
+        """Creates new SentimentDataset if data is available.
+
+        :return: :class:`anacode.agg.aggregations.SentimentDataset` --
+        """
+        if not self.has_sentiments:
+            raise NoRelevantData('Sentiment data is not available!')
+        return SentimentDataset(self._sentiments)
+
+    @property
+    def absa(self):
+        """Creates ABSA dataset if data is available. Entity counts are
+        computed by sqlite.
+
+        :return: :class:`anacode.agg.aggregations.ABSADataset` --
+        """
+        if not self.has_absa:
+            raise NoRelevantData('ABSA data is not available!')
+        if 'absa_entities' in self._tables and \
+                self._in_database('absa_entities'):
+            return SQLiteABSADataset(self._db, self._tables)
+        return ABSADataset(
+            self._absa_entities, self._absa_normalized_texts,
+            self._absa_relations, self._absa_relations_entities,
+            self._absa_evaluations, self._absa_evaluations_entities,
+        )
+
+    def filter(self, document_ids):
+        """Creates new in-memory DatasetLoader with data only from documents
+        with ids in *document_ids*. Only rows of these documents are read
+        from the database.
+
+        :param document_ids: Iterable with document ids. Cannot be empty.
+        :type document_ids: iterable
+        :return: DatasetLoader -- New DatasetLoader instance with data only from
+         desired documents
+        """
+        document_ids = set(document_ids)
+        if len(document_ids) == 0:
+            raise ValueError('Can\'t use empty filter')
+
+        frames = {}
+        self._db.execute('CREATE TEMP TABLE IF NOT EXISTS filter_ids '
+                         '(doc_id INTEGER PRIMARY KEY)')
+        try:
+            self._db.executemany('INSERT OR IGNORE INTO filter_ids VALUES (?)',
+                                 [(int(i),) for i in document_ids])
+            for name in HEADERS:
+                if name not in self._tables:
+                    frames[name] = None
+                elif self._tables.loaded(name):
+                    frame = self._tables[name]
+                    frames[name] = frame[frame.doc_id.isin(document_ids)]
+                else:
+                    frames[name] = _read_table(
+                        self._db, name,
+                        'WHERE doc_id IN (SELECT doc_id FROM filter_ids)')
+        finally:
+            self._db.execute('DELETE FROM filter_ids')
+        return DatasetLoader(**frames)
+
+    def close(self):
+        """Closes database connection."""
+        self._db.close()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from collections import deque
+try:
+    from urllib.parse import urljoin
+except ImportError:
+    from urlparse import urljoin
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from anacode import codes
+from anacode.api.client import ANACODE_API_URL, COMPRESSION_WBITS, \
+    _make_writer, _text_length, _request_body, get_codec
+from anacode.api.retry import RetryPolicy
+
+
+async def _async_analysis(session, call_endpoint, auth, max_retries=3,
+                          rate_limiter=None, retry_policy=None, utf8=False,
+                          compression=None, codec=None, **kwargs):
+    headers = {'Authorization': 'Token %s' % auth,
+               'Accept': 'application/json'}
+    codec = get_codec(codec)
+    extra_headers, body, _ = _request_body(kwargs, utf8, compression, codec)
+    headers.update(extra_headers)
+    chars = _text_length(kwargs.get('texts'))
+    if retry_policy is None:
+        retry_policy = RetryPolicy(max_retries=max_retries)
+    retry_policy.record_request()
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            wait = rate_limiter.try_acquire(chars)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = rate_limiter.try_acquire(chars)
+        try:
+            async with session.post(call_endpoint, headers=headers,
+                                    **body) as res:
+                if rate_limiter is not None:
+                    rate_limiter.update(res.headers)
+                if res.status < 400:
+                    return codec.loads(await res.read())
+                if not retry_policy.should_retry(attempt, res.status):
+                    res.raise_for_status()
+                delay = retry_policy.delay(attempt, res.headers)
+        except aiohttp.ClientResponseError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if not retry_policy.should_retry(attempt):
+                raise
+            delay = retry_policy.delay(attempt)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+class AsyncAnacodeClient(object):
+    """Asyncio version of :class:`anacode.api.client.AnacodeClient`. All
+    methods that communicate with the API are coroutines. Requires optional
+    aiohttp dependency that can be installed with
+    ``pip install anacode[async]``.
+
+    Underlying :class:`aiohttp.ClientSession` is created lazily inside running
+    event loop and should be closed with :meth:`close` or by using client as
+    async context manager.
+
+    """
+    def __init__(self, auth, base_url=ANACODE_API_URL, max_connections=100,
+                 rate_limiter=None, retry_policy=None, utf8=False,
+                 compression=None, codec=None):
+        """Default value for base_url is taken from environment variable
+        ANACODE_API_URL if set; otherwise, 'https://api.anacode.de/' is used.
+
+        :param auth: User's token
+        :type auth: str
+        :param base_url: Anacode API server URL
+        :type base_url: str
+        :param max_connections: Maximum number of simultaneously open
+         connections to the server
+        :type max_connections: int
+        :param rate_limiter: Keeps requests within request and character
+         quotas. Waiting for quota does not block event loop
+        :type rate_limiter: :class:`anacode.api.limits.RateLimiter`
+        :param retry_policy: Decides which failed requests are retried and
+         when
+        :type retry_policy: :class:`anacode.api.retry.RetryPolicy`
+        :param utf8: Send request bodies as UTF-8 encoded json
+        :type utf8: bool
+        :param compression: Compress request bodies; 'gzip' or 'deflate'
+        :type compression: str
+        :param codec: Json codec or its name, fastest installed by default
+        :type codec: :class:`anacode.api.client.JsonCodec`
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncAnacodeClient requires aiohttp. Install '
+                              'it with "pip install anacode[async]".')
+        if compression is not None and compression not in COMPRESSION_WBITS:
+            raise ValueError('Unsupported compression "{}"'.format(
+                compression))
+        self.auth = auth
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.utf8 = utf8
+        self.compression = compression
+        self.codec = get_codec(codec)
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _post(self, endpoint, **data):
+        return await _async_analysis(self._get_session(), endpoint, self.auth,
+                                     rate_limiter=self.rate_limiter,
+                                     retry_policy=self.retry_policy,
+                                     utf8=self.utf8,
+                                     compression=self.compression,
+                                     codec=self.codec, **data)
+
+    async def scrape(self, link):
+        """Coroutine version of
+        :meth:`anacode.api.client.AnacodeClient.scrape`.
+
+        :param link: URL that should be scraped
+        :type link: str
+        :return: dict --
+        """
+        url = urljoin(self.base_url, '/scrape/')
+        return await self._post(url, url=link)
+
+    async def analyze(self, texts, analyses, external_entity_data=None,
+                      single_document=False):
+        """Coroutine version of
+        :meth:`anacode.api.client.AnacodeClient.analyze`.
+
+        :param texts: List of texts to analyze
+        :param analyses: List of analysss to perform. Can contain 'categories',
+         'concepts', 'sentiment' and 'absa'
+        :param external_entity_data: Provide additional entities to relate to
+         sentiment evaluation.
+        :param single_document: Makes API treat texts as paragraphs of one
+         document instead of treating them as separate documents
+        :type single_document: bool
+        :return: dict --
+        """
+        url = urljoin(self.base_url, '/analyze/')
+        data = {'texts': texts, 'analyses': analyses}
+        if external_entity_data is not None:
+            data['absa'] = {'external_entity_data': external_entity_data}
+        if single_document:
+            data['single_document'] = True
+        return await self._post(url, **data)
+
+    async def call(self, task):
+        """Coroutine version of :meth:`anacode.api.client.AnacodeClient.call`.
+
+        :param task: Task definition tuple - (analysis code, analysis args)
+        :type task: tuple
+        :return: dict --
+        """
+        call, args = task[0], task[1:]
+
+        if call == codes.SCRAPE:
+            return await self.scrape(*args)
+        if call == codes.ANALYZE:
+            return await self.analyze(*args)
+
+    async def close(self):
+        """Closes underlying HTTP session and all its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncAnalyzer(object):
+    """Asyncio version of :class:`anacode.api.client.Analyzer`. Instead of
+    thread pool it keeps up to *concurrency* requests in flight on the event
+    loop. Results are handed to writer in the order tasks were submitted so
+    writers assign the same document ids as with synchronous Analyzer.
+    Finished results wait in memory for slower tasks submitted before them,
+    at most *window* tasks are running or waiting at the same time.
+
+    Client's HTTP session is closed when analyzer's context is left.
+
+    """
+    def __init__(self, client, writer, concurrency=100, bulk_size=100,
+                 window=None):
+        """
+
+        :param client: Will be used to post analysis to anacode api
+        :type client: :class:`anacode.api.aio.AsyncAnacodeClient`
+        :param writer: Needs to implement init, close and write_bulk methods
+         from Writer interface
+        :type writer: :class:`anacode.api.writers.Writer`
+        :param concurrency: Maximum number of requests in flight, defaults
+         to 100
+        :type concurrency: int
+        :param bulk_size: How many finished results to collect before
+         writer's write_bulk method is invoked, defaults to 100
+        :type bulk_size: int
+        :param window: Maximum number of tasks that are running or have
+         results waiting for earlier tasks, defaults to four times
+         *concurrency*
+        :type window: int
+        """
+        self.client = client
+        self.writer = writer
+        self.concurrency = concurrency
+        self.window = window or 4 * concurrency
+        self.bulk_size = bulk_size
+        self.task_queue = deque()
+        self.analyzed = []
+        self.analyzed_types = []
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self.writer.init()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                await self.execute_tasks_and_store_output()
+            else:
+                for _, future in self.task_queue:
+                    future.cancel()
+                self.task_queue.clear()
+        finally:
+            self.writer.close()
+            await self.client.close()
+
+    async def _call(self, task):
+        try:
+            return await self.client.call(task)
+        finally:
+            self._semaphore.release()
+
+    async def _submit(self, task):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        while len(self.task_queue) >= self.window:
+            await asyncio.wait([self.task_queue[0][1]])
+            self.collect_finished()
+            if len(self.analyzed) >= self.bulk_size:
+                self.flush_analysis_data()
+        await self._semaphore.acquire()
+        future = asyncio.ensure_future(self._call(task))
+        self.task_queue.append((task[0], future))
+        self.collect_finished()
+        if len(self.analyzed) >= self.bulk_size:
+            self.flush_analysis_data()
+
+    def collect_finished(self):
+        """Moves results of finished tasks from the head of task queue to
+        internal cache. Stops at first task that is still running so that
+        submission order is preserved.
+        """
+        while self.task_queue and self.task_queue[0][1].done():
+            call_type, future = self.task_queue.popleft()
+            self.analyzed.append(future.result())
+            self.analyzed_types.append(call_type)
+
+    def flush_analysis_data(self):
+        """Writes all cached analysis results using writer."""
+        self.writer.write_bulk(zip(self.analyzed_types, self.analyzed))
+        self.analyzed_types = []
+        self.analyzed = []
+
+    async def execute_tasks_and_store_output(self):
+        """Waits for all submitted tasks to finish and writes their results."""
+        if self.task_queue:
+            await asyncio.wait([future for _, future in self.task_queue])
+        self.collect_finished()
+        self.flush_analysis_data()
+
+    async def scrape(self, link):
+        """Schedules :meth:`anacode.api.aio.AsyncAnacodeClient.scrape` call.
+        Waits only if there are already *concurrency* requests in flight or
+        *window* tasks that are not written yet.
+        """
+        await self._submit((codes.SCRAPE, link))
+
+    async def analyze(self, texts, analyses, external_entity_data=None,
+                      single_document=False):
+        """Schedules :meth:`anacode.api.aio.AsyncAnacodeClient.analyze` call.
+        Waits only if there are already *concurrency* requests in flight or
+        *window* tasks that are not written yet.
+        """
+        await self._submit((codes.ANALYZE, texts, analyses,
+                            external_entity_data, single_document))
+
+
+def async_analyzer(auth, writer, concurrency=100, bulk_size=100,
+                   base_url=ANACODE_API_URL, window=None):
+    """Asyncio counterpart of :func:`anacode.api.client.analyzer`.
+
+    :param auth: User's token string
+    :type auth: str
+    :param writer: Writer instance that will store analysis results or path to
+     folder where csv-s should be saved or dictionary where data frames should
+     be stored
+    :type writer: :class:`anacode.api.writers.Writer`
+    :param concurrency: Maximum number of requests in flight
+    :type concurrency: int
+    :param bulk_size: How many results to collect before writing them
+    :type bulk_size: int
+    :param base_url: Anacode API server URL
+    :type base_url: str
+    :param window: Maximum number of tasks running or waiting to be written
+    :type window: int
+    :return: :class:`anacode.api.aio.AsyncAnalyzer` -- Bulk analyzer instance
+    """
+    writer = _make_writer(writer)
+    client = AsyncAnacodeClient(auth, base_url, max_connections=concurrency)
+    return AsyncAnalyzer(client, writer, concurrency, bulk_size=bulk_size,
+                         window=window)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def cache_key(texts, analyses, external_entity_data=None,
+              single_document=False):
+    """Computes content hash of analyze call arguments. Order of analyses
+    does not change the key, order of texts does.
+
+    :param texts: List of texts to analyze
+    :param analyses: List of analyses to perform
+    :param external_entity_data: Additional entities for sentiment evaluation
+    :param single_document: Texts are paragraphs of one document
+    :type single_document: bool
+    :return: str -- Hex digest identifying the call
+    """
+    data = {
+        'texts': list(texts),
+        'analyses': sorted(analyses),
+        'external_entity_data': external_entity_data,
+        'single_document': bool(single_document),
+    }
+    body = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    """Base class for persistent caches of analyze call results. Results are
+    stored under keys computed by :func:`anacode.api.cache.cache_key`.
+
+    Entries older than *ttl* seconds are treated as missing. When total size
+    of stored results exceeds *max_size* bytes least recently used entries
+    are removed. Caches keep running total of their size, so eviction only
+    visits entries it removes.
+
+    Caches are thread-safe so one cache can be used by analyzer with multiple
+    threads.
+
+    """
+    def __init__(self, max_size=None, ttl=None):
+        """
+
+        :param max_size: Maximum total size of stored results in bytes;
+         unlimited if None
+        :type max_size: int
+        :param ttl: Number of seconds after which entry expires; entries
+         never expire if None
+        :type ttl: float
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and created + self.ttl < now
+
+    def _load(self, key, now):
+        raise NotImplementedError
+
+    def _store(self, key, value, now):
+        raise NotImplementedError
+
+    def get(self, key):
+        """Returns stored result for *key*.
+
+        :param key: Cache key
+        :type key: str
+        :return: dict -- Stored result or None if there is no valid entry
+        """
+        value = self.get_raw(key)
+        return None if value is None else json.loads(value)
+
+    def get_raw(self, key):
+        """Returns stored result for *key* as json string without decoding
+        it.
+
+        :param key: Cache key
+        :type key: str
+        :return: str -- Stored json or None if there is no valid entry
+        """
+        with self._lock:
+            value = self._load(key, time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, result):
+        """Stores *result* under *key* and evicts old entries if cache grew
+        over its size limit.
+
+        :param key: Cache key
+        :type key: str
+        :param result: Json serializable analysis result
+        :type result: dict
+        """
+        self.set_raw(key, json.dumps(result, ensure_ascii=False))
+
+    def set_raw(self, key, value):
+        """Stores already encoded json *value* under *key*.
+
+        :param key: Cache key
+        :type key: str
+        :param value: Json encoded analysis result
+        :type value: str
+        """
+        with self._lock:
+            self._store(key, value, time.time())
+
+    def stats(self):
+        """Returns cache effectiveness counters.
+
+        :return: dict -- 'hits' and 'misses' of :meth:`get` calls, number of
+         'entries' and their total 'size' in bytes
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes all entries."""
+        raise NotImplementedError
+
+    def close(self):
+        """Releases resources held by cache."""
+        pass
+
+
+class SQLiteCache(ResponseCache):
+    """Keeps analysis results in single SQLite database file."""
+    def __init__(self, path, max_size=None, ttl=None):
+        """
+
+        :param path: Path to database file, created if it does not exist
+        :type path: str
+        :param max_size: Maximum total size of stored results in bytes
+        :type max_size: int
+        :param ttl: Number of seconds after which entry expires
+        :type ttl: float
+        """
+        super(SQLiteCache, self).__init__(max_size, ttl)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'size INTEGER NOT NULL, created REAL NOT NULL, '
+                'accessed REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS '
+                               'responses_accessed ON responses (accessed)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS '
+                               'responses_created ON responses (created)')
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _load(self, key, now):
+        row = self._conn.execute(
+            'SELECT value, created, size FROM responses WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            if self._expired(row[1], now):
+                self._conn.execute('DELETE FROM responses WHERE key = ?',
+                                   (key,))
+                expired = True
+            else:
+                self._conn.execute('UPDATE responses SET accessed = ? '
+                                   'WHERE key = ?', (now, key))
+                expired = False
+        if expired:
+            self._size -= row[2]
+            return None
+        return row[0]
+
+    def _store(self, key, value, now):
+        size = len(value.encode('utf-8'))
+        with self._conn:
+            old = self._conn.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, now, now))
+            total = self._size + size - (old[0] if old else 0)
+            if self.ttl is not None:
+                total -= self._conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM responses '
+                    'WHERE created < ?', (now - self.ttl,)).fetchone()[0]
+                self._conn.execute('DELETE FROM responses WHERE created < ?',
+                                   (now - self.ttl,))
+            if self.max_size is not None:
+                total -= self._evict(total - self.max_size)
+        # total is kept only when transaction was committed
+        self._size = total
+
+    def _evict(self, excess):
+        """Deletes least recently used entries with at least *excess*
+        bytes. Entries are read in access order through index and reading
+        stops as soon as enough of them is found.
+
+        :return: int -- Number of bytes deleted
+        """
+        if excess <= 0:
+            return 0
+        keys, freed = [], 0
+        cursor = self._conn.execute(
+            'SELECT key, size FROM responses ORDER BY accessed')
+        for key, size in cursor:
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        cursor.close()
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', keys)
+        return freed
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': entries, 'size': self._size}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DirectoryCache(ResponseCache):
+    """Keeps every analysis result in separate json file in *path* directory.
+    Files are spread into subdirectories by first two characters of their
+    key. Last access time is tracked through file modification time so
+    eviction order survives restarts. Entries are kept in memory ordered from
+    least recently used.
+
+    """
+    def __init__(self, path, max_size=None, ttl=None):
+        """
+
+        :param path: Cache directory, created if it does not exist
+        :type path: str
+        :param max_size: Maximum total size of stored results in bytes
+        :type max_size: int
+        :param ttl: Number of seconds after which entry expires
+        :type ttl: float
+        """
+        super(DirectoryCache, self).__init__(max_size, ttl)
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        entries = []
+        for prefix in os.listdir(path):
+            subdir = os.path.join(path, prefix)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if name.endswith('.json'):
+                    stat = os.stat(os.path.join(subdir, name))
+                    entries.append((name[:-5],
+                                    (stat.st_size, stat.st_mtime)))
+        entries.sort(key=lambda e: e[1][1])
+        self._entries = OrderedDict(entries)
+        self._size = sum(size for _, (size, _) in entries)
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def _remove(self, key):
+        size, _ = self._entries.pop(key, (0, None))
+        self._size -= size
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _load(self, key, now):
+        if key not in self._entries:
+            return None
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            self._remove(key)
+            return None
+        if self._expired(entry['created'], now):
+            self._remove(key)
+            return None
+        os.utime(path, (now, now))
+        self._entries[key] = (self._entries[key][0], now)
+        self._entries.move_to_end(key)
+        return entry['value']
+
+    def _store(self, key, value, now):
+        path = self._file(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        data = json.dumps({'created': now, 'value': value},
+                          ensure_ascii=False).encode('utf-8')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, path)
+        self._size -= self._entries.pop(key, (0, None))[0]
+        self._entries[key] = (len(data), now)
+        self._size += len(data)
+        if self.max_size is not None:
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_size and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'size': self._size}
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
@@ -2,77 +2,693 @@
 import os
 import time
 import json
+import zlib
+import logging
+import threading
 import requests
+import multiprocessing
+from contextlib import contextmanager
+from collections import deque
+from functools import partial
 from multiprocessing.dummy import Pool
+from requests.adapters import HTTPAdapter
 try:
     from urllib.parse import urljoin
 except ImportError:
     from urlparse import urljoin
+try:
+    from queue import Queue, LifoQueue, Empty
+except ImportError:
+    from Queue import Queue, LifoQueue, Empty
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 from anacode import codes
 from anacode.api import writers
+from anacode.api.cache import cache_key
+from anacode.api.journal import Journal
+from anacode.api.limits import is_overload
+from anacode.api.observers import notify
+from anacode.api.retry import RetryPolicy
+from anacode.api.sources import iter_texts
 
 
 MAX_REQUEST_BYTES_SIZE = 1000 ** 2
 ANACODE_API_URL = os.getenv('ANACODE_API_URL', 'https://api.anacode.de/')
 
 
-def _analysis(call_endpoint, auth, max_retries=3, **kwargs):
+def _text_length(texts):
+    return sum(len(text) for text in texts or [])
+
+
+# zlib window bits producing HTTP gzip and deflate (zlib) formats
+COMPRESSION_WBITS = {'gzip': 31, 'deflate': 15}
+
+
+def _json_dumps(obj, utf8=False):
+    return json.dumps(obj, ensure_ascii=not utf8)
+
+
+class JsonCodec(object):
+    """Encodes request bodies and decodes responses using standard library
+    json module. Subclasses use faster optional libraries.
+
+    """
+    name = 'json'
+    #: Bytes between items of encoded list
+    separator = b', '
+
+    def dumps(self, obj, utf8=False):
+        """Encodes *obj* to json.
+
+        :param obj: Json serializable object
+        :param utf8: Keep non-ASCII characters instead of escaping them
+        :type utf8: bool
+        :return: bytes -- UTF-8 encoded json
+        """
+        return json.dumps(obj, ensure_ascii=not utf8).encode('utf-8')
+
+    def loads(self, data):
+        """Decodes json document.
+
+        :param data: UTF-8 encoded json
+        :type data: bytes
+        :return: Decoded object
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    """Uses ujson library."""
+    name = 'ujson'
+    separator = b','
+
+    def dumps(self, obj, utf8=False):
+        return ujson.dumps(obj, ensure_ascii=not utf8,
+                           escape_forward_slashes=False).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """Uses orjson library. Orjson can not escape non-ASCII characters, so
+    such bodies are encoded by standard library with the same compact
+    separators.
+
+    """
+    name = 'orjson'
+    separator = b','
+
+    def dumps(self, obj, utf8=False):
+        if utf8:
+            return orjson.dumps(obj)
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+CODECS = {
+    'orjson': (OrjsonCodec, lambda: orjson),
+    'ujson': (UjsonCodec, lambda: ujson),
+    'json': (JsonCodec, lambda: json),
+}
+
+
+def get_codec(codec=None):
+    """Returns json codec. Without argument the fastest installed one is
+    picked - orjson, ujson or standard library json in this order.
+
+    :param codec: Codec instance or name of codec: 'orjson', 'ujson' or
+     'json'
+    :return: :class:`anacode.api.client.JsonCodec` -- Codec instance
+    """
+    if isinstance(codec, JsonCodec):
+        return codec
+    if codec is None:
+        for name in ('orjson', 'ujson', 'json'):
+            cls, module = CODECS[name]
+            if module() is not None:
+                return cls()
+    if codec not in CODECS:
+        raise ValueError('Unknown json codec "{}"'.format(codec))
+    cls, module = CODECS[codec]
+    if module() is None:
+        raise ImportError('Json codec "{}" is not installed'.format(codec))
+    return cls()
+
+
+def _compressor(compression):
+    if compression not in COMPRESSION_WBITS:
+        raise ValueError('Unsupported compression "{}"'.format(compression))
+    return zlib.compressobj(6, zlib.DEFLATED, COMPRESSION_WBITS[compression])
+
+
+def _request_body(data, utf8=False, compression=None, codec=None):
+    """Prepares request body. Returns extra headers, keyword arguments for
+    post call and size of uncompressed body.
+    """
+    body = get_codec(codec).dumps(data, utf8)
+    headers = {'Content-Type': 'application/json; charset=utf-8'}
+    raw_size = len(body)
+    if compression is not None:
+        compressor = _compressor(compression)
+        body = compressor.compress(body) + compressor.flush()
+        headers['Content-Encoding'] = compression
+        headers['Accept-Encoding'] = 'gzip, deflate'
+    return headers, {'data': body}, raw_size
+
+
+class TransferStats(object):
+    """Thread-safe counters of bytes exchanged with the server, retries and
+    latencies of recent requests.
+    """
+    #: Number of most recent latencies kept for percentiles
+    LATENCY_SAMPLES = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.body_bytes = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+
+    def record_retry(self):
+        """Counts one retried request."""
+        with self._lock:
+            self.retries += 1
+
+    def latency_percentile(self, percent):
+        """Computes latency percentile of recent requests.
+
+        :param percent: Percentile between 0 and 100
+        :type percent: float
+        :return: float -- Latency in seconds or None if there were no requests
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        index = int(round(percent / 100. * (len(latencies) - 1)))
+        return latencies[index]
+
+    def record(self, response, raw_size=None, latency=None):
+        """Adds sizes of request that received *response* to counters.
+
+        :param response: Server response
+        :type response: requests.Response
+        :param raw_size: Size of request body before compression; if None
+         body was not compressed
+        :type raw_size: int
+        :param latency: Seconds between sending request and receiving
+         response
+        :type latency: float
+        """
+        body = getattr(getattr(response, 'request', None), 'body', None)
+        sent = len(body) if body else 0
+        received = _received_size(response)
+        with self._lock:
+            self.requests += 1
+            self.body_bytes += sent if raw_size is None else raw_size
+            self.sent_bytes += sent
+            self.received_bytes += received
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def as_dict(self):
+        """Returns snapshot of counters.
+
+        :return: dict -- 'requests' is number of HTTP requests, 'retries'
+         number of them that were retries of failed ones, 'body_bytes'
+         size of request bodies before compression, 'sent_bytes' size of
+         request bodies actually sent and 'received_bytes' size of response
+         bodies as received from server
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'body_bytes': self.body_bytes,
+                'sent_bytes': self.sent_bytes,
+                'received_bytes': self.received_bytes,
+            }
+
+
+def _received_size(response):
+    length = response.headers.get('Content-Length')
+    return int(length) if length else len(response.content)
+
+
+def _analysis(call_endpoint, auth, max_retries=3, session=None,
+              rate_limiter=None, retry_policy=None, utf8=False,
+              compression=None, transfer_stats=None, codec=None,
+              observers=(), **kwargs):
     headers = {'Authorization': 'Token %s' % auth,
                'Accept': 'application/json'}
+    post = requests.post if session is None else session.post
+    extra_headers, body, raw_size = _request_body(kwargs, utf8, compression,
+                                                  codec)
+    headers.update(extra_headers)
+    sent = len(body['data'])
+    chars = _text_length(kwargs.get('texts'))
+    if retry_policy is None:
+        retry_policy = RetryPolicy(max_retries=max_retries)
+    retry_policy.record_request()
+    attempt = 0
     while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire(chars)
+        if attempt and transfer_stats is not None:
+            transfer_stats.record_retry()
+        notify(observers, 'request_start', call_endpoint, sent)
+        start = time.time()
         try:
-            res = requests.post(call_endpoint, headers=headers, json=kwargs)
+            res = post(call_endpoint, headers=headers, **body)
         except requests.RequestException:
-            if max_retries == 0:
+            notify(observers, 'request_end', call_endpoint, None,
+                   time.time() - start, sent, 0)
+            if not retry_policy.should_retry(attempt):
                 raise
-            else:
-                max_retries -= 1
-                time.sleep(0.1)
+            status = None
+            delay = retry_policy.delay(attempt)
         else:
-            return res
+            latency = time.time() - start
+            if rate_limiter is not None:
+                rate_limiter.update(res.headers)
+            if transfer_stats is not None:
+                transfer_stats.record(res, raw_size, latency)
+            notify(observers, 'request_end', call_endpoint, res.status_code,
+                   latency, sent, _received_size(res))
+            if res.status_code < 400:
+                return res
+            if not retry_policy.should_retry(attempt, res.status_code):
+                res.raise_for_status()
+            status = res.status_code
+            delay = retry_policy.delay(attempt, res.headers)
+        notify(observers, 'retry', call_endpoint, attempt, delay, status)
+        attempt += 1
+        time.sleep(delay)
+
+
+def _empty_result(task):
+    """Creates result for failed task that writers store without any rows but
+    with the same number of document ids as real result would take.
+    """
+    if task[0] == codes.ANALYZE:
+        texts, single_document = task[1], task[4]
+        if single_document:
+            return {'categories': [[]], 'single_document': True}
+        return {'categories': [[] for _ in texts]}
+    return {}
+
+
+def _deduplicate(tasks):
+    """Removes texts that were already sent for the same analyses from
+    analyze tasks. Single document tasks and other calls are kept as they are.
+
+    :return: tuple -- List of tasks that need to be sent, plan for
+     :func:`_fan_out` and number of removed texts
+    """
+    unique, plan, seen = [], [], {}
+    duplicates = 0
+    for task in tasks:
+        if task[0] != codes.ANALYZE or task[4] or not task[1]:
+            plan.append((len(unique), None))
+            unique.append(task)
+            continue
+        texts, analyses, external_entity_data = task[1:4]
+        group = seen.setdefault((tuple(sorted(analyses)),
+                                 _json_dumps(external_entity_data)), {})
+        index, new_texts, sources = len(unique), [], []
+        for text in texts:
+            if text not in group:
+                group[text] = (index, len(new_texts))
+                new_texts.append(text)
+            else:
+                duplicates += 1
+            sources.append(group[text])
+        if new_texts:
+            unique.append((codes.ANALYZE, new_texts, analyses,
+                           external_entity_data, False))
+        plan.append((None, sources))
+    return unique, plan, duplicates
+
+
+def _fan_out(results, plan):
+    """Builds result for every original task from results of deduplicated
+    tasks so that each duplicate text gets copy of its original's analysis.
+    Texts whose deduplicated task failed get None in place of analysis, so
+    they keep their document id but are written without any rows.
+    """
+    fanned = []
+    for index, sources in plan:
+        if sources is None:
+            fanned.append(results[index])
+            continue
+        parts = [results[i] for i, _ in sources]
+        keys = set.union(*[{k for k, v in part.items()
+                            if isinstance(v, list)} for part in parts])
+        fanned.append({key: [results[i][key][position]
+                             if key in results[i] else None
+                             for i, position in sources] for key in keys})
+    return fanned
+
+
+def _check_analyses(analyses):
+    analyses = set(analyses)
+    extra = analyses - {'concepts', 'categories', 'sentiment', 'absa'}
+    if len(extra) > 0:
+        raise ValueError('No support for {} analyses'.format(', '.join(extra)))
+    return list(analyses)
+
+
+def _empty_request_size(analyses, utf8=False, codec=None):
+    return len(get_codec(codec).dumps({'texts': [], 'analyses': analyses},
+                                      utf8))
+
+
+def _encoded_text(text, utf8=False, codec=None):
+    return get_codec(codec).dumps(text, utf8)
+
+
+def _text_size(text, utf8=False, codec=None):
+    return len(_encoded_text(text, utf8, codec))
+
+
+class _BodySize(object):
+    """Tracks size of request body while texts are being added to it."""
+    def __init__(self, analyses, utf8=False, codec=None):
+        self.codec = get_codec(codec)
+        self.empty_size = _empty_request_size(analyses, utf8, self.codec)
+        self.reset()
 
+    def reset(self):
+        self.size = self.empty_size
+        self.count = 0
 
-def optimal_requests(data, analyses, max_size=MAX_REQUEST_BYTES_SIZE):
+    def add(self, encoded_text):
+        if self.count:
+            self.size += len(self.codec.separator)
+        self.size += len(encoded_text)
+        self.count += 1
+        return self.size
+
+
+class _CompressedBodySize(_BodySize):
+    """Tracks upper bound of compressed request body size. Compressor is
+    flushed after every text so its output covers all texts added so far;
+    body compressed in one go is never bigger than that.
+    """
+    # closing of texts list and analyses, final deflate block and trailer
+    # never take more than this on top of uncompressed json suffix
+    TAIL_OVERHEAD = 32
+
+    def __init__(self, analyses, utf8=False, compression='gzip', codec=None):
+        codec = get_codec(codec)
+        body = codec.dumps({'texts': [], 'analyses': analyses}, utf8)
+        prefix, suffix = body.split(b'[]', 1)
+        self.prefix = prefix + b'['
+        self.tail = len(suffix) + 1 + self.TAIL_OVERHEAD
+        self.compression = compression
+        super(_CompressedBodySize, self).__init__(analyses, utf8, codec)
+
+    def reset(self):
+        self.compressor = _compressor(self.compression)
+        self.compressed = len(self.compressor.compress(self.prefix))
+        self.count = 0
+        self.size = self.compressed + self.tail
+
+    def add(self, encoded_text):
+        if self.count:
+            encoded_text = self.codec.separator + encoded_text
+        self.compressed += len(self.compressor.compress(encoded_text))
+        self.compressed += len(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.count += 1
+        self.size = self.compressed + self.tail
+        return self.size
+
+
+def optimal_requests(data, analyses, max_size=MAX_REQUEST_BYTES_SIZE,
+                     utf8=False, compression=None, codec=None):
     """Yields text lists from `data` that will fit into maximum request size.
     Will not reorder texts - they will be send to server in order they appear
     in `data`. You also need to provide list of `analyses` that you will be
     calling on returned texts so that final json size may be computed properly.
-    
+
+    Size of request body is computed in bytes. By default texts are measured
+    the way client sends them - with non-ASCII characters escaped. Set *utf8*
+    if you use client that sends UTF-8 encoded bodies, chinese text takes
+    half of the space then. If client compresses request bodies, set the same
+    *compression* here and texts will be packed against compressed size. The
+    compressed size is slightly overestimated so requests never exceed
+    *max_size*. Texts are encoded with the same json *codec* as client uses,
+    by default the fastest installed one.
+
     :param data: Iterable with chinese texts
     :param analyses: List of analyses to perform. Can only have 'concepts',
      'categories', 'sentiment' and 'absa' values.
-    :param max_size: Request body maximum size. Json with encoded text and 
+    :param max_size: Request body maximum size. Json with encoded text and
      analysis list has to fit into this size.
+    :param utf8: Measure texts as UTF-8 encoded instead of ASCII escaped
+    :type utf8: bool
+    :param compression: Measure compressed body size; 'gzip' or 'deflate'
+    :type compression: str
+    :param codec: Json codec or its name, see :func:`get_codec`
     :return: Generator yielding lists of chinese texts
     """
-    analyses = set(analyses)
-    extra = analyses - {'concepts', 'categories', 'sentiment', 'absa'}
-    if len(extra) > 0:
-        raise ValueError('No support for {} analyses'.format(', '.join(extra)))
-    analyses = list(analyses)
-
-    json_temp = json.dumps({'text': ['%%mark%%'], 'analyses': analyses})
-    start, stop = json_temp.split('"%%mark%%"')
-    empty_length = len(start) + len(stop)
+    analyses = _check_analyses(analyses)
+    codec = get_codec(codec)
+    if compression is None:
+        body = _BodySize(analyses, utf8, codec)
+    else:
+        body = _CompressedBodySize(analyses, utf8, compression, codec)
 
     result = []
-    length = empty_length
     for text in data:
-        new_string = json.dumps(text)
-        current_diff = max_size - length
-        if current_diff < len(new_string) + 1:
+        encoded = codec.dumps(text, utf8)
+        if body.add(encoded) > max_size and result:
             yield result
             result = []
-            length = empty_length
-
-        length += len(new_string) + 1
+            body.reset()
+            body.add(encoded)
         result.append(text)
 
     if result:
         yield result
 
 
+def packed_requests(data, analyses, max_size=MAX_REQUEST_BYTES_SIZE,
+                    utf8=False, codec=None):
+    """Packs texts from `data` into as few requests as possible using
+    first-fit-decreasing bin packing. Unlike
+    :func:`anacode.api.client.optimal_requests` this reorders texts, so it
+    also returns permutation that maps position of each text in requests
+    back to its index in `data`. Texts that alone exceed *max_size* are sent
+    in requests of their own.
+
+    :param data: Iterable with chinese texts
+    :param analyses: List of analyses to perform. Can only have 'concepts',
+     'categories', 'sentiment' and 'absa' values.
+    :param max_size: Request body maximum size in bytes
+    :param utf8: Measure texts as UTF-8 encoded instead of ASCII escaped
+    :type utf8: bool
+    :param codec: Json codec or its name, see :func:`get_codec`
+    :return: tuple -- List of text lists and permutation list; i-th text
+     across all requests in order is `data[permutation[i]]`
+    """
+    analyses = _check_analyses(analyses)
+    codec = get_codec(codec)
+    texts = list(data)
+    separator = len(codec.separator)
+    # every text is charged with separator so one more fits into each bin
+    capacity = max_size - _empty_request_size(analyses, utf8, codec) + \
+        separator
+    sizes = [_text_size(text, utf8, codec) + separator for text in texts]
+    order = sorted(range(len(texts)), key=lambda i: sizes[i], reverse=True)
+
+    bins, free = [], []
+    for index in order:
+        size = sizes[index]
+        for bin_index, space in enumerate(free):
+            if size <= space:
+                bins[bin_index].append(index)
+                free[bin_index] -= size
+                break
+        else:
+            bins.append([index])
+            free.append(capacity - size)
+
+    permutation = [index for indices in bins for index in indices]
+    requests_texts = [[texts[index] for index in indices] for indices in bins]
+    return requests_texts, permutation
+
+
+class SessionPool(object):
+    """Thread-safe pool of :class:`requests.Session` objects. Sessions keep
+    their TCP/TLS connections open between requests so threads sharing one
+    :class:`anacode.api.client.AnacodeClient` do not pay for a new handshake
+    on every call.
+
+    Each session serves one thread at a time. By default the pool is
+    unbounded and creates a session for every thread calling concurrently.
+    With *size* set at most *size* sessions exist and :meth:`acquire` blocks
+    while all of them are checked out, which keeps number of open
+    connections within *size*. :class:`anacode.api.client.Analyzer` grows
+    bounded pool with :meth:`grow` to its number of concurrent requests, so
+    the pool does not limit it.
+
+    """
+    def __init__(self, size=None, keep_alive=True, pool_connections=10,
+                 pool_maxsize=10):
+        """
+
+        :param size: Maximum number of sessions and so of concurrent
+         requests, None for no limit
+        :type size: int
+        :param keep_alive: Keep connections open after request is finished. If
+         False, server is asked to close connection after each response
+        :type keep_alive: bool
+        :param pool_connections: Number of hosts each session keeps connection
+         pools for
+        :type pool_connections: int
+        :param pool_maxsize: Maximum number of connections to single host each
+         session keeps open
+        :type pool_maxsize: int
+        """
+        self.size = size
+        self.keep_alive = keep_alive
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._idle = LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._in_use = 0
+        self._acquired = 0
+
+    def grow(self, size):
+        """Raises maximum number of sessions to *size* if pool is smaller.
+        Pool never shrinks and unbounded pool stays unbounded.
+
+        :param size: Number of sessions that can be used concurrently
+        :type size: int
+        """
+        with self._available:
+            if self.size is not None and size > self.size:
+                self.size = size
+                self._available.notify_all()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        with self._lock:
+            self._sessions.append(session)
+        return session
+
+    def acquire(self):
+        """Takes idle session out of the pool or creates new one if there is
+        no idle session available. Blocks while *size* sessions are in use
+        if the pool is bounded.
+
+        :return: :class:`requests.Session` -- Session for exclusive use until
+         it is released
+        """
+        with self._available:
+            while self.size is not None and self._in_use >= self.size:
+                self._available.wait()
+            self._in_use += 1
+            self._acquired += 1
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return self._new_session()
+
+    def release(self, session):
+        """Returns session to the pool and wakes up one thread waiting in
+        :meth:`acquire`.
+
+        :param session: Session obtained from :meth:`acquire`
+        :type session: requests.Session
+        """
+        self._idle.put_nowait(session)
+        with self._available:
+            self._in_use -= 1
+            self._available.notify()
+
+    @contextmanager
+    def session(self):
+        """Context manager that acquires session and releases it on exit."""
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def stats(self):
+        """Collects connection reuse statistics from all sessions that are
+        still alive.
+
+        :return: dict -- 'sessions' is number of live sessions, 'idle' number
+         of sessions waiting in pool, 'acquired' number of times session was
+         handed out, 'requests' number of HTTP requests sent, 'connections'
+         number of connections opened and 'reused' number of requests that
+         were sent over already open connection
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+            acquired = self._acquired
+        requests_count = connections = 0
+        for session in sessions:
+            adapters = {id(a): a for a in session.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+        if not self.keep_alive:
+            # dropped connections are reopened without being counted by
+            # urllib3 so every request has to be treated as new connection
+            connections = requests_count
+        return {
+            'sessions': len(sessions),
+            'idle': self._idle.qsize(),
+            'acquired': acquired,
+            'requests': requests_count,
+            'connections': connections,
+            'reused': max(requests_count - connections, 0),
+        }
+
+    def close(self):
+        """Closes all sessions and their connections."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except Empty:
+                break
+
+
 class AnacodeClient(object):
     """Makes posting data to server for analysis simpler by storing user's auth,
     the URL of the Anacode API server and paths for analysis calls.
@@ -81,7 +697,9 @@ class AnacodeClient(object):
     https://api.anacode.de/api-docs/calls.html.
 
     """
-    def __init__(self, auth, base_url=ANACODE_API_URL):
+    def __init__(self, auth, base_url=ANACODE_API_URL, session_pool=None,
+                 rate_limiter=None, retry_policy=None, utf8=False,
+                 compression=None, cache=None, codec=None, observers=None):
         """Default value for base_url is taken from environment variable
         ANACODE_API_URL if set; otherwise, 'https://api.anacode.de/' is used.
 
@@ -89,9 +707,92 @@ class AnacodeClient(object):
         :type auth: str
         :param base_url: Anacode API server URL
         :type base_url: str
+        :param session_pool: Pool of HTTP sessions used for requests. New
+         unbounded pool is created if not provided, so every thread calling
+         the client concurrently gets its own session. Pass pool with *size*
+         to limit number of concurrent requests; threads above the limit wait
+         for a free session
+        :type session_pool: :class:`anacode.api.client.SessionPool`
+        :param rate_limiter: Keeps requests within request and character
+         quotas. Can be shared by multiple clients
+        :type rate_limiter: :class:`anacode.api.limits.RateLimiter`
+        :param retry_policy: Decides which failed requests are retried and
+         when. Connection errors and 429 and 5xx responses are retried three
+         times with exponential backoff if not provided
+        :type retry_policy: :class:`anacode.api.retry.RetryPolicy`
+        :param utf8: Send request bodies as UTF-8 encoded json instead of
+         escaping non-ASCII characters which makes chinese texts half as big.
+         Use the same setting for :func:`optimal_requests`
+        :type utf8: bool
+        :param compression: Compress request bodies; 'gzip' or 'deflate'.
+         Server is also asked to compress responses. Use the same setting for
+         :func:`optimal_requests`
+        :type compression: str
+        :param cache: Persistent cache of analyze results. Repeated analyze
+         calls with the same arguments are answered from it without
+         contacting the server
+        :type cache: :class:`anacode.api.cache.ResponseCache`
+        :param codec: Json codec or its name used to encode requests and
+         decode responses. The fastest installed one is used by default, see
+         :func:`get_codec`. Use the same codec for :func:`optimal_requests`
+        :type codec: :class:`anacode.api.client.JsonCodec`
+        :param observers: Objects notified about requests, retries and
+         decoding of responses
+        :type observers: list of :class:`anacode.api.observers.Observer`
         """
+        if compression is not None and compression not in COMPRESSION_WBITS:
+            raise ValueError('Unsupported compression "{}"'.format(
+                compression))
         self.auth = auth
+        self.utf8 = utf8
+        self.codec = get_codec(codec)
+        self.compression = compression
+        self.cache = cache
+        self.transfer = TransferStats()
+        self.observers = list(observers or [])
+        self.rate_limiter = rate_limiter
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
         self.base_url = base_url
+        if session_pool is None:
+            session_pool = SessionPool()
+        self.session_pool = session_pool
+
+    def _post(self, endpoint, **data):
+        with self.session_pool.session() as session:
+            return _analysis(endpoint, self.auth, session=session,
+                             rate_limiter=self.rate_limiter,
+                             retry_policy=self.retry_policy, utf8=self.utf8,
+                             compression=self.compression,
+                             transfer_stats=self.transfer, codec=self.codec,
+                             observers=self.observers, **data)
+
+    def _decode(self, content):
+        start = time.time()
+        result = self.codec.loads(content)
+        notify(self.observers, 'decode', time.time() - start, len(content))
+        return result
+
+    def connection_stats(self):
+        """Returns connection reuse statistics of client's session pool. See
+        :meth:`anacode.api.client.SessionPool.stats` for details.
+
+        :return: dict --
+        """
+        return self.session_pool.stats()
+
+    def transfer_stats(self):
+        """Returns numbers of bytes sent to and received from the server. See
+        :meth:`anacode.api.client.TransferStats.as_dict` for details.
+
+        :return: dict --
+        """
+        return self.transfer.as_dict()
+
+    def close(self):
+        """Closes all open HTTP connections."""
+        self.session_pool.close()
 
     def scrape(self, link):
         """Use Anacode API's scrape call to scrape page from Web URL and return result.
@@ -101,8 +802,8 @@ class AnacodeClient(object):
         :return: dict --
         """
         url = urljoin(self.base_url, '/scrape/')
-        res = _analysis(url, self.auth, url=link)
-        return res.json()
+        res = self._post(url, url=link)
+        return self._decode(res.content)
 
     def analyze(self, texts, analyses, external_entity_data=None,
                 single_document=False):
@@ -120,14 +821,63 @@ class AnacodeClient(object):
         :type single_document: bool
         :return: dict --
         """
+        if self.cache is not None:
+            key = cache_key(texts, analyses, external_entity_data,
+                            single_document)
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        res = self._post_analysis(texts, analyses, external_entity_data,
+                                  single_document)
+        result = self._decode(res.content)
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return result
+
+    def _post_analysis(self, texts, analyses, external_entity_data,
+                       single_document):
         url = urljoin(self.base_url, '/analyze/')
         data = {'texts': texts, 'analyses': analyses}
         if external_entity_data is not None:
             data['absa'] = {'external_entity_data': external_entity_data}
         if single_document:
             data['single_document'] = True
-        res = _analysis(url, self.auth, **data)
-        return res.json()
+        return self._post(url, **data)
+
+    def analyze_raw(self, texts, analyses, external_entity_data=None,
+                    single_document=False):
+        """Same as :meth:`analyze` but returns response body without decoding
+        it, so that decoding can happen elsewhere.
+
+        :return: bytes -- Json encoded analysis result
+        """
+        if self.cache is not None:
+            key = cache_key(texts, analyses, external_entity_data,
+                            single_document)
+            value = self.cache.get_raw(key)
+            if value is not None:
+                return value.encode('utf-8')
+        res = self._post_analysis(texts, analyses, external_entity_data,
+                                  single_document)
+        if self.cache is not None:
+            self.cache.set_raw(key, res.content.decode('utf-8'))
+        return res.content
+
+    def call_raw(self, task):
+        """Same as :meth:`call` but returns response body without decoding
+        it.
+
+        :param task: Task definition tuple - (analysis code, analysis args)
+        :type task: tuple
+        :return: bytes -- Json encoded result
+        """
+        call, args = task[0], task[1:]
+
+        if call == codes.SCRAPE:
+            url = urljoin(self.base_url, '/scrape/')
+            return self._post(url, url=args[0]).content
+        if call == codes.ANALYZE:
+            return self.analyze_raw(*args)
 
     def call(self, task):
         """Given tuple of Anacode API analysis code and arguments for this
@@ -146,12 +896,120 @@ class AnacodeClient(object):
             return self.analyze(*args)
 
 
+class _ReorderedBulk(object):
+    """Results of one bulk submitted in reorder mode. Tasks may finish in any
+    order; :meth:`ready` tells how many of original tasks from the beginning
+    of the bulk have everything they need to be written.
+    """
+    def __init__(self, first, call_types, tasks, plan):
+        self.first = first
+        self.call_types = call_types
+        self.tasks = tasks
+        self.plan = plan
+        self.results = [None] * len(tasks)
+        self.done = [False] * len(tasks)
+        self.committed = 0
+        self.started = time.time()
+        # tasks whose results are not needed after original task is taken
+        self.releases = [[] for _ in call_types]
+        last_use = {}
+        for index in range(len(call_types)):
+            for unique in self._needs(index):
+                last_use[unique] = index
+        for unique, index in last_use.items():
+            self.releases[index].append(unique)
+
+    def _needs(self, index):
+        if self.plan is None:
+            return [index]
+        unique, sources = self.plan[index]
+        if sources is None:
+            return [unique]
+        return [i for i, _ in sources]
+
+    def ready(self):
+        end = self.committed
+        while end < len(self.call_types) and \
+                all(self.done[i] for i in self._needs(end)):
+            end += 1
+        return end
+
+    def take(self, end):
+        """Returns results of original tasks up to *end* that were not
+        committed yet and drops results no other task needs.
+
+        :return: tuple -- List of (call type, result) pairs and number of
+         tasks whose results were dropped
+        """
+        if self.plan is None:
+            results = self.results[self.committed:end]
+        else:
+            results = _fan_out(self.results, self.plan[self.committed:end])
+        types = self.call_types[self.committed:end]
+        released = 0
+        for index in range(self.committed, end):
+            for unique in self.releases[index]:
+                self.results[unique] = None
+                released += 1
+        self.committed = end
+        return list(zip(types, results)), released
+
+    @property
+    def finished(self):
+        return self.committed == len(self.call_types)
+
+
 class Analyzer(object):
     """This class makes querying with multiple threads and storing in other
     formats then list of json-s simple.
 
+    Worker threads are started when analyzer's context is entered and are
+    shut down when it is left, so the same threads serve all bulks.
+
+    In pipeline mode requests keep flowing while results of previous bulks
+    are written. Each bulk is handed over to separate writer thread through
+    bounded queue so analyzer only waits when *queue_size* bulks are already
+    waiting to be written.
+
+    If concurrency *limiter* is given, analyzer starts as many threads as
+    limiter's maximum limit allows and lets limiter decide how many of them
+    may talk to the server at any moment.
+
+    With *ignore_errors* set, tasks that fail even after client's retries do
+    not stop the analysis. They are collected in :attr:`failed` list and
+    writer skips document ids their results would take, so ids of other
+    documents stay the same.
+
+    With *deduplicate* set, every text is sent only once per bulk for the same
+    analyses. Analysis of the first occurrence is copied to all its duplicates
+    before writing, so writer still assigns every text its own document id.
+    Single document analyses are never deduplicated.
+
+    In *reorder* mode tasks of all bulks are kept in flight together and
+    finish in any order. Results are committed to writer as soon as all tasks
+    submitted before them are done, so one slow request does not hold back
+    the rest of its bulk and document ids are the same as if tasks were
+    processed one by one. At most *window* tasks are running or waiting with
+    their results to be written, so memory stays bounded when one task is
+    slow.
+
+    With *processes* set, response bodies are decoded and flattened into rows
+    in pool of worker processes instead of in threads that share one
+    interpreter lock. Writer has to implement write_flattened method then.
+    Worker processes are started fresh and import the main module again, so
+    scripts using *processes* have to create analyzer under
+    ``if __name__ == '__main__':`` guard.
+
+    Progress of analyzer with *journal* survives crashes. When the same tasks
+    are fed to new analyzer with the same journal, tasks whose results were
+    already written are skipped and writer continues from its last
+    checkpoint.
+
     """
-    def __init__(self, client, writer, threads=1, bulk_size=100):
+    def __init__(self, client, writer, threads=1, bulk_size=100,
+                 pipeline=False, queue_size=2, limiter=None,
+                 ignore_errors=False, deduplicate=False, journal=None,
+                 reorder=False, window=None, processes=None, observers=None):
         """
 
         :param client: Will be used to post analysis to anacode api
@@ -164,22 +1022,401 @@ class Analyzer(object):
         :param bulk_size: How often should writer's write_bulk method be
          invoked, defaults to 100
         :type bulk_size: int
+        :param pipeline: Overlap posting requests with writing of results,
+         defaults to False
+        :type pipeline: bool
+        :param queue_size: Maximum number of bulks waiting to be written in
+         pipeline mode, defaults to 2
+        :type queue_size: int
+        :param limiter: Adapts number of concurrent requests to measured
+         latency and server overload. Replaces *threads* if given. While
+         analyzer's context is open it is added to observers of
+         :class:`AnacodeClient` so that every attempt, including retried
+         ones, adapts the limit
+        :type limiter: :class:`anacode.api.limits.AIMDLimiter`
+        :param ignore_errors: Continue analysis when some tasks fail, defaults
+         to False
+        :type ignore_errors: bool
+        :param deduplicate: Send duplicate texts within bulk only once,
+         defaults to False
+        :type deduplicate: bool
+        :param journal: Records progress so that interrupted analysis can be
+         resumed. Writer has to support resume, see
+         :attr:`anacode.api.writers.Writer.supports_resume`
+        :type journal: :class:`anacode.api.journal.Journal`
+        :param reorder: Submit tasks without waiting for whole bulks and
+         write their results in submission order, defaults to False. Can not
+         be combined with pipeline mode
+        :type reorder: bool
+        :param window: Maximum number of tasks in reorder mode that are
+         running or have results waiting to be written, defaults to four
+         times number of threads
+        :type window: int
+        :param processes: Number of worker processes decoding and flattening
+         results, defaults to None which does it in analyzer's threads. Can
+         not be combined with deduplication. Workers import the main module,
+         so script has to start analyzer under
+         ``if __name__ == '__main__':`` guard
+        :type processes: int
+        :param observers: Objects notified when bulk is analyzed and when
+         results are written
+        :type observers: list of :class:`anacode.api.observers.Observer`
         """
+        if reorder and pipeline:
+            raise ValueError('Reorder mode can not be used with pipeline.')
+        if processes and deduplicate:
+            raise ValueError('Deduplication needs decoded results and can not '
+                             'be used with worker processes.')
+        if journal is not None and not getattr(writer, 'supports_resume',
+                                               False):
+            raise ValueError('{} can not continue its output after restart '
+                             'and can not be used with journal.'
+                             .format(type(writer).__name__))
         self.client = client
+        self.observers = list(observers or [])
+        self.ignore_errors = ignore_errors
+        self.deduplicate = deduplicate
+        self.duplicates = 0
+        self.journal = journal
+        self._postponed = None
+        self._written_until = 0
+        self._journal_stopped = False
+        self._position = 0
+        self._skip = 0
+        self._analyzed_from = 0
+        self.failed = []
+        self.limiter = limiter
+        # limiter observing client adapts to each HTTP attempt on its own
+        self._limiter_observes = False
+        self._limiter_attached = False
+        if limiter is not None:
+            threads = limiter.max_limit
         self.threads = threads
+        self.processes = processes
+        self._process_pool = None
+        self.reorder = reorder
+        self.window = window or 4 * threads
+        self._bulks = deque()
+        self._unwritten = 0
+        self._reorder_error = None
+        self._reorder_lock = threading.Condition()
         self.task_queue = []
         self.analyzed = []
         self.analyzed_types = []
         self.bulk_size = bulk_size
         self.writer = writer
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self._pool = None
+        self._write_queue = None
+        self._write_thread = None
+        self._write_error = None
+        self._stats_lock = threading.Lock()
+        self._stats_since = None
+        self._submitted = self._started = self._completed = 0
+        self._busy = 0
+        self._busy_time = 0.0
 
     def __enter__(self):
+        if self.journal is not None:
+            self._skip = self._written_until = self.journal.written_tasks
+            if self.journal.writer_state is not None:
+                self.writer.restore(self.journal.writer_state)
+        # worker processes are started before writer or pools start threads
+        self._start_process_pool()
         self.writer.init()
+        self._start_pool()
+        if self.pipeline:
+            self._start_pipeline()
+        self._attach_limiter()
         return self
 
     def __exit__(self, type, value, traceback):
-        self.execute_tasks_and_store_output()
-        self.writer.close()
+        try:
+            self.execute_tasks_and_store_output()
+            if self.reorder:
+                self.commit_ready(wait_all=True)
+            if self._write_thread is not None:
+                self._stop_pipeline()
+            self._record_postponed()
+        finally:
+            try:
+                if self._write_thread is not None:
+                    self._stop_pipeline()
+            finally:
+                self._detach_limiter()
+                self._stop_pool()
+                self.writer.close()
+                if self.journal is not None:
+                    self.journal.close()
+
+    def _attach_limiter(self):
+        """Adds limiter to observers of client, which belong to the caller,
+        for the time analyzer's context is open.
+        """
+        if self.limiter is None or not isinstance(self.client,
+                                                  AnacodeClient):
+            return
+        if self.limiter not in self.client.observers:
+            self.client.observers.append(self.limiter)
+            self._limiter_attached = True
+        self._limiter_observes = True
+
+    def _detach_limiter(self):
+        if self._limiter_attached:
+            self.client.observers.remove(self.limiter)
+            self._limiter_attached = False
+        self._limiter_observes = False
+
+    def _start_process_pool(self):
+        """Starts worker processes. They are never forked from this process
+        as it may already run other threads whose locks would stay held in
+        the children.
+        """
+        if not self.processes:
+            return
+        if getattr(multiprocessing.current_process(), '_inheriting', False):
+            # worker process is importing main module that is not guarded
+            raise RuntimeError(
+                'Analyzer with worker processes was started while its worker '
+                'process imported the main module. Create the analyzer under '
+                '"if __name__ == \'__main__\':" guard in the main module.')
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+        self._process_pool = context.Pool(self.processes)
+
+    def _grow_session_pool(self, size):
+        """Makes sure client's session pool does not limit number of
+        concurrent requests below *size*.
+        """
+        session_pool = getattr(self.client, 'session_pool', None)
+        if isinstance(session_pool, SessionPool):
+            session_pool.grow(size)
+
+    def _start_pool(self):
+        self._stats_since = time.time()
+        self._grow_session_pool(self.threads)
+        if self.threads > 1 or self.pipeline or self.reorder:
+            self._pool = Pool(self.threads)
+
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._process_pool is not None:
+            self._process_pool.close()
+            self._process_pool.join()
+            self._process_pool = None
+
+    def _write(self, results):
+        """Stores results with writer. Decoding and flattening is done in
+        worker processes if analyzer has them.
+        """
+        results = list(results)
+        timings = getattr(self.writer, 'timings', None)
+        before = dict(timings) if timings else {}
+        start = time.time()
+        try:
+            if self._process_pool is None:
+                self.writer.write_bulk(results)
+                flatten = None
+            else:
+                size = max(1, -(-len(results) // self.processes))
+                chunks = [results[i:i + size]
+                          for i in range(0, len(results), size)]
+                flatten_bulk = partial(writers.flatten_bulk,
+                                       loads=self.client.codec.loads)
+                flattened = self._process_pool.map(flatten_bulk, chunks)
+                flatten = time.time() - start
+                for new_data, ids in flattened:
+                    self.writer.write_flattened(new_data, ids)
+        except Exception:
+            # writer may hold part of the bulk, its state must not be
+            # journaled anymore
+            self._stop_journal()
+            raise
+        seconds = time.time() - start
+        if timings:
+            if flatten is None:
+                flatten = timings['flatten'] - before['flatten']
+            write = timings['write'] - before['write']
+        else:
+            flatten, write = flatten or 0.0, seconds - (flatten or 0.0)
+        if results:
+            notify(self.observers, 'writer_flush', len(results), seconds,
+                   flatten, write)
+
+    def _start_pipeline(self):
+        self._write_queue = Queue(maxsize=self.queue_size)
+        self._write_error = None
+        self._write_thread = threading.Thread(target=self._write_results)
+        self._write_thread.daemon = True
+        self._write_thread.start()
+
+    def _stop_pipeline(self):
+        self._write_queue.put(None)
+        self._write_thread.join()
+        self._write_queue = self._write_thread = None
+        self._raise_write_error()
+
+    def _write_results(self):
+        while True:
+            bulk = self._write_queue.get()
+            if bulk is None:
+                break
+            if self._write_error is not None:
+                # keep draining queue so that producer never blocks forever,
+                # nothing is written after failed bulk to avoid a gap
+                continue
+            call_types, async_result, plan, first, started = bulk
+            try:
+                results = async_result.get()
+                notify(self.observers, 'bulk_flush', len(call_types),
+                       time.time() - started)
+                if plan is not None:
+                    results = _fan_out(results, plan)
+                if self.journal is not None:
+                    self.journal.acknowledged(first, len(call_types))
+                self._write(zip(call_types, results))
+                if self.journal is not None:
+                    self._record_written(first, len(call_types))
+            except Exception as e:
+                self._stop_journal()
+                self._write_error = e
+
+    def _stop_journal(self):
+        """Stops recording written tasks so that resume starts from the
+        last bulk written without a gap.
+        """
+        self._journal_stopped = True
+        self._postponed = None
+
+    def _record_written(self, first, count):
+        """Records written tasks in journal together with writer's
+        checkpoint. If writer postpones the checkpoint, tasks are recorded
+        with the next one. Bulk that does not directly follow the last
+        written one stops the journal as tasks before it were lost.
+        """
+        if self._journal_stopped:
+            return
+        if first != self._written_until:
+            self._stop_journal()
+            return
+        self._written_until = first + count
+        state = self.writer.checkpoint()
+        if state is None:
+            self._postponed = (first, count)
+        else:
+            self.journal.written(first, count, state)
+            self._postponed = None
+
+    def _record_postponed(self):
+        """Records tasks whose checkpoint was postponed when analysis
+        finishes.
+        """
+        if self.journal is not None and self._postponed is not None:
+            first, count = self._postponed
+            self.journal.written(first, count,
+                                 self.writer.checkpoint(force=True))
+            self._postponed = None
+
+    def _raise_write_error(self):
+        # error stays set, bulks after failed one are never written
+        if self._write_error is not None:
+            raise self._write_error
+
+    def _client_call(self, task):
+        if self._process_pool is not None:
+            return self.client.call_raw(task)
+        return self.client.call(task)
+
+    def _limited_call(self, task, call=None):
+        call = call or self._client_call
+        if self.limiter is None:
+            return call(task)
+        adapt = not self._limiter_observes
+        token = self.limiter.acquire()
+        try:
+            result = call(task)
+        except Exception as e:
+            self.limiter.release(token, overloaded=is_overload(e),
+                                 adapt=adapt)
+            raise
+        self.limiter.release(token, adapt=adapt)
+        return result
+
+    def _timed_call(self, task, call=None):
+        with self._stats_lock:
+            self._started += 1
+            self._busy += 1
+        start = time.time()
+        try:
+            return self._limited_call(task, call)
+        except Exception as e:
+            if not self.ignore_errors:
+                raise
+            log = logging.getLogger(__name__)
+            log.warning('Task %s failed: %s', task[0], e)
+            self.failed.append((task, e))
+            return _empty_result(task)
+        finally:
+            with self._stats_lock:
+                self._busy -= 1
+                self._completed += 1
+                self._busy_time += time.time() - start
+
+    def _count_submitted(self, count):
+        with self._stats_lock:
+            if self._stats_since is None:
+                self._stats_since = time.time()
+            self._submitted += count
+
+    def _unique_tasks(self):
+        """Returns tasks from queue that need to be sent and fan-out plan, or
+        None if analyzer does not deduplicate.
+        """
+        if not self.deduplicate:
+            return self.task_queue, None
+        tasks, plan, duplicates = _deduplicate(self.task_queue)
+        self.duplicates += duplicates
+        return tasks, plan
+
+    def stats(self):
+        """Reports queue depths and worker utilization.
+
+        :return: dict -- 'pending' is number of tasks waiting for their bulk
+         to be started, 'queued' number of tasks handed to workers that were
+         not picked up yet, 'in_flight' number of tasks being processed right
+         now, 'completed' number of finished tasks, 'write_queue' number of
+         bulks waiting to be written in pipeline mode, 'utilization'
+         fraction of time workers spent processing tasks since analyzer was
+         started and 'concurrency_limit' current limit of adaptive limiter
+         or number of threads if analyzer has no limiter, 'duplicates'
+         number of texts that were not sent because of deduplication and
+         'skipped' number of tasks skipped because journal shows they were
+         written before
+        """
+        with self._stats_lock:
+            submitted, started = self._submitted, self._started
+            completed, busy = self._completed, self._busy
+            busy_time, since = self._busy_time, self._stats_since
+        workers = self.threads if self._pool is not None else 1
+        elapsed = time.time() - since if since is not None else 0
+        write_queue = self._write_queue
+        return {
+            'pending': len(self.task_queue),
+            'queued': submitted - started,
+            'in_flight': busy,
+            'completed': completed,
+            'write_queue': write_queue.qsize() if write_queue else 0,
+            'utilization': busy_time / (workers * elapsed) if elapsed else 0.,
+            'concurrency_limit': self.limiter.limit if self.limiter else
+            self.threads,
+            'duplicates': self.duplicates,
+            'skipped': min(self._position, self._skip),
+        }
 
     def should_start_analysis(self):
         """Checks how many tasks are in queue and returns boolean indicating
@@ -190,34 +1427,197 @@ class Analyzer(object):
         return len(self.task_queue) >= self.bulk_size
 
     def analyze_bulk(self):
-        """Performs bulk analysis. Will use :class:`multiprocessing.dummy.Pool`
-        to post data to anacode api if number of threads is more than one.
+        """Performs bulk analysis. Will use analyzer's
+        :class:`multiprocessing.dummy.Pool` to post data to anacode api if
+        number of threads is more than one. If analyzer is used outside of its
+        context temporary pool is created just for this bulk.
 
         Analysis results are not returned, but cached internally.
         """
-        if self.threads > 1:
+        first = self._position - len(self.task_queue)
+        if not self.analyzed:
+            self._analyzed_from = first
+        if self.journal is not None:
+            self.journal.submitted(first, len(self.task_queue))
+        tasks, plan = self._unique_tasks()
+        self._count_submitted(len(tasks))
+        started = time.time()
+        if self._pool is not None:
+            results = self._pool.map(self._timed_call, tasks)
+        elif self.threads > 1:
             pool = Pool(self.threads)
-            results = pool.map(self.client.call, self.task_queue)
+            try:
+                results = pool.map(self._timed_call, tasks)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            results = list(map(self.client.call, self.task_queue))
+            results = list(map(self._timed_call, tasks))
+        if self.task_queue:
+            notify(self.observers, 'bulk_flush', len(self.task_queue),
+                   time.time() - started)
+        if plan is not None:
+            results = _fan_out(results, plan)
+        if self.journal is not None:
+            self.journal.acknowledged(first, len(self.task_queue))
         self.analyzed.extend(results)
         self.analyzed_types.extend([t[0] for t in self.task_queue])
         self.task_queue = []
 
     def flush_analysis_data(self):
         """Writes all cached analysis results using writer."""
-        self.writer.write_bulk(zip(self.analyzed_types, self.analyzed))
+        self._write(zip(self.analyzed_types, self.analyzed))
+        if self.journal is not None and self.analyzed:
+            self._record_written(self._analyzed_from, len(self.analyzed))
         self.analyzed_types = []
         self.analyzed = []
 
+    def submit_bulk(self):
+        """Starts bulk analysis in pipeline mode and queues the bulk for
+        writing without waiting for results. Blocks while writer thread has
+        *queue_size* bulks waiting.
+        """
+        self._raise_write_error()
+        if not self.task_queue:
+            return
+        first = self._position - len(self.task_queue)
+        if self.journal is not None:
+            self.journal.submitted(first, len(self.task_queue))
+        tasks, plan = self._unique_tasks()
+        self._count_submitted(len(tasks))
+        call_types = [t[0] for t in self.task_queue]
+        started = time.time()
+        async_result = self._pool.map_async(self._timed_call, tasks,
+                                            chunksize=1)
+        self.task_queue = []
+        self._write_queue.put((call_types, async_result, plan, first,
+                               started))
+
+    def _complete(self, bulk, index):
+        try:
+            result, error = self._timed_call(bulk.tasks[index]), None
+        except Exception as e:
+            result, error = None, e
+        with self._reorder_lock:
+            if error is None:
+                bulk.results[index] = result
+                bulk.done[index] = True
+            elif self._reorder_error is None:
+                self._reorder_error = error
+            self._reorder_lock.notify_all()
+
+    def _take_ready(self):
+        """Collects results that can be committed, ranges of input they
+        cover and bulks that were finished. Has to be called with reorder
+        lock held.
+        """
+        ready, ranges, finished = [], [], []
+        while self._bulks:
+            bulk = self._bulks[0]
+            start, end = bulk.committed, bulk.ready()
+            if end > start:
+                taken, released = bulk.take(end)
+                ready.extend(taken)
+                ranges.append((bulk.first + start, end - start))
+                self._unwritten -= released
+            if not bulk.finished:
+                break
+            finished.append(self._bulks.popleft())
+        return ready, ranges, finished
+
+    def commit_ready(self, wait_all=False):
+        """Writes results of reorder mode tasks that finished together with
+        all tasks submitted before them.
+
+        :param wait_all: Wait until all submitted tasks are finished and
+         written
+        :type wait_all: bool
+        """
+        while True:
+            with self._reorder_lock:
+                ready, ranges, finished = self._take_ready()
+                error = self._reorder_error
+                if not ready and error is None and wait_all and self._bulks:
+                    self._reorder_lock.wait(0.1)
+                    continue
+            now = time.time()
+            for bulk in finished:
+                notify(self.observers, 'bulk_flush', len(bulk.call_types),
+                       now - bulk.started)
+            if ready:
+                self._write(ready)
+                if self.journal is not None:
+                    first = ranges[0][0]
+                    count = sum(c for _, c in ranges)
+                    self.journal.acknowledged(first, count)
+                    self._record_written(first, count)
+            if error is not None:
+                # results after failed task can never be committed
+                raise error
+            if not wait_all or not self._bulks:
+                return
+
+    def submit_reordered(self):
+        """Starts tasks from queue in reorder mode and writes results that
+        are ready. Blocks while *window* tasks are running or waiting for
+        tasks submitted before them.
+        """
+        if not self.task_queue:
+            return
+        first = self._position - len(self.task_queue)
+        if self.journal is not None:
+            self.journal.submitted(first, len(self.task_queue))
+        tasks, plan = self._unique_tasks()
+        bulk = _ReorderedBulk(first, [t[0] for t in self.task_queue], tasks,
+                              plan)
+        self.task_queue = []
+        self._count_submitted(len(tasks))
+        with self._reorder_lock:
+            self._bulks.append(bulk)
+        for index in range(len(tasks)):
+            self._wait_for_window()
+            with self._reorder_lock:
+                self._unwritten += 1
+            self._pool.apply_async(self._complete, (bulk, index))
+            self.commit_ready()
+        self.commit_ready()
+
+    def _wait_for_window(self):
+        """Writes ready results until fewer than *window* tasks are running
+        or waiting to be written.
+        """
+        while True:
+            self.commit_ready()
+            with self._reorder_lock:
+                if self._unwritten < self.window:
+                    return
+                head = self._bulks[0]
+                if head.ready() == head.committed and \
+                        self._reorder_error is None:
+                    self._reorder_lock.wait(0.1)
+
     def execute_tasks_and_store_output(self):
-        self.analyze_bulk()
-        self.flush_analysis_data()
+        if self.reorder and self._pool is not None:
+            self.submit_reordered()
+        elif self._write_queue is not None:
+            self.submit_bulk()
+        else:
+            self.analyze_bulk()
+            self.flush_analysis_data()
+
+    def _already_written(self):
+        """Counts new task and tells whether it was written in previous run
+        according to journal.
+        """
+        self._position += 1
+        return self._position <= self._skip
 
     def scrape(self, link):
         """Dummy clone for
         :meth:`anacode.api.client.AnacodeClient.scrape`
         """
+        if self._already_written():
+            return
         self.task_queue.append((codes.SCRAPE, link))
         if self.should_start_analysis():
             self.execute_tasks_and_store_output()
@@ -226,13 +1626,152 @@ class Analyzer(object):
                 single_document=False):
         """Dummy clone for
         :meth:`anacode.api.client.AnacodeClient.analyze`"""
+        if self._already_written():
+            return
         self.task_queue.append((codes.ANALYZE, texts, analyses,
                                 external_entity_data, single_document))
         if self.should_start_analysis():
             self.execute_tasks_and_store_output()
 
+    def analyze_stream(self, source, analyses, external_entity_data=None,
+                       max_size=MAX_REQUEST_BYTES_SIZE, **read_options):
+        """Reads texts lazily from *source*, packs them into requests with
+        :func:`optimal_requests` and analyzes them. Texts are read only as
+        fast as analyzer processes them, so memory use does not depend on
+        size of the input.
+
+        :param source: Iterable of texts, path to text, json lines or csv
+         file or '-' for standard input; see
+         :func:`anacode.api.sources.iter_texts`
+        :param analyses: List of analyses to perform
+        :param external_entity_data: Provide additional entities to relate to
+         sentiment evaluation.
+        :param max_size: Maximum request body size in bytes, including
+         *external_entity_data*
+        :type max_size: int
+        :param read_options: *format*, *field* and *encoding* options for
+         :func:`anacode.api.sources.iter_texts`
+        :return: int -- Number of texts read from source
+        """
+        count = 0
+        texts = iter_texts(source, **read_options)
+        utf8 = getattr(self.client, 'utf8', False)
+        codec = getattr(self.client, 'codec', None)
+        if external_entity_data is not None:
+            # client adds external entity data to every request body
+            max_size -= len(get_codec(codec).dumps(
+                {'absa': {'external_entity_data': external_entity_data}},
+                utf8))
+        requests_texts = optimal_requests(
+            texts, analyses, max_size, utf8=utf8,
+            compression=getattr(self.client, 'compression', None),
+            codec=codec)
+        for request_texts in requests_texts:
+            count += len(request_texts)
+            self.analyze(request_texts, analyses, external_entity_data)
+        return count
+
+    def _scrape(self, link):
+        """Scrapes *link* under the same concurrency limit and statistics as
+        analysis tasks. Decoded page is needed even if analyzer has worker
+        processes. Failed page is empty if errors are ignored.
+        """
+        self._count_submitted(1)
+        return self._timed_call((codes.SCRAPE, link),
+                                lambda task: self.client.scrape(task[1]))
+
+    def _scrape_pages(self, links, threads, window):
+        """Scrapes *links* in separate pool of *threads* and yields pairs of
+        link and scraped page in the same order. At most *window* links are
+        scraped ahead of the consumer.
+        """
+        pool = Pool(threads)
+        pending = deque()
+        try:
+            for link in links:
+                pending.append((link, pool.apply_async(self._scrape,
+                                                       (link,))))
+                if len(pending) >= window:
+                    link, async_result = pending.popleft()
+                    yield link, async_result.get()
+            while pending:
+                link, async_result = pending.popleft()
+                yield link, async_result.get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def scrape_and_analyze(self, links, analyses, external_entity_data=None,
+                           max_size=MAX_REQUEST_BYTES_SIZE, field='text',
+                           scrape_threads=None, window=None, callback=None):
+        """Scrapes *links* concurrently and analyzes text of scraped pages.
+        Texts are packed into requests with :func:`optimal_requests` as soon
+        as their pages arrive, so scraping of next pages overlaps with
+        analysis of previous ones. Use pipeline or reorder mode to overlap
+        writing of results as well.
+
+        Pages are analyzed in order of *links*, one document per page. Pages
+        without text are skipped; with *ignore_errors* set, links that fail
+        to scrape are skipped and added to :attr:`failed` as well. Use
+        *callback* to keep track of which page got which document id.
+
+        :param links: Iterable of URLs to scrape
+        :param analyses: List of analyses to perform
+        :param external_entity_data: Provide additional entities to relate to
+         sentiment evaluation.
+        :param max_size: Maximum request body size in bytes, including
+         *external_entity_data*
+        :type max_size: int
+        :param field: Key of scraped page with text to analyze
+        :type field: str
+        :param scrape_threads: Number of concurrent scrape requests, defaults
+         to number of analyzer's threads
+        :type scrape_threads: int
+        :param window: Maximum number of pages scraped ahead of analysis,
+         defaults to four times *scrape_threads*
+        :type window: int
+        :param callback: Called with link and scraped page for every page
+         that is analyzed, in order of document ids
+        :return: int -- Number of analyzed pages
+        """
+        scrape_threads = scrape_threads or self.threads
+        window = window or 4 * scrape_threads
+        self._grow_session_pool(self.threads + scrape_threads)
+
+        def texts():
+            for link, page in self._scrape_pages(links, scrape_threads,
+                                                 window):
+                text = page.get(field) if page else None
+                if not text:
+                    continue
+                if callback is not None:
+                    callback(link, page)
+                yield text
+
+        return self.analyze_stream(texts(), analyses, external_entity_data,
+                                   max_size)
+
+
+def _make_writer(writer):
+    if hasattr(writer, 'init') and hasattr(writer, 'close') and \
+            hasattr(writer, 'write_bulk'):
+        return writer
+    elif isinstance(writer, str) and os.path.isdir(writer):
+        return writers.CSVWriter(writer)
+    elif isinstance(writer, dict):
+        return writers.DataFrameWriter(writer)
+    else:
+        raise ValueError('Writer type not understood. Please use path to file, '
+                         'dictionary or object implementing writers.Writer '
+                         'interface.')
+
 
-def analyzer(auth, writer, threads=1, bulk_size=100, base_url=ANACODE_API_URL):
+def analyzer(auth, writer, threads=1, bulk_size=100, base_url=ANACODE_API_URL,
+             keep_alive=True, pipeline=False, limiter=None,
+             rate_limiter=None, retry_policy=None, ignore_errors=False,
+             utf8=False, compression=None, cache=None, deduplicate=False,
+             journal=None, reorder=False, processes=None, codec=None,
+             observers=None):
     """Convenient function for initializing bulk analyzer and potentially
     temporary writer instance as well.
 
@@ -250,18 +1789,58 @@ def analyzer(auth, writer, threads=1, bulk_size=100, base_url=ANACODE_API_URL):
     :type bulk_size: int
     :param base_url: Anacode API server URL
     :type base_url: str
+    :param keep_alive: Reuse HTTP connections between requests
+    :type keep_alive: bool
+    :param pipeline: Write results in separate thread while next bulks are
+     being analyzed
+    :type pipeline: bool
+    :param limiter: Adaptive concurrency limiter; *threads* is ignored if
+     limiter is given
+    :type limiter: :class:`anacode.api.limits.AIMDLimiter`
+    :param rate_limiter: Keeps requests within request and character quotas
+    :type rate_limiter: :class:`anacode.api.limits.RateLimiter`
+    :param retry_policy: Decides which failed requests are retried and when
+    :type retry_policy: :class:`anacode.api.retry.RetryPolicy`
+    :param ignore_errors: Continue analysis when some requests fail
+    :type ignore_errors: bool
+    :param utf8: Send request bodies as UTF-8 encoded json
+    :type utf8: bool
+    :param compression: Compress request bodies; 'gzip' or 'deflate'
+    :type compression: str
+    :param cache: Persistent cache of analyze results
+    :type cache: :class:`anacode.api.cache.ResponseCache`
+    :param deduplicate: Send duplicate texts within bulk only once
+    :type deduplicate: bool
+    :param journal: Path to journal file that makes analysis resumable
+    :type journal: str
+    :type journal: :class:`anacode.api.journal.Journal`
+    :param reorder: Keep tasks of all bulks in flight and write results in
+     submission order as soon as they are ready
+    :type reorder: bool
+    :param processes: Number of worker processes that decode and flatten
+     results. Script using them has to create analyzer under
+     ``if __name__ == '__main__':`` guard
+    :type processes: int
+    :param codec: Json codec or its name
+    :type codec: :class:`anacode.api.client.JsonCodec`
+    :param observers: Objects notified about requests, retries, analyzed
+     bulks and written results
+    :type observers: list of :class:`anacode.api.observers.Observer`
     :return: :class:`anacode.api.client.Analyzer` -- Bulk analyzer instance
     """
-    if hasattr(writer, 'init') and hasattr(writer, 'close') and \
-            hasattr(writer, 'write_bulk'):
-        pass
-    elif isinstance(writer, str) and os.path.isdir(writer):
-        writer = writers.CSVWriter(writer)
-    elif isinstance(writer, dict):
-        writer = writers.DataFrameWriter(writer)
-    else:
-        raise ValueError('Writer type not understood. Please use path to file, '
-                         'dictionary or object implementing writers.Writer '
-                         'interface.')
-    client = AnacodeClient(auth, base_url)
-    return Analyzer(client, writer, threads, bulk_size=bulk_size)
+    writer = _make_writer(writer)
+    if isinstance(journal, str):
+        journal = Journal(journal)
+    if limiter is not None:
+        threads = limiter.max_limit
+    session_pool = SessionPool(size=threads, keep_alive=keep_alive)
+    client = AnacodeClient(auth, base_url, session_pool=session_pool,
+                           rate_limiter=rate_limiter,
+                           retry_policy=retry_policy, utf8=utf8,
+                           compression=compression, cache=cache,
+                           codec=codec, observers=observers)
+    return Analyzer(client, writer, threads, bulk_size=bulk_size,
+                    pipeline=pipeline, limiter=limiter,
+                    ignore_errors=ignore_errors, deduplicate=deduplicate,
+                    journal=journal, reorder=reorder, processes=processes,
+                    observers=observers)
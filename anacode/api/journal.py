@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import threading
+
+
+class Journal(object):
+    """Durable record of analyzer progress kept in append-only file with one
+    json object per line.
+
+    Analyzer notes down for every bulk when its tasks were submitted, when
+    their results arrived (acknowledged) and when they were written together
+    with writer's checkpoint. After restart the analyzer skips tasks that were
+    already written and restores writer from the last checkpoint, so it is
+    enough to feed it the same tasks in the same order again.
+
+    """
+    SUBMITTED = 'submitted'
+    ACKNOWLEDGED = 'acknowledged'
+    WRITTEN = 'written'
+
+    def __init__(self, path):
+        """Loads progress from previous runs if *path* exists.
+
+        :param path: Path to journal file
+        :type path: str
+        """
+        self.path = path
+        self.written_tasks = 0
+        self.writer_state = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        valid_size = 0
+        with open(self.path, 'rb') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # last line was not finished before crash
+                    break
+                valid_size += len(line)
+                if record['event'] == self.WRITTEN:
+                    self.written_tasks = record['first'] + record['count']
+                    self.writer_state = record['writer']
+        with open(self.path, 'r+b') as fp:
+            fp.truncate(valid_size)
+
+    def _append(self, record, sync=False):
+        record['time'] = time.time()
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def submitted(self, first, count):
+        """Records that tasks were handed to workers.
+
+        :param first: Position of first task of the bulk in analyzer's input
+        :type first: int
+        :param count: Number of tasks in the bulk
+        :type count: int
+        """
+        self._append({'event': self.SUBMITTED, 'first': first,
+                      'count': count})
+
+    def acknowledged(self, first, count):
+        """Records that results of tasks were received.
+
+        :param first: Position of first task of the bulk in analyzer's input
+        :type first: int
+        :param count: Number of tasks in the bulk
+        :type count: int
+        """
+        self._append({'event': self.ACKNOWLEDGED, 'first': first,
+                      'count': count})
+
+    def written(self, first, count, writer_state):
+        """Durably records that results of tasks were stored by writer.
+
+        :param first: Position of first task of the bulk in analyzer's input
+        :type first: int
+        :param count: Number of tasks in the bulk
+        :type count: int
+        :param writer_state: Result of writer's checkpoint method
+        :type writer_state: dict
+        """
+        self._append({'event': self.WRITTEN, 'first': first, 'count': count,
+                      'writer': writer_state}, sync=True)
+        self.written_tasks = first + count
+        self.writer_state = writer_state
+
+    def close(self):
+        """Closes journal file. It is opened again when next record is
+        added.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
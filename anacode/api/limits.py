@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import multiprocessing
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+from anacode.api.observers import Observer
+
+
+OVERLOAD_STATUS_CODES = {429, 503}
+
+
+def is_overload(error):
+    """Decides whether exception raised by API call signals that server is
+    overloaded - it is throttling requests, refusing connections or not
+    responding in time.
+
+    :param error: Exception raised during API call
+    :type error: Exception
+    :return: bool -- True if error is overload signal, False otherwise
+    """
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and \
+            response.status_code in OVERLOAD_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class AIMDLimiter(Observer):
+    """Limits number of concurrent requests and adapts the limit at runtime
+    using additive increase / multiplicative decrease. Every successful
+    request raises the limit by *increase* / limit so the limit grows by
+    *increase* per round trip of all in-flight requests. Overloaded server -
+    throttling response, connection error or latency above
+    *latency_threshold* - multiplies the limit by *backoff_ratio*.
+
+    Only one decrease is applied for requests that were in flight at the same
+    time so a single overload event does not collapse the limit.
+
+    Limiter is also an :class:`anacode.api.observers.Observer`. When it
+    observes client, the limit adapts to every HTTP attempt including
+    retried ones, and the latency of attempt excludes rate limiter waits and
+    backoff sleeps. Slots are then released with *adapt* set to False.
+
+    Limiter is thread-safe and can be shared by several analyzers talking to
+    the same server.
+
+    """
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+                 increase=1.0, backoff_ratio=0.5, latency_threshold=None):
+        """
+
+        :param initial_limit: Number of concurrent requests to start with
+        :type initial_limit: int
+        :param min_limit: Limit will never drop below this value
+        :type min_limit: int
+        :param max_limit: Limit will never grow above this value
+        :type max_limit: int
+        :param increase: How much limit grows per round trip without
+         overload
+        :type increase: float
+        :param backoff_ratio: Limit is multiplied by this ratio on overload
+        :type backoff_ratio: float
+        :param latency_threshold: Requests taking longer than this many
+         seconds are treated as overload signal. Latency is ignored if None
+        :type latency_threshold: float
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError('Limits have to satisfy '
+                             '1 <= min_limit <= initial_limit <= max_limit')
+        if not 0 < backoff_ratio < 1:
+            raise ValueError('backoff_ratio has to be between 0 and 1')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff_ratio = backoff_ratio
+        self.latency_threshold = latency_threshold
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._last_decrease = 0.
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """Current maximum number of concurrent requests.
+
+        :return: int --
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """Number of requests currently holding a slot.
+
+        :return: int --
+        """
+        return self._in_flight
+
+    def acquire(self):
+        """Waits until number of in-flight requests drops below current limit
+        and takes a slot.
+
+        :return: float -- Start time token that has to be passed to
+         :meth:`release`
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+        return time.time()
+
+    def release(self, token, overloaded=False, adapt=True):
+        """Frees slot taken by :meth:`acquire` and adapts the limit based on
+        request outcome.
+
+        :param token: Value returned by :meth:`acquire`
+        :type token: float
+        :param overloaded: Request failed because server was overloaded
+        :type overloaded: bool
+        :param adapt: Adapt the limit; False if outcome of request was
+         already observed with :meth:`request_end`
+        :type adapt: bool
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if adapt:
+                self._adapt(token, time.time(), overloaded)
+            self._condition.notify_all()
+
+    def _adapt(self, start, end, overloaded):
+        threshold = self.latency_threshold
+        if threshold is not None and end - start > threshold:
+            overloaded = True
+        if overloaded:
+            if start >= self._last_decrease:
+                self._limit = max(self.min_limit,
+                                  self._limit * self.backoff_ratio)
+                self._last_decrease = end
+        else:
+            self._limit = min(self.max_limit,
+                              self._limit + self.increase / self._limit)
+
+    def request_end(self, endpoint, status, latency, sent_bytes,
+                    received_bytes):
+        """Adapts the limit to outcome of single HTTP attempt. Throttling
+        status or failure without response is overload signal.
+        """
+        end = time.time()
+        with self._condition:
+            self._adapt(end - latency, end,
+                        status is None or status in OVERLOAD_STATUS_CODES)
+            self._condition.notify_all()
+
+
+def parse_retry_after(value):
+    """Parses value of Retry-After HTTP header which can be either number of
+    seconds or HTTP date.
+
+    :param value: Header value
+    :type value: str
+    :return: float -- Number of seconds to wait or None if value could not be
+     parsed
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(mktime_tz(parsed) - time.time(), 0.)
+
+
+# indexes into RateLimiter state
+_REQUEST_TOKENS, _CHAR_TOKENS, _UPDATED, _BLOCKED_UNTIL = range(4)
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter that keeps API usage within requests per
+    second and characters per second quotas. Bursts are smoothed - bucket
+    holds at most *burst* seconds worth of quota.
+
+    Requests larger than the whole character bucket are let through when the
+    bucket is full and the excess is paid back before next request so
+    long-term throughput stays at configured rate.
+
+    Limiter also honours rate limit headers returned by the server -
+    Retry-After and X-RateLimit-Remaining with X-RateLimit-Reset - and holds
+    all requests until the server allows them again.
+
+    Limiter is thread-safe. Limiter created with *shared* set keeps its state
+    in shared memory and can be used by processes started after it was
+    created, for example by passing it to :class:`multiprocessing.Process`
+    or by forking.
+
+    """
+    def __init__(self, requests_per_second=None, chars_per_second=None,
+                 burst=1.0, shared=False):
+        """
+
+        :param requests_per_second: Maximum request rate, unlimited if None
+        :type requests_per_second: float
+        :param chars_per_second: Maximum rate of analyzed text characters,
+         unlimited if None
+        :type chars_per_second: float
+        :param burst: Number of seconds worth of quota that can be spent at
+         once
+        :type burst: float
+        :param shared: Keep state in shared memory so that it can be used by
+         multiple processes
+        :type shared: bool
+        """
+        if burst <= 0:
+            raise ValueError('burst has to be positive')
+        self.requests_per_second = requests_per_second
+        self.chars_per_second = chars_per_second
+        self.burst = burst
+        self.request_capacity = self._capacity(requests_per_second)
+        self.char_capacity = self._capacity(chars_per_second)
+        initial = [self.request_capacity, self.char_capacity, time.time(), 0.]
+        if shared:
+            self._lock = multiprocessing.Lock()
+            self._state = multiprocessing.RawArray('d', initial)
+        else:
+            self._lock = threading.Lock()
+            self._state = initial
+
+    def _capacity(self, rate):
+        if rate is None:
+            return 0.
+        return max(rate * self.burst, 1.)
+
+    def _refill(self, now):
+        state = self._state
+        elapsed = max(now - state[_UPDATED], 0.)
+        state[_UPDATED] = now
+        if self.requests_per_second is not None:
+            state[_REQUEST_TOKENS] = min(
+                self.request_capacity,
+                state[_REQUEST_TOKENS] + elapsed * self.requests_per_second
+            )
+        if self.chars_per_second is not None:
+            state[_CHAR_TOKENS] = min(
+                self.char_capacity,
+                state[_CHAR_TOKENS] + elapsed * self.chars_per_second
+            )
+
+    def try_acquire(self, chars=0):
+        """Takes tokens for one request with *chars* characters if they are
+        available.
+
+        :param chars: Number of text characters sent in request
+        :type chars: int
+        :return: float -- 0 if tokens were taken, otherwise number of seconds
+         to wait before trying again
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            state = self._state
+            wait = state[_BLOCKED_UNTIL] - now
+            if self.requests_per_second is not None:
+                missing = 1 - state[_REQUEST_TOKENS]
+                wait = max(wait, missing / self.requests_per_second)
+            if self.chars_per_second is not None and chars > 0:
+                needed = min(chars, self.char_capacity)
+                missing = needed - state[_CHAR_TOKENS]
+                wait = max(wait, missing / self.chars_per_second)
+            if wait > 0:
+                return wait
+            if self.requests_per_second is not None:
+                state[_REQUEST_TOKENS] -= 1
+            if self.chars_per_second is not None:
+                state[_CHAR_TOKENS] -= chars
+            return 0.
+
+    def acquire(self, chars=0):
+        """Blocks until request with *chars* characters may be sent.
+
+        :param chars: Number of text characters sent in request
+        :type chars: int
+        """
+        wait = self.try_acquire(chars)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire(chars)
+
+    def block_for(self, seconds):
+        """Holds all requests for given number of seconds.
+
+        :param seconds: How long should limiter block
+        :type seconds: float
+        """
+        with self._lock:
+            until = time.time() + seconds
+            self._state[_BLOCKED_UNTIL] = max(self._state[_BLOCKED_UNTIL],
+                                              until)
+
+    def update(self, headers):
+        """Inspects rate limit headers of server response and blocks further
+        requests if server asks for it.
+
+        :param headers: Response headers
+        :type headers: dict
+        """
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after:
+            self.block_for(retry_after)
+            return
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        try:
+            if remaining is None or reset is None or float(remaining) > 0:
+                return
+            reset = float(reset)
+        except ValueError:
+            return
+        # reset is either epoch timestamp or number of seconds
+        if reset > 10 ** 9:
+            reset -= time.time()
+        if reset > 0:
+            self.block_for(reset)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for Anacode API that answers scrape and analyze calls with
+synthetic results. It is meant for tests and benchmarks that should not use
+API quota or depend on network conditions.
+
+Example::
+
+    >>> from anacode.api import client, mockserver
+    >>> with mockserver.MockServer(latency=0.05, error_rate=0.01) as server:
+    >>>     api = client.AnacodeClient('token', base_url=server.url)
+    >>>     api.analyze(['安全性能很好'], ['concepts'])
+
+"""
+import json
+import zlib
+import random
+import threading
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from anacode.api.client import COMPRESSION_WBITS
+
+
+CATEGORIES = ['auto', 'camera', 'ce', 'fashion', 'finance', 'food', 'games',
+              'health', 'hotel', 'mobile', 'sports', 'travel']
+CONCEPT_TYPES = ['brand', 'feature', 'product', 'location', 'person']
+ENTITY_TYPES = ['feature_subjective', 'feature_quantitative',
+                'feature_objective', 'product', 'brand']
+ENTITY_NAMES = ['Safety', 'OperationQuality', 'VisualAppearance', 'Price',
+                'Comfort', 'Space', 'Lenovo', 'Samsung', 'BMW', 'Audi']
+
+
+class ResultGenerator(object):
+    """Creates analysis results with the same structure as Anacode API.
+    Results are random but the same text always gets the same result.
+
+    """
+    def __init__(self, payload_size=1, seed=0):
+        """
+
+        :param payload_size: Multiplies number of concepts, entities,
+         relations and evaluations in every result
+        :type payload_size: int
+        :param seed: Seed that together with text decides result
+        :type seed: int
+        """
+        self.payload_size = payload_size
+        self.seed = seed
+
+    def _random(self, text, analysis):
+        return random.Random(u'{}:{}:{}'.format(self.seed, analysis, text))
+
+    def _span(self, rnd, text):
+        start = rnd.randint(0, max(0, len(text) - 1))
+        end = min(len(text), start + rnd.randint(1, 4))
+        return [start, max(end, start + 1)], text[start:end] or text
+
+    def categories(self, text):
+        rnd = self._random(text, 'categories')
+        weights = [rnd.random() ** 4 for _ in CATEGORIES]
+        total = sum(weights)
+        return [{'label': label, 'probability': weight / total}
+                for label, weight in sorted(zip(CATEGORIES, weights),
+                                            key=lambda pair: -pair[1])]
+
+    def concepts(self, text):
+        rnd = self._random(text, 'concepts')
+        result = []
+        for index in range(rnd.randint(1, 3) * self.payload_size):
+            span, surface = self._span(rnd, text)
+            result.append({
+                'concept': 'Concept{}'.format(rnd.randint(0, 500)),
+                'freq': rnd.randint(1, 3),
+                'relevance_score': rnd.random(),
+                'type': rnd.choice(CONCEPT_TYPES),
+                'surface': [{'surface_string': surface, 'span': span}],
+            })
+        return result
+
+    def sentiment(self, text):
+        rnd = self._random(text, 'sentiment')
+        return {'sentiment_value': rnd.uniform(-1, 1)}
+
+    def _entity(self, rnd):
+        return {'type': rnd.choice(ENTITY_TYPES),
+                'value': rnd.choice(ENTITY_NAMES)}
+
+    def absa(self, text):
+        rnd = self._random(text, 'absa')
+        count = rnd.randint(1, 2) * self.payload_size
+        entities, relations, evaluations = [], [], []
+        for _ in range(count):
+            span, surface = self._span(rnd, text)
+            entities.append({'semantics': [self._entity(rnd)],
+                             'surface': {'span': span,
+                                         'surface_string': surface}})
+            relations.append({
+                'external_entity': False,
+                'semantics': {'entity': [self._entity(rnd)],
+                              'opinion_holder': None, 'restriction': None,
+                              'sentiment_value': rnd.uniform(-5, 5)},
+                'surface': {'span': span, 'surface_string': surface},
+            })
+            evaluations.append({
+                'semantics': {'entity': [self._entity(rnd)],
+                              'sentiment_value': rnd.uniform(-5, 5)},
+                'surface': {'span': span, 'surface_string': surface},
+            })
+        return {'entities': entities, 'relations': relations,
+                'evaluations': evaluations, 'normalized_text': text}
+
+    def analyze(self, texts, analyses, single_document=False):
+        """Creates response of analyze call.
+
+        :param texts: Analyzed texts
+        :type texts: list
+        :param analyses: Requested analyses
+        :type analyses: list
+        :param single_document: Texts are paragraphs of one document; only
+         sentiment is reported once for all of them then
+        :type single_document: bool
+        :return: dict --
+        """
+        result = {}
+        for analysis in analyses:
+            if analysis == 'sentiment' and single_document:
+                result[analysis] = [self.sentiment(u''.join(texts))]
+            else:
+                method = getattr(self, analysis)
+                result[analysis] = [method(text) for text in texts]
+        return result
+
+    def scrape(self, url):
+        """Creates response of scrape call.
+
+        :param url: Scraped URL
+        :type url: str
+        :return: dict -- 'url', 'title', 'date' and 'text' of page
+        """
+        rnd = self._random(url, 'scrape')
+        words = [rnd.choice(ENTITY_NAMES) for _ in
+                 range(10 * self.payload_size)]
+        return {'url': url, 'title': words[0],
+                'date': '2017-01-{:02d}'.format(rnd.randint(1, 28)),
+                'text': u'，'.join(words) + u'。'}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body=b'', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        encoding = self.headers.get('Content-Encoding')
+        if encoding in COMPRESSION_WBITS:
+            body = zlib.decompress(body, COMPRESSION_WBITS[encoding])
+        return json.loads(body.decode('utf-8'))
+
+    def do_POST(self):
+        server = self.server.mock
+        try:
+            data = self._read_json()
+        except ValueError:
+            self._respond(400, b'{"detail": "Malformed request"}')
+            return
+        status, result = server.handle(self.path, data)
+        headers = {'Retry-After': '0'} if status == 503 else None
+        self._respond(status, json.dumps(result).encode('utf-8'), headers)
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockServer(object):
+    """HTTP server on localhost that mimics /analyze/ and /scrape/ calls of
+    Anacode API. Latency, error rate and size of results are configurable so
+    that client behaviour under different conditions can be reproduced.
+
+    """
+    def __init__(self, latency=0., error_rate=0., payload_size=1, seed=0,
+                 host='127.0.0.1', port=0):
+        """
+
+        :param latency: Seconds every request takes, either fixed number or
+         (minimum, maximum) pair for uniformly random latency
+        :type latency: float
+        :param error_rate: Fraction of requests answered with 503 error
+        :type error_rate: float
+        :param payload_size: Multiplies number of items in results, see
+         :class:`ResultGenerator`
+        :type payload_size: int
+        :param seed: Seed of generated results and errors
+        :type seed: int
+        :param host: Address to listen on
+        :type host: str
+        :param port: Port to listen on; free port is chosen by default
+        :type port: int
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.generator = ResultGenerator(payload_size, seed)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.requests = 0
+        self.errors = 0
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to pass to client."""
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def _delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            with self._lock:
+                return self._random.uniform(*self.latency)
+        return self.latency
+
+    def handle(self, path, data):
+        """Computes response to request.
+
+        :param path: Requested path
+        :type path: str
+        :param data: Decoded json body
+        :type data: dict
+        :return: tuple -- HTTP status and json response
+        """
+        delay = self._delay()
+        if delay:
+            self._stop.wait(delay)
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            return 503, {'detail': 'Service temporarily unavailable'}
+        if path.rstrip('/') == '/analyze':
+            return 200, self.generator.analyze(
+                data.get('texts', []), data.get('analyses', []),
+                data.get('single_document', False))
+        if path.rstrip('/') == '/scrape':
+            return 200, self.generator.scrape(data.get('url'))
+        return 404, {'detail': 'Not found'}
+
+    def start(self):
+        """Starts serving requests in background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops server and closes its socket."""
+        self._stop.set()
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
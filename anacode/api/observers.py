@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import logging
+import threading
+
+
+class Observer(object):
+    """Base class for objects that want to be notified about what client and
+    analyzer do. All methods do nothing, subclasses override those they are
+    interested in. Methods are called from worker threads so they have to be
+    thread-safe and should return quickly.
+
+    """
+    def request_start(self, endpoint, body_bytes):
+        """HTTP request is about to be sent.
+
+        :param endpoint: URL of API call
+        :type endpoint: str
+        :param body_bytes: Size of request body as sent
+        :type body_bytes: int
+        """
+
+    def request_end(self, endpoint, status, latency, sent_bytes,
+                    received_bytes):
+        """HTTP request finished.
+
+        :param endpoint: URL of API call
+        :type endpoint: str
+        :param status: HTTP status of response or None if request failed
+         without response
+        :type status: int
+        :param latency: Seconds between sending request and receiving
+         response
+        :type latency: float
+        :param sent_bytes: Size of request body as sent
+        :type sent_bytes: int
+        :param received_bytes: Size of response body as received
+        :type received_bytes: int
+        """
+
+    def retry(self, endpoint, attempt, delay, status):
+        """Failed request will be sent again.
+
+        :param endpoint: URL of API call
+        :type endpoint: str
+        :param attempt: Number of retries made before this one
+        :type attempt: int
+        :param delay: Seconds client waits before the retry
+        :type delay: float
+        :param status: HTTP status of failed response or None if request
+         failed without response
+        :type status: int
+        """
+
+    def decode(self, seconds, size):
+        """Response body was decoded from json.
+
+        :param seconds: Time spent decoding
+        :type seconds: float
+        :param size: Size of decoded body in bytes
+        :type size: int
+        """
+
+    def bulk_flush(self, tasks, seconds):
+        """Analyzer finished API calls of one bulk.
+
+        :param tasks: Number of tasks in the bulk
+        :type tasks: int
+        :param seconds: Time between submitting the bulk and having all
+         results
+        :type seconds: float
+        """
+
+    def writer_flush(self, results, seconds, flatten, write):
+        """Analyzer handed results to writer.
+
+        :param results: Number of written results
+        :type results: int
+        :param seconds: Total time spent writing
+        :type seconds: float
+        :param flatten: Part of the time spent converting results to rows,
+         including decoding if it is done by worker processes
+        :type flatten: float
+        :param write: Part of the time spent storing rows
+        :type write: float
+        """
+
+
+def notify(observers, event, *args):
+    """Calls *event* method of all *observers*. Errors in observers are
+    logged and never interrupt analysis.
+
+    :param observers: List of observers
+    :param event: Name of :class:`Observer` method
+    :type event: str
+    """
+    for observer in observers:
+        try:
+            getattr(observer, event)(*args)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                'Observer %r failed on %s', observer, event)
+
+
+class LatencyHistogram(object):
+    """Histogram with logarithmic buckets. Memory use does not depend on number
+    of recorded values and percentiles are accurate to *precision* relative
+    error.
+
+    """
+    def __init__(self, precision=0.05, minimum=1e-4):
+        """
+
+        :param precision: Relative width of a bucket
+        :type precision: float
+        :param minimum: Values below this fall into the first bucket
+        :type minimum: float
+        """
+        self._base = math.log(1 + precision)
+        self._minimum = minimum
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, value):
+        if value <= self._minimum:
+            return 0
+        return int(math.log(value / self._minimum) / self._base) + 1
+
+    def _value(self, bucket):
+        if bucket == 0:
+            return self._minimum
+        # middle of the bucket
+        return self._minimum * math.exp((bucket - 0.5) * self._base)
+
+    def add(self, value):
+        """Records new value.
+
+        :param value: Value in seconds
+        :type value: float
+        """
+        bucket = self._bucket(value)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Returns approximate percentile of recorded values.
+
+        :param percent: Percentile between 0 and 100
+        :type percent: float
+        :return: float -- Value or None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(percent / 100. * self.count)))
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self._value(bucket), self.max)
+        return self.max
+
+
+class MetricsCollector(Observer):
+    """Observer that collects latency histogram, throughput counters and
+    breakdown of time spent in network, decoding, flattening and writing.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.started = time.time()
+        self.counters = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'sent_bytes': 0,
+            'received_bytes': 0,
+            'bulks': 0,
+            'written': 0,
+        }
+        self.times = {
+            'network': 0.0,
+            'decode': 0.0,
+            'flatten': 0.0,
+            'write': 0.0,
+        }
+
+    def request_end(self, endpoint, status, latency, sent_bytes,
+                    received_bytes):
+        with self._lock:
+            self.latency.add(latency)
+            self.counters['requests'] += 1
+            if status is None or status >= 400:
+                self.counters['errors'] += 1
+            self.counters['sent_bytes'] += sent_bytes
+            self.counters['received_bytes'] += received_bytes
+            self.times['network'] += latency
+
+    def retry(self, endpoint, attempt, delay, status):
+        with self._lock:
+            self.counters['retries'] += 1
+
+    def decode(self, seconds, size):
+        with self._lock:
+            self.times['decode'] += seconds
+
+    def bulk_flush(self, tasks, seconds):
+        with self._lock:
+            self.counters['bulks'] += 1
+
+    def writer_flush(self, results, seconds, flatten, write):
+        with self._lock:
+            self.counters['written'] += results
+            self.times['flatten'] += flatten
+            self.times['write'] += write
+
+    def summary(self):
+        """Returns snapshot of collected metrics.
+
+        :return: dict -- 'latency' with p50, p90, p99, mean and max request
+         latency in seconds, 'counters' with numbers of requests, failed
+         requests, retries, sent and received bytes, analyzed bulks and
+         written results, 'throughput' with requests, bytes sent and results
+         written per second and 'times' with total seconds spent in
+         network, decode, flatten and write. Network time is summed over
+         concurrent requests so it may exceed wall clock time.
+        """
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            latency = self.latency
+            counters = dict(self.counters)
+            return {
+                'latency': {
+                    'p50': latency.percentile(50),
+                    'p90': latency.percentile(90),
+                    'p99': latency.percentile(99),
+                    'mean': latency.total / latency.count
+                    if latency.count else None,
+                    'max': latency.max if latency.count else None,
+                },
+                'counters': counters,
+                'throughput': {
+                    'requests': counters['requests'] / elapsed,
+                    'sent_bytes': counters['sent_bytes'] / elapsed,
+                    'written': counters['written'] / elapsed,
+                },
+                'times': dict(self.times),
+            }
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import time
+import random
+import threading
+from collections import deque
+
+from anacode.api.limits import parse_retry_after
+
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RetryBudget(object):
+    """Limits retries to a fraction of recent requests so that failing server
+    is not flooded with retries from all threads at once. Within sliding
+    window of *ttl* seconds client may retry *min_retries* times plus *ratio*
+    times number of requests made.
+
+    Budget is thread-safe and is meant to be shared by all threads using the
+    same client.
+
+    """
+    def __init__(self, ratio=0.2, min_retries=10, ttl=10.):
+        """
+
+        :param ratio: Allowed number of retries per request
+        :type ratio: float
+        :param min_retries: Retries that are always allowed within window
+        :type min_retries: int
+        :param ttl: Length of sliding window in seconds
+        :type ttl: float
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.ttl = ttl
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.ttl:
+                events.popleft()
+
+    def deposit(self):
+        """Records new request."""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._requests.append(now)
+
+    def withdraw(self):
+        """Takes one retry from budget if there is any left.
+
+        :return: bool -- True if retry is allowed, False otherwise
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            allowed = self.min_retries + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryPolicy(object):
+    """Decides whether failed request should be retried and how long to wait
+    before next attempt.
+
+    Connection errors and responses with status in *retry_statuses* are
+    retried up to *max_retries* times unless *status_retries* sets different
+    limit for given status. Wait times grow exponentially from
+    *backoff_factor* up to *max_backoff* and are randomized with full jitter
+    so threads that failed together do not retry in lockstep. If server sends
+    Retry-After header client waits at least that long.
+
+    """
+    def __init__(self, max_retries=3, backoff_factor=0.1, max_backoff=10.,
+                 jitter=True, retry_statuses=RETRY_STATUS_CODES,
+                 status_retries=None, respect_retry_after=True, budget=None):
+        """
+
+        :param max_retries: Maximum number of retries of single request
+        :type max_retries: int
+        :param backoff_factor: Base wait time in seconds, doubled with each
+         retry
+        :type backoff_factor: float
+        :param max_backoff: Upper limit of wait time computed from backoff
+        :type max_backoff: float
+        :param jitter: Wait random time between zero and computed backoff
+        :type jitter: bool
+        :param retry_statuses: HTTP statuses that should be retried
+        :type retry_statuses: iterable
+        :param status_retries: Maximum number of retries for specific HTTP
+         statuses, overrides *max_retries*. Statuses listed here are retried
+         even if they are not in *retry_statuses*; zero disables retries
+        :type status_retries: dict
+        :param respect_retry_after: Wait as long as server asks in
+         Retry-After header
+        :type respect_retry_after: bool
+        :param budget: Retry budget shared by all requests using this policy
+        :type budget: :class:`anacode.api.retry.RetryBudget`
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = set(retry_statuses)
+        self.status_retries = dict(status_retries or {})
+        self.respect_retry_after = respect_retry_after
+        self.budget = budget
+
+    def record_request(self):
+        """Notes down new request for retry budget."""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def should_retry(self, attempt, status=None):
+        """Decides whether request that failed *attempt* times should be
+        tried again.
+
+        :param attempt: Number of retries already made
+        :type attempt: int
+        :param status: HTTP status of failed response or None if request
+         failed with connection error
+        :type status: int
+        :return: bool -- True if request should be retried
+        """
+        if status is None:
+            limit = self.max_retries
+        elif status in self.status_retries:
+            limit = self.status_retries[status]
+        elif status in self.retry_statuses:
+            limit = self.max_retries
+        else:
+            return False
+        if attempt >= limit:
+            return False
+        return self.budget is None or self.budget.withdraw()
+
+    def backoff(self, attempt):
+        """Computes wait time before retry.
+
+        :param attempt: Number of retries already made
+        :type attempt: int
+        :return: float -- Number of seconds to wait
+        """
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def delay(self, attempt, headers=None):
+        """Computes wait time before retry taking Retry-After response header
+        into account.
+
+        :param attempt: Number of retries already made
+        :type attempt: int
+        :param headers: Headers of failed response
+        :type headers: dict
+        :return: float -- Number of seconds to wait
+        """
+        delay = self.backoff(attempt)
+        if self.respect_retry_after and headers is not None:
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
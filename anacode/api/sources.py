@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+
+
+FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.txt': 'text',
+}
+
+
+def _guess_format(path):
+    if path.endswith('.gz'):
+        path = path[:-3]
+    return FORMATS.get(os.path.splitext(path)[1].lower(), 'text')
+
+
+def _open_text(path, encoding):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding=encoding,
+                                newline='')
+    return io.open(path, encoding=encoding, newline='')
+
+
+def _read_lines(lines):
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.strip():
+            yield line
+
+
+def _read_jsonl(lines, field):
+    for line in _read_lines(lines):
+        item = json.loads(line)
+        if isinstance(item, dict):
+            item = item.get(field)
+        if item:
+            yield item
+
+
+def _read_csv(lines, field):
+    for row in csv.DictReader(lines):
+        text = row.get(field)
+        if text:
+            yield text
+
+
+def _read_file(fp, format, field):
+    if format == 'jsonl':
+        return _read_jsonl(fp, field)
+    if format == 'csv':
+        return _read_csv(fp, field)
+    return _read_lines(fp)
+
+
+def iter_texts(source, format=None, field='text', encoding='utf-8'):
+    """Lazily reads texts from *source*. Only one line or row is kept in
+    memory at a time so files of any size can be processed.
+
+    Source may be:
+
+    * iterable of texts, for example list or generator
+    * path to file; files ending with .gz are decompressed on the fly
+    * '-' to read from standard input
+    * open text file object
+
+    Plain text files contain one text per line. Json lines files contain
+    either one json string per line or json objects with text in *field*.
+    Csv files must have header row with *field* column. Empty lines and
+    texts are skipped.
+
+    :param source: Where to read texts from
+    :param format: 'text', 'jsonl' or 'csv'; guessed from file extension if
+     not given, standard input and file objects default to 'text'
+    :type format: str
+    :param field: Name of json attribute or csv column with text
+    :type field: str
+    :param encoding: Encoding of files and standard input
+    :type encoding: str
+    :return: Generator yielding texts
+    """
+    if isinstance(source, str) and source == '-':
+        if hasattr(sys.stdin, 'buffer'):
+            stdin = io.TextIOWrapper(sys.stdin.buffer, encoding=encoding,
+                                     newline='')
+            try:
+                for text in _read_file(stdin, format or 'text', field):
+                    yield text
+            finally:
+                # leave standard input open for the rest of the program
+                stdin.detach()
+        else:
+            for text in _read_file(sys.stdin, format or 'text', field):
+                yield text
+    elif isinstance(source, str):
+        with _open_text(source, encoding) as fp:
+            for text in _read_file(fp, format or _guess_format(source),
+                                   field):
+                yield text
+    elif hasattr(source, 'read'):
+        for text in _read_file(source, format or 'text', field):
+            yield text
+    else:
+        for text in source:
+            yield text
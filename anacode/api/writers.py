@@ -1,11 +1,31 @@
 # -*- coding: utf-8 -*-
+import io
 import os
+import re
 import csv
+import json
+import time
+import sqlite3
 import datetime
+import threading
+import numpy as np
 import pandas as pd
+from array import array
+from contextlib import contextmanager
 from itertools import chain
 from functools import partial
 
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 from anacode import codes
 
 
@@ -33,6 +53,93 @@ def backup(root, files):
     return backed_up
 
 
+def _last_row_start(data, whole):
+    """Finds where last row of csv *data* starts. Quoted values may contain
+    line breaks, so the row starts after the last line break followed by
+    even number of quotes. Returns None if *data* is only end of file and
+    does not contain the start.
+    """
+    end = len(data.rstrip(b'\r\n'))
+    position = end
+    while True:
+        newline = data.rfind(b'\n', 0, position)
+        if newline < 0:
+            return 0 if whole else None
+        if data.count(b'"', newline, end) % 2 == 0:
+            return newline + 1
+        position = newline
+
+
+def _ends_with_row(data, columns, whole):
+    """Tells whether csv *data* ends with complete row or header of table
+    with *columns* columns.
+    """
+    if not data:
+        return whole
+    if not data.endswith(b'\n'):
+        return False
+    start = _last_row_start(data, whole)
+    if start is None:
+        return False
+    try:
+        rows = list(csv.reader(io.StringIO(data[start:].decode('utf-8')),
+                               strict=True))
+    except (csv.Error, UnicodeDecodeError):
+        return False
+    if len(rows) != 1 or len(rows[0]) != columns:
+        return False
+    return rows[0][0] == 'doc_id' or rows[0][0].isdigit()
+
+
+def last_csv_row(path, block_size=2 ** 16):
+    """Returns last row of csv file reading only as much of its end as
+    needed. Quoted values may contain line breaks, so the row starts after
+    the last line break followed by even number of quotes.
+
+    :param path: Path to csv file written by :class:`CSVWriter`
+    :type path: str
+    :param block_size: Number of bytes read from the end at first
+    :type block_size: int
+    :return: list -- Values of last row, None if file is empty
+    """
+    with open(path, 'rb') as fp:
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        read = min(size, block_size)
+        while True:
+            fp.seek(size - read)
+            tail = fp.read(read)
+            start = _last_row_start(tail, read == size)
+            if start is not None:
+                break
+            read = min(size, read * 2)
+    text = tail[start:].rstrip(b'\r\n').decode('utf-8')
+    for row in csv.reader(io.StringIO(text)):
+        return row
+    return None
+
+
+def parquet_parts(target_dir, name):
+    """Finds parquet files holding table *name* written by
+    :class:`ParquetWriter`. First part is stored in ``<name>.parquet`` and
+    parts started after checkpoints in ``<name>.<number>.parquet``.
+
+    :param target_dir: Path to directory with parquet files
+    :type target_dir: str
+    :param name: Table name, key of :data:`HEADERS`
+    :type name: str
+    :return: list -- Tuples (part number, path) sorted by part number
+    """
+    pattern = re.compile(re.escape(name) + r'(?:\.(\d+))?\.parquet$')
+    parts = []
+    for file_name in os.listdir(target_dir):
+        match = pattern.match(file_name)
+        if match:
+            parts.append((int(match.group(1) or 0),
+                          os.path.join(target_dir, file_name)))
+    return sorted(parts)
+
+
 HEADERS = {
     'categories': [u'doc_id', u'text_order', u'category', u'probability'],
     'concepts': [u'doc_id', u'text_order', u'concept', u'freq',
@@ -55,6 +162,30 @@ HEADERS = {
 }
 
 
+# Python type of values in HEADERS columns; columns not listed hold strings
+COLUMN_TYPES = {
+    u'doc_id': int,
+    u'text_order': int,
+    u'relation_id': int,
+    u'evaluation_id': int,
+    u'freq': int,
+    u'probability': float,
+    u'relevance_score': float,
+    u'sentiment_value': float,
+    u'is_external': bool,
+}
+
+
+# Columns besides (doc_id, text_order) that SQLiteWriter indexes
+SQLITE_INDEXES = {
+    'concepts': [u'concept'],
+    'concepts_surface_strings': [u'concept'],
+    'absa_entities': [u'entity_name'],
+    'absa_relations_entities': [u'entity_name'],
+    'absa_evaluations_entities': [u'entity_name'],
+}
+
+
 # `anacode.agg.aggregations.ApiDataset.from_path` depends
 # on ordering of files defined in values here
 CSV_FILES = {
@@ -82,7 +213,7 @@ def categories_to_list(doc_id, analyzed, single_document=False):
     """
     cat_list = []
     for order, text_analyzed in enumerate(analyzed):
-        for result_dict in text_analyzed:
+        for result_dict in text_analyzed or []:
             row = [doc_id, 0, result_dict.get('label'),
                    result_dict.get('probability')]
             if single_document:
@@ -136,6 +267,8 @@ def sentiments_to_list(doc_id, analyzed, single_document=False):
     """
     sen_list = []
     for order, sentiment in enumerate(analyzed):
+        if sentiment is None:
+            continue
         row = [doc_id, 0, sentiment['sentiment_value']]
         if single_document:
             # this should not happen
@@ -218,6 +351,8 @@ def absa_to_list(doc_id, analyzed, single_document=False):
         'absa_evaluations_entities': []
     }
     for order, text_analyzed in enumerate(analyzed):
+        if text_analyzed is None:
+            continue
         if single_document:
             current_id = doc_id
             text_order = order
@@ -250,9 +385,27 @@ class Writer(object):
 
     The writer interface consists of init, close and write_bulk methods.
 
+    Writers whose output can be continued after restart from state returned
+    by :meth:`checkpoint` set *supports_resume*; only they can be used by
+    analyzer with journal.
+
     """
+    supports_resume = False
+
     def __init__(self):
         self.ids = {'scrape': 0, 'analyze': 0}
+        self.timings = {'flatten': 0.0, 'write': 0.0}
+
+    def _store(self, flatten, analyzed, single_document):
+        """Flattens analysis result to rows, stores them and measures time
+        spent on both steps.
+        """
+        start = time.time()
+        new_data = flatten(self.ids['analyze'], analyzed, single_document)
+        flattened = time.time()
+        self._add_new_data_from_dict(new_data)
+        self.timings['flatten'] += flattened - start
+        self.timings['write'] += time.time() - flattened
 
     def write_row(self, call_type, call_result):
         """Decides what kind of data it got and calls appropriate write method.
@@ -322,9 +475,7 @@ class Writer(object):
         :param single_document: Is analysis describing just one document
         :type single_document: bool
         """
-        doc_id = self.ids['analyze']
-        new_data = categories_to_list(doc_id, analyzed, single_document)
-        self._add_new_data_from_dict(new_data)
+        self._store(categories_to_list, analyzed, single_document)
 
     def write_concepts(self, analyzed, single_document=False):
         """Converts concepts analysis result to flat lists and stores them.
@@ -334,9 +485,7 @@ class Writer(object):
         :param single_document: Is analysis describing just one document
         :type single_document: bool
         """
-        doc_id = self.ids['analyze']
-        new_data = concepts_to_list(doc_id, analyzed, single_document)
-        self._add_new_data_from_dict(new_data)
+        self._store(concepts_to_list, analyzed, single_document)
 
     def write_sentiment(self, analyzed, single_document=False):
         """Converts sentiment analysis result to flat lists and stores them.
@@ -346,9 +495,7 @@ class Writer(object):
         :param single_document: Is analysis describing just one document
         :type single_document: bool
         """
-        doc_id = self.ids['analyze']
-        new_data = sentiments_to_list(doc_id, analyzed, single_document)
-        self._add_new_data_from_dict(new_data)
+        self._store(sentiments_to_list, analyzed, single_document)
 
     def write_absa(self, analyzed, single_document=False):
         """Converts absa analysis result to flat lists and stores them.
@@ -358,9 +505,7 @@ class Writer(object):
         :param single_document: Is analysis describing just one document
         :type single_document: bool
         """
-        doc_id = self.ids['analyze']
-        new_data = absa_to_list(doc_id, analyzed, single_document)
-        self._add_new_data_from_dict(new_data)
+        self._store(absa_to_list, analyzed, single_document)
 
     def write_bulk(self, results):
         """Stores multiple anacode api's JSON responses marked with call IDs as
@@ -381,6 +526,52 @@ class Writer(object):
         """Not implemented here! Each subclass should decide what to do here."""
         pass
 
+    def write_flattened(self, new_data, ids):
+        """Stores rows produced by :func:`flatten_bulk`. Document ids in rows
+        start from zero and are shifted by ids already used by this writer.
+
+        :param new_data: dict; keys are data sets names and values are
+         flat lists of rows
+        :type new_data: dict
+        :param ids: Number of scrape and analyze document ids rows take
+        :type ids: dict
+        """
+        start = time.time()
+        offset = self.ids['analyze']
+        if offset:
+            new_data = {name: [[row[0] + offset] + list(row[1:])
+                               for row in rows]
+                        for name, rows in new_data.items()}
+        self._add_new_data_from_dict(new_data)
+        self.timings['write'] += time.time() - start
+        for call, count in ids.items():
+            self.ids[call] += count
+
+    def checkpoint(self, force=False):
+        """Makes sure everything written so far is stored and describes state
+        of the writer so that it can continue after restart. Base version
+        records only document ids; writers supporting resume extend it.
+
+        Writers for which checkpoint is expensive may postpone it and return
+        None; progress is then recorded with a later checkpoint.
+
+        :param force: Checkpoint even if writer would rather postpone it
+        :type force: bool
+        :return: dict -- Json serializable writer state or None if
+         checkpoint was postponed
+        """
+        return {'ids': dict(self.ids)}
+
+    def restore(self, state):
+        """Prepares writer to continue from state returned by
+        :meth:`checkpoint`. Has to be called before :meth:`init`. Base version
+        restores only document ids; writers supporting resume extend it.
+
+        :param state: Writer state from previous run
+        :type state: dict
+        """
+        self.ids = dict(state['ids'])
+
     def __enter__(self):
         self.init()
         return self
@@ -389,42 +580,152 @@ class Writer(object):
         self.close()
 
 
+class _RowCollector(Writer):
+    """Collects flat rows of all data sets in memory."""
+    def __init__(self):
+        super(_RowCollector, self).__init__()
+        self.rows = {}
+
+    def _add_new_data_from_dict(self, new_data):
+        for name, row_list in new_data.items():
+            if row_list:
+                self.rows.setdefault(name, []).extend(row_list)
+
+
+def flatten_bulk(results, loads=json.loads):
+    """Decodes and flattens anacode api responses. Meant to be run in worker
+    process; output is small and cheap to send back and can be stored with
+    :meth:`Writer.write_flattened`.
+
+    :param results: List of tuples (call_id, call_result) where call_result
+     is either decoded json or json encoded response body
+    :type results: list
+    :param loads: Function decoding json response bodies
+    :return: tuple -- Dict of flat row lists with document ids starting from
+     zero and dict with number of scrape and analyze document ids they take
+    """
+    collector = _RowCollector()
+    for call_type, call_result in results:
+        if not isinstance(call_result, dict):
+            call_result = loads(call_result)
+        collector.write_row(call_type, call_result)
+    return collector.rows, collector.ids
+
+
+class _Column(object):
+    """Growing buffer of one table column. Numbers are stored in typed
+    arrays and other values in list where equal strings share one object.
+    Buffer is consolidated into numpy chunks by :meth:`flush`.
+    """
+    TYPECODES = {int: 'q', float: 'd', bool: 'b'}
+    DTYPES = {'q': np.int64, 'd': np.float64, 'b': np.bool_}
+
+    def __init__(self, kind, strings):
+        self.typecode = self.TYPECODES.get(kind)
+        self.strings = strings
+        self.chunks = []
+        self.values = self._empty()
+
+    def _empty(self):
+        return [] if self.typecode is None else array(self.typecode)
+
+    def extend(self, values):
+        if isinstance(self.values, array):
+            try:
+                self.values.extend(array(self.typecode, values))
+                return
+            except (TypeError, OverflowError):
+                # missing or unexpected value, rest of this chunk is kept
+                # in list and pandas infers its type as it would for rows
+                self.values = self.values.tolist()
+        intern = self.strings.setdefault
+        self.values.extend(intern(value, value) if isinstance(value, str)
+                           else value for value in values)
+
+    def flush(self):
+        if not self.values:
+            return
+        if isinstance(self.values, array):
+            self.chunks.append(np.frombuffer(
+                self.values, dtype=self.DTYPES[self.typecode]))
+        else:
+            self.chunks.append(self.values)
+        self.values = self._empty()
+
+    def consolidate(self):
+        """Returns all values of column as one array or list and releases
+        its chunks.
+        """
+        self.flush()
+        chunks, self.chunks = self.chunks, []
+        if all(isinstance(chunk, np.ndarray) for chunk in chunks):
+            return np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        return list(chain.from_iterable(chunks))
+
+
 class DataFrameWriter(Writer):
-    """Writes Anacode API output into pandas.DataFrame instances."""
-    def __init__(self, frames=None):
+    """Writes Anacode API output into pandas.DataFrame instances.
+
+    Rows are not kept as python lists. Each table is buffered column by
+    column, numbers in typed arrays and strings interned, and every
+    *chunk_size* rows the buffers are consolidated into numpy chunks. Intern
+    table is emptied when it holds *max_strings* strings, so it does not
+    grow with every unique text of a large corpus. On
+    close frames are assembled one column at a time so that peak memory
+    stays close to size of the final frames.
+    """
+    def __init__(self, frames=None, chunk_size=100000, categorical=False,
+                 max_strings=100000):
         """Initializes dictionary of result frames. Alternatively uses given
         frames dict for storage.
 
         :param frames: Might be specified to use this instead of new dict
         :type frames: dict
+        :param chunk_size: Number of rows of one table buffered before they
+         are consolidated
+        :type chunk_size: int
+        :param categorical: Store string columns as pandas categoricals
+        :type categorical: bool
+        :param max_strings: Number of distinct strings kept for interning
+        :type max_strings: int
         """
         super(DataFrameWriter, self).__init__()
         self.frames = {} if frames is None else frames
-        self._row_data = {}
+        self.chunk_size = chunk_size
+        self.categorical = categorical
+        self.max_strings = max_strings
+        self._columns = {}
+        self._rows = {}
+        self._strings = {}
 
     def init(self):
-        """Initialized empty lists for each possible data frame."""
-        self._row_data = {
-            'categories': [],
-            'concepts': [],
-            'concepts_surface_strings': [],
-            'sentiments': [],
-            'absa_entities': [],
-            'absa_normalized_texts': [],
-            'absa_relations': [],
-            'absa_relations_entities': [],
-            'absa_evaluations': [],
-            'absa_evaluations_entities': [],
+        """Initializes empty column buffers for each possible data frame."""
+        self._strings = {}
+        self._columns = {
+            name: [_Column(COLUMN_TYPES.get(column, str), self._strings)
+                   for column in columns]
+            for name, columns in HEADERS.items()
         }
+        self._rows = dict.fromkeys(HEADERS, 0)
 
     def close(self):
         """Creates pandas data frames to self.frames dict and clears internal
         state.
         """
-        for name, row in self._row_data.items():
-            if len(row) > 0:
-                self.frames[name] = pd.DataFrame(row, columns=HEADERS[name])
-        self._row_data = {}
+        for name, columns in self._columns.items():
+            if self._rows[name] == 0:
+                continue
+            data = {}
+            for header, column in zip(HEADERS[name], columns):
+                values = column.consolidate()
+                if self.categorical and header not in COLUMN_TYPES:
+                    values = pd.Categorical(values)
+                data[header] = values
+            self.frames[name] = pd.DataFrame(data, columns=HEADERS[name],
+                                             copy=False)
+        self._columns = {}
+        self._rows = {}
+        self._strings = {}
 
     def _add_new_data_from_dict(self, new_data):
         """Stores anacode api result converted to flat lists.
@@ -433,32 +734,113 @@ class DataFrameWriter(Writer):
         :param new_data: list
         """
         for name, row_list in new_data.items():
-            self._row_data[name].extend(row_list)
+            if not row_list:
+                continue
+            columns = self._columns[name]
+            for column, values in zip(columns, zip(*row_list)):
+                column.extend(values)
+            self._rows[name] += len(row_list)
+            if len(self._strings) >= self.max_strings:
+                # columns share the table, already interned values stay
+                self._strings.clear()
+            if len(columns[0].values) >= self.chunk_size:
+                for column in columns:
+                    column.flush()
+
+
+# queued by CSVWriter in background mode to flush files after bulk
+_FLUSH = object()
 
 
 class CSVWriter(Writer):
-    def __init__(self, target_dir='.'):
+    """Writes Anacode API output into csv files, one per table in
+    :data:`HEADERS`.
+
+    In background mode rows are handed over to dedicated writer thread
+    through bounded queue, so slow disk does not stall threads that query
+    the API; they only wait when *queue_size* writes are already pending.
+    Errors of writer thread are raised from the next write, checkpoint or
+    close.
+
+    """
+    FLUSH_POLICIES = ('buffer', 'bulk')
+    supports_resume = True
+
+    def __init__(self, target_dir='.', background=False, queue_size=64,
+                 buffer_size=-1, flush_policy='buffer', fsync=False,
+                 append=False):
         """Initializes Writer to store Anacode API analysis results in target_dir in
         csv files.
 
         :param target_dir: Path to directory where to store csv files
         :type target_dir: str
+        :param background: Write rows in separate thread
+        :type background: bool
+        :param queue_size: Maximum number of writes waiting for writer
+         thread in background mode
+        :type queue_size: int
+        :param buffer_size: Size of buffer of every csv file in bytes, -1
+         for default size
+        :type buffer_size: int
+        :param flush_policy: 'buffer' to write file contents to disk when its
+         buffer is full, 'bulk' to also flush all files after every
+         written bulk
+        :type flush_policy: str
+        :param fsync: Make operating system write flushed files to disk
+        :type fsync: bool
+        :param append: Append to csv files from previous runs instead of
+         backing them up, document ids continue after the highest one
+         already written
+        :type append: bool
         """
+        if flush_policy not in self.FLUSH_POLICIES:
+            raise ValueError('Unknown flush policy "{}", use one of: {}'
+                             .format(flush_policy,
+                                     ', '.join(self.FLUSH_POLICIES)))
         super(CSVWriter, self).__init__()
         self.target_dir = os.path.abspath(os.path.expanduser(target_dir))
+        self.background = background
+        self.queue_size = queue_size
+        self.buffer_size = buffer_size
+        self.flush_policy = flush_policy
+        self.fsync = fsync
+        self.append = append
         self._files = {}
+        self._sizes = None
+        self._queue = None
+        self._thread = None
+        self._error = None
         self.csv = {}
 
-    def _open_csv(self, csv_name):
+    def _open_csv(self, csv_name, mode='w'):
         path = partial(os.path.join, self.target_dir)
         try:
-            return open(path(csv_name), 'w', newline='')
+            return open(path(csv_name), mode, self.buffer_size, newline='')
         except TypeError:
-            return open(path(csv_name), 'wb')
+            return open(path(csv_name), mode + 'b', self.buffer_size)
 
     def init(self):
-        """Opens all csv files for writing and writes headers to them."""
+        """Opens all csv files for writing and writes headers to them. If
+        writer was restored from checkpoint existing files are truncated to
+        their checkpointed size and opened for appending instead. In append
+        mode existing files are opened for appending and document ids
+        continue after the last one found in them.
+        """
         self.close()
+        if self._sizes is not None:
+            self._init_restored()
+        elif self.append:
+            self._init_appended()
+        else:
+            self._init_new()
+        if self.background:
+            self._queue = Queue(self.queue_size)
+            self._thread = threading.Thread(target=self._write_queued,
+                                            name='CSVWriter')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _init_new(self):
         backup(self.target_dir, chain.from_iterable(CSV_FILES.values()))
 
         self._files = {
@@ -485,6 +867,165 @@ class CSVWriter(Writer):
         for name, writer in self.csv.items():
             writer.writerow(HEADERS[name])
 
+    def _init_appended(self):
+        self._files, self.csv = {}, {}
+        last_id = -1
+        for name in HEADERS:
+            file_name = name + '.csv'
+            path = os.path.join(self.target_dir, file_name)
+            if os.path.isfile(path):
+                self._drop_incomplete_row(path, len(HEADERS[name]))
+            if os.path.isfile(path) and os.path.getsize(path):
+                row = last_csv_row(path)
+                if row and row != HEADERS[name]:
+                    last_id = max(last_id, int(row[0]))
+                self._files[name] = self._open_csv(file_name, 'a')
+                self.csv[name] = csv.writer(self._files[name])
+            else:
+                self._files[name] = self._open_csv(file_name)
+                self.csv[name] = csv.writer(self._files[name])
+                self.csv[name].writerow(HEADERS[name])
+        self.ids['analyze'] = last_id + 1
+
+    @staticmethod
+    def _drop_incomplete_row(path, columns, block_size=2 ** 16):
+        """Truncates row that was not completely written when previous run
+        was killed. Incomplete row starts at the last line break that is
+        followed by document id or its cut digits and preceded by complete
+        row; row boundaries are found by quote parity as in
+        :func:`last_csv_row`.
+        """
+        with open(path, 'r+b') as fp:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            read = min(size, block_size)
+            while True:
+                fp.seek(size - read)
+                tail = fp.read(read)
+                whole = read == size
+                if _ends_with_row(tail, columns, whole):
+                    return
+                position = len(tail)
+                while True:
+                    newline = tail.rfind(b'\n', 0, position)
+                    if newline < 0:
+                        break
+                    position = newline
+                    if re.match(br'\d+,|\d*\r?$', tail[newline + 1:]) and \
+                            _ends_with_row(tail[:newline + 1], columns,
+                                           whole):
+                        fp.truncate(size - read + newline + 1)
+                        return
+                if whole:
+                    raise ValueError('No complete row found in {}'
+                                     .format(path))
+                read = min(size, read * 2)
+
+    def _init_restored(self):
+        self._files, self.csv = {}, {}
+        for name in HEADERS:
+            file_name = name + '.csv'
+            path = os.path.join(self.target_dir, file_name)
+            size = self._sizes.get(name, 0)
+            if size and os.path.isfile(path):
+                with open(path, 'r+b') as fp:
+                    fp.truncate(size)
+                self._files[name] = self._open_csv(file_name, 'a')
+                self.csv[name] = csv.writer(self._files[name])
+            else:
+                self._files[name] = self._open_csv(file_name)
+                self.csv[name] = csv.writer(self._files[name])
+                self.csv[name].writerow(HEADERS[name])
+        self._sizes = None
+
+    def _write_queued(self):
+        """Body of writer thread. After first error remaining writes are only
+        taken from queue so that producers never block on it.
+        """
+        while True:
+            new_data = self._queue.get()
+            try:
+                if new_data is None:
+                    return
+                if self._error is not None:
+                    continue
+                if new_data is _FLUSH:
+                    self._flush_files()
+                else:
+                    self._write_rows(new_data)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def wait(self):
+        """Blocks until all rows queued in background mode are written."""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def flush(self):
+        """Writes buffers of all csv files to operating system, and to disk
+        if writer was created with *fsync*. Queued rows are written first.
+        """
+        self.wait()
+        self._flush_files()
+
+    def _flush_files(self):
+        for fp in self._files.values():
+            fp.flush()
+            if self.fsync:
+                os.fsync(fp.fileno())
+
+    def write_bulk(self, results):
+        super(CSVWriter, self).write_bulk(results)
+        self._flush_bulk()
+
+    def write_flattened(self, new_data, ids):
+        super(CSVWriter, self).write_flattened(new_data, ids)
+        self._flush_bulk()
+
+    def _flush_bulk(self):
+        if self.flush_policy != 'bulk':
+            return
+        if self._queue is not None:
+            self._submit(_FLUSH)
+        else:
+            self._flush_files()
+
+    def _submit(self, new_data):
+        self._raise_error()
+        self._queue.put(new_data)
+
+    def checkpoint(self, force=False):
+        """Flushes all csv files and records their sizes together with
+        document ids. Checkpoint is never postponed.
+
+        :return: dict -- Json serializable writer state
+        """
+        self.wait()
+        state = super(CSVWriter, self).checkpoint(force)
+        state['sizes'] = {}
+        for name, fp in self._files.items():
+            fp.flush()
+            os.fsync(fp.fileno())
+            state['sizes'][name] = os.fstat(fp.fileno()).st_size
+        return state
+
+    def restore(self, state):
+        """Prepares writer to append to csv files from previous run. Rows
+        written after the checkpoint are dropped when files are reopened.
+
+        :param state: Writer state returned by :meth:`checkpoint`
+        :type state: dict
+        """
+        super(CSVWriter, self).restore(state)
+        self._sizes = dict(state.get('sizes', {}))
+
     def _csv_has_content(self, csv_path):
         if not os.path.isfile(csv_path):
             return False
@@ -496,7 +1037,17 @@ class CSVWriter(Writer):
         return False
 
     def close(self):
-        """Closes all csv files and removes empty ones."""
+        """Writes rows that are still queued, closes all csv files and removes
+        empty ones.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+        error, self._error = self._error, None
+        if self.fsync and error is None:
+            self._flush_files()
         for name, file in self._files.items():
             try:
                 file.close()
@@ -511,12 +1062,405 @@ class CSVWriter(Writer):
 
         self._files = {}
         self.csv = {}
+        if error is not None:
+            raise error
 
     def _add_new_data_from_dict(self, new_data):
-        """Stores anacode api result converted to flat lists.
+        """Stores anacode api result converted to flat lists. In background
+        mode they are only queued for writer thread.
 
         :param new_data: Anacode api result
         :param new_data: list
         """
+        if self._queue is not None:
+            self._submit(new_data)
+        else:
+            self._write_rows(new_data)
+
+    def _write_rows(self, new_data):
         for name, row_list in new_data.items():
             self.csv[name].writerows(row_list)
+
+
+class ParquetWriter(Writer):
+    """Writes Anacode API output into parquet files, one per table in
+    :data:`HEADERS`. Rows are buffered column by column as in
+    :class:`DataFrameWriter`, numbers in typed arrays that are handed to
+    arrow without conversion and strings interned, and written as row groups
+    once *row_group_size* rows are collected, so memory use does not grow
+    with size of the output. String columns are dictionary encoded.
+
+    Parquet file is readable only after it is closed, so every
+    :meth:`checkpoint` finishes open files and next rows of each table go to
+    new part, see :func:`parquet_parts`. Restored writer keeps parts
+    finished before the checkpoint and removes later ones. To keep parts
+    from getting small, checkpoint is postponed until *checkpoint_rows* rows
+    of some table were written since the previous one. Analyzer with journal
+    records progress only with checkpoints, so after a crash it repeats at
+    most that many rows worth of tasks.
+
+    Needs optional pyarrow dependency.
+
+    """
+    supports_resume = True
+
+    def __init__(self, target_dir='.', row_group_size=100000,
+                 compression='snappy', checkpoint_rows=None):
+        """
+
+        :param target_dir: Path to directory where to store parquet files
+        :type target_dir: str
+        :param row_group_size: Number of rows of one table buffered before
+         they are written as row group
+        :type row_group_size: int
+        :param compression: Parquet compression codec, for example 'snappy',
+         'gzip', 'zstd' or None
+        :type compression: str
+        :param checkpoint_rows: Minimum number of rows of one table written
+         between checkpoints, defaults to *row_group_size*
+        :type checkpoint_rows: int
+        """
+        if pyarrow is None:
+            raise ImportError('ParquetWriter requires pyarrow. Install it '
+                              'with "pip install anacode[parquet]".')
+        super(ParquetWriter, self).__init__()
+        self.target_dir = os.path.abspath(os.path.expanduser(target_dir))
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.checkpoint_rows = checkpoint_rows or row_group_size
+        self._columns = {}
+        self._strings = {}
+        self._files = {}
+        self._parts = {}
+        self._part_rows = {}
+        self._restored = None
+
+    @staticmethod
+    def schema(name):
+        """Returns arrow schema of table *name*.
+
+        :param name: Table name, key of :data:`HEADERS`
+        :type name: str
+        :return: :class:`pyarrow.Schema` --
+        """
+        types = {int: pyarrow.int64(), float: pyarrow.float64(),
+                 bool: pyarrow.bool_(), str: pyarrow.string()}
+        return pyarrow.schema([
+            (column, types[COLUMN_TYPES.get(column, str)])
+            for column in HEADERS[name]])
+
+    def init(self):
+        """Backs up parquet files from previous run and prepares empty
+        column buffers. If writer was restored from checkpoint, parts
+        finished before it are kept instead and later ones are removed.
+        """
+        self.close()
+        if self._restored is not None:
+            self._parts, self._restored = self._restored, None
+            for name in HEADERS:
+                for part, path in parquet_parts(self.target_dir, name):
+                    if part >= self._parts.get(name, 0):
+                        os.unlink(path)
+        else:
+            self._parts = {}
+            backup(self.target_dir, [
+                os.path.basename(path) for name in HEADERS
+                for _, path in parquet_parts(self.target_dir, name)])
+        self._strings = {}
+        self._columns = {
+            name: [_Column(COLUMN_TYPES.get(column, str), self._strings)
+                   for column in columns]
+            for name, columns in HEADERS.items()
+        }
+        self._part_rows = {}
+
+    def _array(self, values, field):
+        try:
+            return pyarrow.array(values, type=field.type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            if field.type != pyarrow.string():
+                raise
+            return pyarrow.array([v if v is None else str(v)
+                                  for v in values], type=field.type)
+
+    def _flush(self, name):
+        columns = self._columns[name]
+        if not columns[0].values:
+            return
+        schema = self.schema(name)
+        table = pyarrow.Table.from_arrays(
+            [self._array(column.consolidate(), field)
+             for column, field in zip(columns, schema)], schema=schema)
+        if name not in self._files:
+            strings = [field.name for field in schema
+                       if field.type == pyarrow.string()]
+            self._files[name] = pyarrow.parquet.ParquetWriter(
+                self._part_path(name), schema,
+                compression=self.compression, use_dictionary=strings)
+        self._files[name].write_table(table)
+        # buffered strings are written, interning them further only keeps
+        # memory
+        self._strings.clear()
+
+    def _part_path(self, name):
+        part = self._parts.get(name, 0)
+        if part:
+            file_name = '{}.{}.parquet'.format(name, part)
+        else:
+            file_name = name + '.parquet'
+        return os.path.join(self.target_dir, file_name)
+
+    def _finish_files(self, sync=False):
+        """Writes buffered rows and closes open parts."""
+        for name in list(self._columns):
+            self._flush(name)
+        for name, file in self._files.items():
+            file.close()
+            if sync:
+                with open(self._part_path(name), 'rb') as fp:
+                    os.fsync(fp.fileno())
+            self._parts[name] = self._parts.get(name, 0) + 1
+        self._files = {}
+        self._part_rows = {}
+
+    def checkpoint(self, force=False):
+        """Finishes all open parquet files and records number of parts of
+        each table together with document ids. Checkpoint is postponed
+        until *checkpoint_rows* rows of some table were written since the
+        previous one.
+
+        :param force: Checkpoint even if fewer rows were written
+        :type force: bool
+        :return: dict -- Json serializable writer state or None if
+         checkpoint was postponed
+        """
+        if not force and max([0] + list(self._part_rows.values())) < \
+                self.checkpoint_rows:
+            return None
+        self._finish_files(sync=True)
+        state = super(ParquetWriter, self).checkpoint(force)
+        state['parts'] = dict(self._parts)
+        return state
+
+    def restore(self, state):
+        """Prepares writer to continue writing after parts finished at
+        checkpoint.
+
+        :param state: Writer state returned by :meth:`checkpoint`
+        :type state: dict
+        """
+        super(ParquetWriter, self).restore(state)
+        self._restored = dict(state.get('parts', {}))
+
+    def close(self):
+        """Writes buffered rows and closes all parquet files. Files are
+        created only for tables that have some rows.
+        """
+        self._finish_files()
+        self._columns = {}
+        self._strings = {}
+
+    def _add_new_data_from_dict(self, new_data):
+        """Stores anacode api result converted to flat lists.
+
+        :param new_data: Anacode api result
+        :param new_data: list
+        """
+        for name, row_list in new_data.items():
+            if not row_list:
+                continue
+            columns = self._columns[name]
+            for column, values in zip(columns, zip(*row_list)):
+                column.extend(values)
+            self._part_rows[name] = self._part_rows.get(name, 0) + \
+                len(row_list)
+            if len(columns[0].values) >= self.row_group_size:
+                self._flush(name)
+
+
+class SQLiteWriter(Writer):
+    """Writes Anacode API output into single sqlite database with one table
+    per entry in :data:`HEADERS`. Rows of every written bulk are inserted in
+    one transaction. Tables are indexed by document id and text order and
+    concept and entity tables by concept and entity name as well, so the
+    database can be queried without loading it into memory; see
+    :meth:`anacode.agg.DatasetLoader.from_sqlite`.
+
+    """
+    SQL_TYPES = {int: 'INTEGER', float: 'REAL', bool: 'INTEGER',
+                 str: 'TEXT'}
+    supports_resume = True
+
+    def __init__(self, path='anacode.db'):
+        """
+
+        :param path: Path to database file
+        :type path: str
+        """
+        super(SQLiteWriter, self).__init__()
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._db = None
+        self._rows = None
+        self._in_transaction = False
+
+    @classmethod
+    def create_table_sql(cls, name):
+        """Returns statement creating table *name*.
+
+        :param name: Table name, key of :data:`HEADERS`
+        :type name: str
+        :return: str --
+        """
+        columns = ', '.join(
+            '{} {}'.format(column, cls.SQL_TYPES[COLUMN_TYPES.get(column,
+                                                                  str)])
+            for column in HEADERS[name])
+        return 'CREATE TABLE IF NOT EXISTS {} ({})'.format(name, columns)
+
+    def init(self):
+        """Backs up database from previous run and creates empty tables. If
+        writer was restored from checkpoint the database is reopened instead
+        and rows written after the checkpoint are deleted.
+        """
+        self.close()
+        if self._rows is None:
+            self._backup()
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        for name in HEADERS:
+            self._db.execute(self.create_table_sql(name))
+        if self._rows is not None:
+            self._db.execute('BEGIN')
+            for name in HEADERS:
+                self._db.execute('DELETE FROM {} WHERE rowid > ?'.format(name),
+                                 (self._rows.get(name, 0),))
+            self._db.execute('COMMIT')
+            self._rows = None
+
+    def _backup(self):
+        """Moves database of previous run to backup. Rows committed to
+        write-ahead log of database that was not closed are checkpointed into
+        the database file first, otherwise they would stay in -wal file left
+        behind by the rename.
+        """
+        if os.path.isfile(self.path):
+            db = sqlite3.connect(self.path)
+            try:
+                db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            finally:
+                db.close()
+        name = os.path.basename(self.path)
+        backup(os.path.dirname(self.path),
+               [name, name + '-wal', name + '-shm'])
+
+    def _begin(self):
+        if not self._in_transaction:
+            self._db.execute('BEGIN')
+            self._in_transaction = True
+
+    def _commit(self):
+        if self._in_transaction:
+            self._db.execute('COMMIT')
+            self._in_transaction = False
+
+    def _rollback(self):
+        if self._in_transaction:
+            self._db.execute('ROLLBACK')
+            self._in_transaction = False
+
+    @contextmanager
+    def _bulk_transaction(self):
+        """Commits rows of a bulk only if all of them were stored. Failed
+        bulk is rolled back and document ids it took are released.
+        """
+        ids = dict(self.ids)
+        self._begin()
+        try:
+            yield
+        except Exception:
+            self._rollback()
+            self.ids = ids
+            raise
+        else:
+            self._commit()
+
+    def write_bulk(self, results):
+        """Stores multiple results in one transaction.
+
+        :param results: List of tuples (call_type, call_result)
+        :type results: list
+        """
+        with self._bulk_transaction():
+            super(SQLiteWriter, self).write_bulk(results)
+
+    def write_flattened(self, new_data, ids):
+        """Stores rows flattened by worker process in one transaction. See
+        :meth:`Writer.write_flattened`.
+        """
+        with self._bulk_transaction():
+            super(SQLiteWriter, self).write_flattened(new_data, ids)
+
+    def _add_new_data_from_dict(self, new_data):
+        """Stores anacode api result converted to flat lists.
+
+        :param new_data: Anacode api result
+        :param new_data: list
+        """
+        for name, row_list in new_data.items():
+            if not row_list:
+                continue
+            placeholders = ', '.join('?' * len(HEADERS[name]))
+            self._db.executemany(
+                'INSERT INTO {} VALUES ({})'.format(name, placeholders),
+                row_list)
+
+    def create_indexes(self):
+        """Creates indexes of all tables if they do not exist yet."""
+        for name in HEADERS:
+            indexes = [[u'doc_id', u'text_order']]
+            indexes += [[column] for column in SQLITE_INDEXES.get(name, [])]
+            for columns in indexes:
+                self._db.execute(
+                    'CREATE INDEX IF NOT EXISTS {table}_{name} '
+                    'ON {table} ({columns})'.format(
+                        table=name, name='_'.join(columns),
+                        columns=', '.join(columns)))
+
+    def checkpoint(self, force=False):
+        """Commits written rows and records number of rows in every table
+        together with document ids. Checkpoint is never postponed.
+
+        :return: dict -- Json serializable writer state
+        """
+        self._commit()
+        state = super(SQLiteWriter, self).checkpoint(force)
+        state['rows'] = {}
+        for name in HEADERS:
+            count, = self._db.execute(
+                'SELECT COALESCE(MAX(rowid), 0) FROM {}'.format(name)).fetchone()
+            state['rows'][name] = count
+        return state
+
+    def restore(self, state):
+        """Prepares writer to continue in database from previous run. Rows
+        written after the checkpoint are deleted when database is reopened.
+
+        :param state: Writer state returned by :meth:`checkpoint`
+        :type state: dict
+        """
+        super(SQLiteWriter, self).restore(state)
+        self._rows = dict(state.get('rows', {}))
+
+    def close(self):
+        """Commits remaining rows, creates indexes and closes database.
+        Indexes are built once at the end because that is faster than
+        updating them with every insert.
+        """
+        if self._db is None:
+            return
+        self._commit()
+        self.create_indexes()
+        self._db.close()
+        self._db = None
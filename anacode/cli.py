@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Command line interface for bulk analysis with Anacode API.
+
+Example::
+
+    anacode analyze reviews.jsonl -a concepts,absa -o output --threads 8
+
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+from anacode.api import client
+from anacode.api import cache
+from anacode.api import limits
+from anacode.api import retry
+from anacode.api import writers
+from anacode.api.client import MAX_REQUEST_BYTES_SIZE, ANACODE_API_URL
+
+
+ANALYSES = ('categories', 'concepts', 'sentiment', 'absa')
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+def _csv_writer(output):
+    return writers.CSVWriter(output)
+
+
+def _parquet_writer(output):
+    return writers.ParquetWriter(output)
+
+
+def _sqlite_writer(output):
+    return writers.SQLiteWriter(os.path.join(output, 'anacode.db'))
+
+
+# output writers selectable with --writer; parquet needs pyarrow
+WRITERS = {
+    'csv': _csv_writer,
+    'sqlite': _sqlite_writer,
+}
+if writers.pyarrow is not None:
+    WRITERS['parquet'] = _parquet_writer
+
+
+def _analyses(value):
+    analyses = [a.strip() for a in value.split(',') if a.strip()]
+    unknown = set(analyses) - set(ANALYSES)
+    if not analyses or unknown:
+        raise argparse.ArgumentTypeError(
+            'choose from {}'.format(', '.join(ANALYSES)))
+    return analyses
+
+
+def _format_bytes(count):
+    for unit in ('B', 'kB', 'MB'):
+        if count < 1000:
+            return '{:.1f} {}'.format(count, unit)
+        count /= 1000.
+    return '{:.1f} GB'.format(count)
+
+
+def _format_latency(seconds):
+    return '-' if seconds is None else '{:.0f} ms'.format(seconds * 1000)
+
+
+class ProgressReporter(object):
+    """Periodically prints throughput of running analyzer."""
+    def __init__(self, analyzer, interval=1., stream=None):
+        """
+
+        :param analyzer: Analyzer whose progress is reported
+        :type analyzer: :class:`anacode.api.client.Analyzer`
+        :param interval: Seconds between reports; zero disables live
+         reporting, only final summary is printed then
+        :type interval: float
+        :param stream: Where to print reports, defaults to standard error
+        """
+        self.analyzer = analyzer
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self._start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start = time.time()
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stream.write(self.summary() + '\n')
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.stream.write('\r' + self.summary())
+            self.stream.flush()
+
+    def summary(self):
+        """Formats current throughput.
+
+        :return: str -- One line summary
+        """
+        elapsed = max(time.time() - self._start, 1e-9)
+        transfer = self.analyzer.client.transfer
+        stats = transfer.as_dict()
+        docs = self.analyzer.writer.ids['analyze']
+        return ('{docs} docs, {rate:.1f} docs/s, {bytes}/s sent, '
+                'p50 {p50}, p99 {p99}, {retries} retries, '
+                '{elapsed:.0f} s').format(
+            docs=docs, rate=docs / elapsed,
+            bytes=_format_bytes(stats['sent_bytes'] / elapsed),
+            p50=_format_latency(transfer.latency_percentile(50)),
+            p99=_format_latency(transfer.latency_percentile(99)),
+            retries=stats['retries'], elapsed=elapsed)
+
+
+def _make_cache(path, max_size, ttl):
+    if path is None:
+        return None
+    if path.endswith(SQLITE_EXTENSIONS):
+        return cache.SQLiteCache(path, max_size=max_size, ttl=ttl)
+    return cache.DirectoryCache(path, max_size=max_size, ttl=ttl)
+
+
+def analyze(args):
+    """Runs bulk analysis configured by parsed command line *args*.
+
+    :return: int -- Exit code
+    """
+    if not args.token:
+        sys.stderr.write('API token is missing; use --token or set '
+                         'ANACODE_TOKEN environment variable\n')
+        return 2
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    journal = args.journal
+    if args.resume and journal is None:
+        journal = os.path.join(args.output, 'journal.jsonl')
+    rate_limiter = None
+    if args.requests_per_second or args.chars_per_second:
+        rate_limiter = limits.RateLimiter(
+            requests_per_second=args.requests_per_second,
+            chars_per_second=args.chars_per_second)
+    limiter = None
+    if args.adaptive:
+        limiter = limits.AIMDLimiter(initial_limit=min(args.threads,
+                                                       args.adaptive),
+                                     max_limit=args.adaptive)
+    responses = _make_cache(args.cache, args.cache_size, args.cache_ttl)
+
+    try:
+        api = client.analyzer(
+            args.token, WRITERS[args.writer](args.output),
+            threads=args.threads,
+            bulk_size=args.bulk_size, base_url=args.url,
+            pipeline=args.pipeline, limiter=limiter,
+            rate_limiter=rate_limiter,
+            retry_policy=retry.RetryPolicy(max_retries=args.max_retries),
+            ignore_errors=args.ignore_errors, utf8=args.utf8,
+            compression=args.compression, cache=responses,
+            deduplicate=args.deduplicate, journal=journal,
+            reorder=args.reorder, processes=args.processes)
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return 2
+    reporter = ProgressReporter(api, args.progress_interval)
+    reporter.start()
+    try:
+        with api:
+            for source in args.inputs:
+                api.analyze_stream(source, args.analyses,
+                                   max_size=args.max_size,
+                                   format=args.format, field=args.field,
+                                   encoding=args.encoding)
+    except KeyboardInterrupt:
+        sys.stderr.write('\nInterrupted')
+        if journal is not None:
+            sys.stderr.write('; run again with the same options to resume')
+        sys.stderr.write('\n')
+        return 130
+    finally:
+        reporter.stop()
+        if responses is not None:
+            responses.close()
+    if api.failed:
+        sys.stderr.write('{} requests failed\n'.format(len(api.failed)))
+    return 0
+
+
+def build_parser():
+    """Creates command line argument parser.
+
+    :return: :class:`argparse.ArgumentParser` --
+    """
+    parser = argparse.ArgumentParser(
+        prog='anacode', description='Anacode API command line tools')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser(
+        'analyze', help='analyze texts from files in bulk',
+        description='Analyzes texts from files or standard input and stores '
+                    'results in csv or parquet files or sqlite database.')
+    command.set_defaults(run=analyze)
+    command.add_argument('inputs', nargs='+', metavar='INPUT',
+                         help='text, json lines or csv file with texts, '
+                              '"-" reads standard input')
+    command.add_argument('-a', '--analyses', type=_analyses, required=True,
+                         help='comma separated analyses: ' +
+                              ', '.join(ANALYSES))
+    command.add_argument('-o', '--output', default='.',
+                         help='output directory (default: %(default)s)')
+    command.add_argument('-w', '--writer', choices=sorted(WRITERS),
+                         default='csv',
+                         help='output format; sqlite writes anacode.db in '
+                              'output directory (default: %(default)s)')
+    command.add_argument('--token', default=os.getenv('ANACODE_TOKEN'),
+                         help='API token (default: $ANACODE_TOKEN)')
+    command.add_argument('--url', default=ANACODE_API_URL,
+                         help='API server URL (default: %(default)s)')
+
+    source = command.add_argument_group('input')
+    source.add_argument('--format', choices=('text', 'jsonl', 'csv'),
+                        help='input format (default: by file extension)')
+    source.add_argument('--field', default='text',
+                        help='json attribute or csv column with text '
+                             '(default: %(default)s)')
+    source.add_argument('--encoding', default='utf-8',
+                        help='input encoding (default: %(default)s)')
+
+    tuning = command.add_argument_group('throughput')
+    tuning.add_argument('-t', '--threads', type=int, default=4,
+                        help='concurrent requests (default: %(default)s)')
+    tuning.add_argument('--adaptive', type=int, metavar='MAX',
+                        help='adapt concurrency to server load up to MAX '
+                             'requests')
+    tuning.add_argument('-b', '--bulk-size', type=int, default=100,
+                        help='requests per written bulk '
+                             '(default: %(default)s)')
+    tuning.add_argument('--max-size', type=int,
+                        default=MAX_REQUEST_BYTES_SIZE,
+                        help='maximum request size in bytes '
+                             '(default: %(default)s)')
+    tuning.add_argument('--pipeline', action='store_true',
+                        help='write results while next bulk is analyzed')
+    tuning.add_argument('--reorder', action='store_true',
+                        help='do not wait for slowest request of each bulk')
+    tuning.add_argument('--processes', type=int,
+                        help='decode and flatten results in worker processes')
+    tuning.add_argument('--utf8', action='store_true',
+                        help='send UTF-8 encoded requests')
+    tuning.add_argument('--compression', choices=('gzip', 'deflate'),
+                        help='compress requests')
+    tuning.add_argument('--deduplicate', action='store_true',
+                        help='send duplicate texts only once per bulk')
+
+    limit = command.add_argument_group('limits and errors')
+    limit.add_argument('--requests-per-second', type=float,
+                       help='maximum request rate')
+    limit.add_argument('--chars-per-second', type=float,
+                       help='maximum rate of analyzed characters')
+    limit.add_argument('--max-retries', type=int, default=3,
+                       help='retries of failed request (default: %(default)s)')
+    limit.add_argument('--ignore-errors', action='store_true',
+                       help='skip requests that fail after all retries')
+
+    state = command.add_argument_group('cache and resume')
+    state.add_argument('--cache', metavar='PATH',
+                       help='response cache; sqlite database if PATH ends '
+                            'with .db or .sqlite, directory otherwise')
+    state.add_argument('--cache-size', type=int, metavar='BYTES',
+                       help='maximum cache size')
+    state.add_argument('--cache-ttl', type=float, metavar='SECONDS',
+                       help='cache entry lifetime')
+    state.add_argument('--resume', action='store_true',
+                       help='keep journal in output directory and continue '
+                            'interrupted run')
+    state.add_argument('--journal', metavar='PATH',
+                       help='journal file, implies --resume')
+
+    command.add_argument('--progress-interval', type=float, default=1.,
+                         metavar='SECONDS',
+                         help='live progress refresh, 0 prints only summary '
+                              '(default: %(default)s)')
+    return parser
+
+
+def main(argv=None):
+    """Entry point of anacode command."""
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
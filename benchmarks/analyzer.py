@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""End-to-end throughput benchmark of :class:`anacode.api.client.Analyzer`.
+
+Every writer analyzes the same synthetic texts against local mock server, so
+results do not depend on network or API quota. Each case runs in fresh
+process and reports documents per second, peak resident memory and time
+breakdown collected by observers. Mock server runs in its own process, so it
+neither competes with the analyzer for the interpreter lock nor adds to its
+peak memory.
+
+Example::
+
+    python -m benchmarks.analyzer --docs 20000 --threads 8 --latency 0.05 \\
+        --analyses concepts,absa --writers null,dataframe,csv
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from anacode.api import client
+from anacode.api import writers
+from anacode.api import mockserver
+from anacode.api import observers
+
+
+CHARACTERS = u'安全性能很好帅气车辆空间舒适价格便宜质量服务外观动力油耗'
+
+
+def make_texts(count, length=60, seed=0):
+    """Generates *count* pseudo-random chinese texts of about *length*
+    characters.
+    """
+    rnd = random.Random(seed)
+    for _ in range(count):
+        size = rnd.randint(length // 2, length * 3 // 2)
+        yield u''.join(rnd.choice(CHARACTERS) for _ in range(size))
+
+
+def _null_writer(directory):
+    return writers.Writer()
+
+
+def _dataframe_writer(directory):
+    return writers.DataFrameWriter()
+
+
+def _csv_writer(directory):
+    return writers.CSVWriter(directory)
+
+
+def _csv_background_writer(directory):
+    return writers.CSVWriter(directory, background=True,
+                             buffer_size=2 ** 20)
+
+
+def _sqlite_writer(directory):
+    return writers.SQLiteWriter(os.path.join(directory, 'anacode.db'))
+
+
+def _parquet_writer(directory):
+    return writers.ParquetWriter(directory)
+
+
+WRITERS = {
+    'null': _null_writer,
+    'dataframe': _dataframe_writer,
+    'csv': _csv_writer,
+    'csv-background': _csv_background_writer,
+    'sqlite': _sqlite_writer,
+}
+if writers.pyarrow is not None:
+    WRITERS['parquet'] = _parquet_writer
+
+
+def _peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak * 1024 if sys.platform != 'darwin' else peak
+
+
+def _serve(options, urls, stop):
+    """Runs mock server until *stop* is set. Server's url is put to *urls*
+    once it accepts requests.
+    """
+    server = mockserver.MockServer(latency=options.latency,
+                                   error_rate=options.error_rate,
+                                   payload_size=options.payload_size,
+                                   seed=options.seed)
+    with server:
+        urls.put(server.url)
+        stop.wait()
+
+
+def start_server(options):
+    """Starts mock server in separate process.
+
+    :param options: Parsed command line options
+    :return: tuple -- Server process, its url and event that stops it
+    """
+    urls = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=_serve,
+                                      args=(options, urls, stop))
+    process.daemon = True
+    process.start()
+    return process, urls.get(), stop
+
+
+def run_case(writer_name, options):
+    """Runs analyzer of one benchmark case in current process against mock
+    server running in separate process.
+
+    :param writer_name: Key of :data:`WRITERS`
+    :type writer_name: str
+    :param options: Parsed command line options
+    :return: dict -- Measured numbers
+    """
+    directory = tempfile.mkdtemp(prefix='anacode-bench-')
+    metrics = observers.MetricsCollector()
+    server, url, stop = start_server(options)
+    try:
+        writer = WRITERS[writer_name](directory)
+        api = client.analyzer(
+            'token', writer, threads=options.threads,
+            bulk_size=options.bulk_size, base_url=url,
+            pipeline=options.pipeline, reorder=options.reorder,
+            processes=options.processes, utf8=options.utf8,
+            compression=options.compression, observers=[metrics])
+        start = time.time()
+        with api:
+            docs = api.analyze_stream(
+                make_texts(options.docs, options.length, options.seed),
+                options.analyses, max_size=options.max_size)
+        elapsed = time.time() - start
+    finally:
+        stop.set()
+        server.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    summary = metrics.summary()
+    return {
+        'writer': writer_name,
+        'docs': docs,
+        'seconds': elapsed,
+        'docs_per_second': docs / elapsed if elapsed else 0.,
+        'peak_memory': _peak_memory(),
+        'latency': summary['latency'],
+        'counters': summary['counters'],
+        'times': summary['times'],
+    }
+
+
+def _run_in_child(writer_name, options, results):
+    results.put(run_case(writer_name, options))
+
+
+def run_isolated(writer_name, options):
+    """Runs benchmark case in new process so that peak memory of one case
+    does not affect the others.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_in_child,
+                                      args=(writer_name, options, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def _format_row(result):
+    memory = result['peak_memory']
+    times = result['times']
+    return ('{writer:<14} {docs:>8} {docs_per_second:>10.1f} {memory:>10} '
+            '{p50:>8.1f} {p99:>8.1f} {decode:>8.2f} {flatten:>8.2f} '
+            '{write:>8.2f}').format(
+        memory='-' if memory is None else '{:.1f}'.format(memory / 1e6),
+        p50=(result['latency']['p50'] or 0) * 1000,
+        p99=(result['latency']['p99'] or 0) * 1000,
+        decode=times['decode'], flatten=times['flatten'],
+        write=times['write'], **result)
+
+
+HEADER = ('{:<14} {:>8} {:>10} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+    'writer', 'docs', 'docs/s', 'peak MB', 'p50 ms', 'p99 ms', 'decode s',
+    'flatten s', 'write s'))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Measures analyzer throughput against local mock server.')
+    parser.add_argument('--docs', type=int, default=5000,
+                        help='number of analyzed texts (default: %(default)s)')
+    parser.add_argument('--length', type=int, default=60,
+                        help='average text length (default: %(default)s)')
+    parser.add_argument('--analyses', default='concepts,absa',
+                        type=lambda value: value.split(','),
+                        help='comma separated analyses (default: %(default)s)')
+    parser.add_argument('--writers', default=','.join(sorted(WRITERS)),
+                        type=lambda value: value.split(','),
+                        help='comma separated writers (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--bulk-size', type=int, default=100)
+    parser.add_argument('--max-size', type=int,
+                        default=client.MAX_REQUEST_BYTES_SIZE // 10,
+                        help='maximum request size (default: %(default)s)')
+    parser.add_argument('--pipeline', action='store_true')
+    parser.add_argument('--reorder', action='store_true')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--utf8', action='store_true')
+    parser.add_argument('--compression', choices=('gzip', 'deflate'))
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='mock server latency (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='fraction of failing requests')
+    parser.add_argument('--payload-size', type=int, default=1,
+                        help='multiplier of result sizes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as json lines')
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    unknown = set(options.writers) - set(WRITERS)
+    if unknown:
+        sys.stderr.write('Unknown writers: {}\n'.format(', '.join(unknown)))
+        return 2
+    if not options.json:
+        print(HEADER)
+    for writer_name in options.writers:
+        result = run_isolated(writer_name, options)
+        if options.json:
+            print(json.dumps(result))
+        else:
+            print(_format_row(result))
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
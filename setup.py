@@ -12,9 +12,17 @@ setup(
     license='BSD-3-Clause',
     keywords=['anacode', 'nlp', 'chinese'],
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['anacode=anacode.cli:main'],
+    },
     install_requires=['requests', 'pandas', 'seaborn', 'matplotlib',
                       'wordcloud', 'pillow', 'nltk'],
+    extras_require={
+        'async': ['aiohttp'],
+        'json': ['orjson'],
+        'parquet': ['pyarrow'],
+    },
     tests_require=['pytest', 'mock', 'pytest-mock', 'freezegun', 'notebook',
-                   'ipywidgets'],
+                   'ipywidgets', 'aiohttp'],
     classifiers=[],
 )
@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
+import json
 import time
+import threading
+import subprocess
+import multiprocessing
 import mock
 import pytest
 import requests
@@ -12,6 +18,10 @@ except ImportError:
 from anacode import codes
 from anacode.api import client
 from anacode.api import writers
+from anacode.api import limits
+from anacode.api import retry
+from anacode.api import observers
+from anacode.api import mockserver
 
 
 def empty_response(*args, **kwargs):
@@ -36,63 +46,75 @@ def auth_header(auth):
             'Accept': 'application/json'}
 
 
+@pytest.fixture
+def json_header(auth_header):
+    headers = dict(auth_header)
+    headers['Content-Type'] = 'application/json; charset=utf-8'
+    return headers
+
+
+def json_body(data):
+    return json.dumps(data).encode('utf-8')
+
+
 @pytest.fixture
 def api(auth):
-    return client.AnacodeClient(auth)
+    return client.AnacodeClient(auth, codec='json')
 
 
-@mock.patch('requests.post', empty_response)
-def test_scrape_call(api, auth_header, mocker):
-    mocker.spy(requests, 'post')
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_scrape_call(post, api, json_header):
     api.scrape('http://chinese.portal.com.ch')
-    assert requests.post.call_count == 1
-    requests.post.assert_called_once_with(
-        urljoin(client.ANACODE_API_URL, 'scrape/'),
-        headers=auth_header, json={'url': 'http://chinese.portal.com.ch'})
+    assert post.call_count == 1
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'scrape/'),
+        headers=json_header,
+        data=json_body({'url': 'http://chinese.portal.com.ch'}))
 
 
-@mock.patch('requests.post', empty_response)
-def test_categories_call(api, auth_header, mocker):
-    mocker.spy(requests, 'post')
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_categories_call(post, api, json_header):
     api.analyze(['安全性能很好，很帅气。'], ['categories'])
-    assert requests.post.call_count == 1
+    assert post.call_count == 1
     json_data = {'texts': ['安全性能很好，很帅气。'], 'analyses': ['categories']}
-    requests.post.assert_called_once_with(
-        urljoin(client.ANACODE_API_URL, 'analyze/'),
-        headers=auth_header, json=json_data)
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'analyze/'),
+        headers=json_header, data=json_body(json_data))
 
 
-@mock.patch('requests.post', empty_response)
-def test_sentiment_call(api, auth_header, mocker):
-    mocker.spy(requests, 'post')
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_sentiment_call(post, api, json_header):
     api.analyze(['安全性能很好，很帅气。'], ['sentiment'])
-    assert requests.post.call_count == 1
-    requests.post.assert_called_once_with(
-        urljoin(client.ANACODE_API_URL, 'analyze/'),
-        headers=auth_header, json={'texts': ['安全性能很好，很帅气。'],
-                                   'analyses': ['sentiment']})
+    assert post.call_count == 1
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'analyze/'),
+        headers=json_header, data=json_body({'texts': ['安全性能很好，很帅气。'],
+                                            'analyses': ['sentiment']}))
 
 
-@mock.patch('requests.post', empty_response)
-def test_concepts_call(api, auth_header, mocker):
-    mocker.spy(requests, 'post')
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_concepts_call(post, api, json_header):
     api.analyze(['安全性能很好，很帅气。'], ['concepts'])
-    assert requests.post.call_count == 1
-    requests.post.assert_called_once_with(
-        urljoin(client.ANACODE_API_URL, 'analyze/'),
-        headers=auth_header, json={'texts': ['安全性能很好，很帅气。'],
-                                   'analyses': ['concepts']})
+    assert post.call_count == 1
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'analyze/'),
+        headers=json_header, data=json_body({'texts': ['安全性能很好，很帅气。'],
+                                            'analyses': ['concepts']}))
 
 
-@mock.patch('requests.post', empty_response)
-def test_absa_call(api, auth_header, mocker):
-    mocker.spy(requests, 'post')
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_absa_call(post, api, json_header):
     api.analyze(['安全性能很好，很帅气。'], ['absa'])
-    assert requests.post.call_count == 1
-    requests.post.assert_called_once_with(
-        urljoin(client.ANACODE_API_URL, 'analyze/'),
-        headers=auth_header, json={'texts': ['安全性能很好，很帅气。'],
-                                   'analyses': ['absa']})
+    assert post.call_count == 1
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'analyze/'),
+        headers=json_header, data=json_body({'texts': ['安全性能很好，很帅气。'],
+                                            'analyses': ['absa']}))
 
 
 @pytest.mark.parametrize('code,call,args', [
@@ -100,7 +122,7 @@ def test_absa_call(api, auth_header, mocker):
     (codes.ANALYZE, 'analyze', ['安全性能很好，很帅气。', ['categories']]),
 ])
 def test_proper_method_call(api, code, call, args, mocker):
-    mock.patch('anacode.api.client.AnacodeClient.' + call, empty_json)
+    mocker.patch('anacode.api.client.AnacodeClient.' + call, empty_json)
     mocker.spy(api, call)
     api.call((code, *args))
     getattr(api, call).assert_called_once_with(*args)
@@ -118,7 +140,7 @@ def test_should_start_analysis(api, mocker, call, args, count, call_count):
     writer.init()
 
     to_mock = 'anacode.api.client.AnacodeClient.' + call
-    mock.patch(to_mock, empty_json)
+    mocker.patch(to_mock, empty_json)
 
     analyzer = client.Analyzer(api, writer, bulk_size=10)
     mocker.spy(analyzer, 'execute_tasks_and_store_output')
@@ -142,7 +164,7 @@ def test_analysis_execution(api, mocker, call, args):
     writer.init()
 
     to_mock = 'anacode.api.client.AnacodeClient.' + call
-    mock.patch(to_mock, empty_json)
+    mocker.patch(to_mock, empty_json)
     mocker.spy(api, call)
 
     analyzer = client.Analyzer(api, writer, bulk_size=10)
@@ -174,3 +196,635 @@ def test_parallel_queries(api, mocker):
     stop = time.time()
     duration = stop - start
     assert abs(duration - 0.1) < 0.1
+
+
+def sentiment_of_text(task):
+    return {'sentiment': [{'sentiment_value': t} for t in task[1]]}
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_pipeline_keeps_order(api, threads):
+    writer = writers.DataFrameWriter()
+    api.call = sentiment_of_text
+    analyzer = client.Analyzer(api, writer, threads=threads, bulk_size=3,
+                               pipeline=True)
+    with analyzer:
+        for index in range(20):
+            analyzer.analyze([index], ['sentiment'])
+    sentiments = writer.frames['sentiments']
+    assert sentiments.doc_id.tolist() == list(range(20))
+    assert sentiments.sentiment_value.tolist() == list(range(20))
+
+
+class BlockingWriter(writers.Writer):
+    """Writer whose first write waits until *event* is set."""
+    def __init__(self, event):
+        super(BlockingWriter, self).__init__()
+        self.event = event
+        self.waited = []
+
+    def write_bulk(self, results):
+        if not self.waited:
+            self.waited.append(self.event.wait(5))
+        super(BlockingWriter, self).write_bulk(results)
+
+
+def test_pipeline_overlaps_writing(api):
+    requested = threading.Event()
+
+    def call(task):
+        if task[1][0] >= 2:
+            requested.set()
+        return sentiment_of_text(task)
+
+    api.call = call
+    writer = BlockingWriter(requested)
+    analyzer = client.Analyzer(api, writer, threads=2, bulk_size=2,
+                               pipeline=True)
+    with analyzer:
+        for index in range(8):
+            analyzer.analyze([index], ['sentiment'])
+    # second bulk was requested while the first one was still being written
+    assert writer.waited == [True]
+
+
+class FailingWriter(writers.Writer):
+    def write_bulk(self, results):
+        raise IOError('Disk full')
+
+
+def test_pipeline_write_error_raised(api):
+    api.call = sentiment_of_text
+    analyzer = client.Analyzer(api, FailingWriter(), bulk_size=1,
+                               pipeline=True)
+    with pytest.raises(IOError):
+        with analyzer:
+            for index in range(5):
+                analyzer.analyze([index], ['sentiment'])
+
+
+class FailingAtWriter(writers.Writer):
+    """Writer recording written texts that fails on bulk with *text*."""
+    def __init__(self, text):
+        super(FailingAtWriter, self).__init__()
+        self.text = text
+        self.written = []
+
+    def write_bulk(self, results):
+        texts = [r['sentiment'][0]['sentiment_value'] for _, r in results]
+        if self.text in texts:
+            raise IOError('Disk full')
+        self.written.extend(texts)
+
+
+def test_pipeline_write_error_is_sticky(api):
+    api.call = sentiment_of_text
+    writer = FailingAtWriter(30)
+    analyzer = client.Analyzer(api, writer, threads=2, bulk_size=4,
+                               pipeline=True)
+    errors = 0
+    with pytest.raises(IOError):
+        with analyzer:
+            for index in range(50):
+                try:
+                    analyzer.analyze([index], ['sentiment'])
+                except IOError:
+                    errors += 1
+    # nothing after the failed bulk reaches the writer
+    assert writer.written == list(range(28))
+    assert errors > 0
+
+
+def test_pool_created_once(api, mocker):
+    api.call = sentiment_of_text
+    pool_class = mocker.spy(client, 'Pool')
+    analyzer = client.Analyzer(api, writers.Writer(), threads=4, bulk_size=2)
+    with analyzer:
+        for index in range(10):
+            analyzer.analyze([index], ['sentiment'])
+        pool = analyzer._pool
+    assert pool_class.call_count == 1
+    assert analyzer._pool is None
+    with pytest.raises(ValueError):
+        pool.map(sentiment_of_text, [])
+
+
+def test_pool_not_created_for_single_thread(api, mocker):
+    api.call = sentiment_of_text
+    pool_class = mocker.spy(client, 'Pool')
+    with client.Analyzer(api, writers.Writer(), bulk_size=2) as analyzer:
+        for index in range(4):
+            analyzer.analyze([index], ['sentiment'])
+    assert pool_class.call_count == 0
+
+
+@mock.patch('anacode.api.client.AnacodeClient.analyze', time_consuming)
+def test_analyzer_stats(api):
+    text = ['安全性能很好，很帅气。']
+    analyzer = client.Analyzer(api, writers.Writer(), threads=2, bulk_size=2)
+    with analyzer:
+        analyzer.analyze(text, ['categories'])
+        assert analyzer.stats()['pending'] == 1
+        analyzer.analyze(text, ['categories'])
+        stats = analyzer.stats()
+    assert stats['pending'] == 0
+    assert stats['queued'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['completed'] == 2
+    assert 0.5 < stats['utilization'] <= 1
+
+
+class ThrottlingClient(object):
+    """Fake client that throttles every request above `capacity` concurrent
+    requests.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def call(self, task):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self.in_flight > self.capacity
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if throttled:
+            response = requests.Response()
+            response.status_code = 429
+            raise requests.HTTPError(response=response)
+        return {}
+
+
+def test_analyzer_limiter():
+    api = ThrottlingClient(capacity=100)
+    limiter = limits.AIMDLimiter(initial_limit=2, max_limit=6)
+    analyzer = client.Analyzer(api, writers.Writer(), bulk_size=50,
+                               limiter=limiter)
+    assert analyzer.threads == 6
+    with analyzer:
+        for index in range(50):
+            analyzer.analyze([index], ['sentiment'])
+    assert api.max_in_flight <= 6
+    assert analyzer.stats()['concurrency_limit'] > 2
+
+
+def test_analyzer_limiter_backs_off():
+    api = ThrottlingClient(capacity=1)
+    limiter = limits.AIMDLimiter(initial_limit=4, max_limit=4)
+    analyzer = client.Analyzer(api, writers.Writer(), bulk_size=4,
+                               limiter=limiter)
+    with pytest.raises(requests.HTTPError):
+        with analyzer:
+            for index in range(4):
+                analyzer.analyze([index], ['sentiment'])
+    assert limiter.limit == 2
+
+
+class LimitRecorder(observers.Observer):
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.limits = []
+
+    def request_end(self, *args):
+        self.limits.append(self.limiter.limit)
+
+
+def test_analyzer_limiter_observes_retried_attempts():
+    limiter = limits.AIMDLimiter(initial_limit=4, max_limit=24)
+    with mockserver.MockServer(error_rate=0.5) as server:
+        api = client.AnacodeClient(
+            'token', base_url=server.url,
+            retry_policy=retry.RetryPolicy(backoff_factor=0.0001))
+        analyzer = client.Analyzer(api, writers.Writer(), limiter=limiter,
+                                   bulk_size=40, ignore_errors=True)
+        recorder = LimitRecorder(limiter)
+        api.observers.append(recorder)
+        with analyzer:
+            assert api.observers == [recorder, limiter]
+            for index in range(40):
+                analyzer.analyze([str(index)], ['sentiment'])
+        assert api.observers == [recorder]
+    decreases = sum(1 for before, after in zip(recorder.limits,
+                                               recorder.limits[1:])
+                    if after < before)
+    # retried 503 responses lower the limit, not only failed tasks
+    assert server.errors > len(analyzer.failed)
+    assert decreases > len(analyzer.failed)
+    assert max(recorder.limits) < 24
+
+
+def test_limiter_detached_from_reused_client(api):
+    api.call = sentiment_of_text
+    first, second = limits.AIMDLimiter(), limits.AIMDLimiter()
+    for limiter in (first, second):
+        with client.Analyzer(api, writers.Writer(), limiter=limiter,
+                             bulk_size=2) as analyzer:
+            assert api.observers == [limiter]
+            analyzer.analyze([0], ['sentiment'])
+    assert api.observers == []
+
+
+def fail_odd_documents(task):
+    if task[1][0] % 2:
+        raise requests.HTTPError('Server error')
+    return sentiment_of_text(task)
+
+
+@pytest.mark.parametrize('threads,pipeline', [(1, False), (3, False),
+                                              (3, True)])
+def test_ignore_errors_keeps_ids(api, threads, pipeline):
+    api.call = fail_odd_documents
+    writer = writers.DataFrameWriter()
+    analyzer = client.Analyzer(api, writer, threads=threads, bulk_size=4,
+                               pipeline=pipeline, ignore_errors=True)
+    with analyzer:
+        for index in range(10):
+            analyzer.analyze([index, index], ['sentiment'])
+        analyzer.analyze([10], ['sentiment'], single_document=True)
+        analyzer.analyze([12], ['sentiment'])
+    sentiments = writer.frames['sentiments']
+    assert sentiments.doc_id.tolist() == [0, 1, 4, 5, 8, 9, 12, 13, 16, 17,
+                                          20, 21]
+    assert len(analyzer.failed) == 5
+    assert all(isinstance(e, requests.HTTPError) for _, e in analyzer.failed)
+
+
+def test_errors_raised_by_default(api):
+    api.call = fail_odd_documents
+    analyzer = client.Analyzer(api, writers.Writer(), bulk_size=4)
+    with pytest.raises(requests.HTTPError):
+        with analyzer:
+            for index in range(4):
+                analyzer.analyze([index], ['sentiment'])
+
+
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=empty_response)
+def test_utf8_body(post, auth, auth_header):
+    api = client.AnacodeClient(auth, utf8=True, codec='json')
+    api.analyze(['安全性能很好，很帅气。'], ['sentiment'])
+    headers = dict(auth_header)
+    headers['Content-Type'] = 'application/json; charset=utf-8'
+    body = u'{"texts": ["安全性能很好，很帅气。"], "analyses": ["sentiment"]}'
+    post.assert_called_once_with(
+        mock.ANY, urljoin(client.ANACODE_API_URL, 'analyze/'),
+        headers=headers, data=body.encode('utf-8'))
+
+
+@pytest.mark.parametrize('threads,pipeline', [(1, False), (3, False),
+                                              (3, True)])
+def test_deduplicated_texts_fanned_out(api, threads, pipeline):
+    sent = []
+
+    def record_texts(task):
+        sent.extend(task[1])
+        return sentiment_of_text(task)
+
+    api.call = record_texts
+    writer = writers.DataFrameWriter()
+    analyzer = client.Analyzer(api, writer, threads=threads, bulk_size=4,
+                               pipeline=pipeline, deduplicate=True)
+    texts = [[1, 2, 1], [2, 3], [1], [4, 4], [1, 5]]
+    with analyzer:
+        for bulk in texts:
+            analyzer.analyze(bulk, ['sentiment'])
+    sentiments = writer.frames['sentiments']
+    expected = [t for bulk in texts for t in bulk]
+    assert sentiments.doc_id.tolist() == list(range(len(expected)))
+    assert sentiments.sentiment_value.tolist() == expected
+    # duplicates are only removed within bulk of four tasks
+    assert sent == [1, 2, 3, 4, 1, 5]
+    assert analyzer.stats()['duplicates'] == 4
+
+
+def test_deduplication_respects_analyses(api):
+    tasks = [(codes.ANALYZE, ['a', 'b'], ['sentiment'], None, False),
+             (codes.ANALYZE, ['a'], ['concepts'], None, False),
+             (codes.ANALYZE, ['a', 'b'], ['sentiment'], None, True),
+             (codes.ANALYZE, ['b', 'a'], ['sentiment'], None, False)]
+    unique, plan, duplicates = client._deduplicate(tasks)
+    assert [t[1] for t in unique] == [['a', 'b'], ['a'], ['a', 'b']]
+    assert duplicates == 2
+    results = [{'sentiment': ['A', 'B']}, {'concepts': [['A']]},
+               {'sentiment': ['AB'], 'single_document': True}]
+    fanned = client._fan_out(results, plan)
+    assert fanned[:3] == results
+    assert fanned[3] == {'sentiment': ['B', 'A']}
+
+
+@pytest.mark.parametrize('analysis', ['sentiment', 'categories', 'absa'])
+def test_deduplication_keeps_texts_of_partly_failed_task(api, analysis):
+    generator = mockserver.ResultGenerator()
+
+    def call(task):
+        if 'bad' in task[1]:
+            raise requests.HTTPError('500 Server Error')
+        return generator.analyze(task[1], task[2], task[4])
+
+    api.call = call
+    writer = writers.DataFrameWriter()
+    with client.Analyzer(api, writer, bulk_size=2, deduplicate=True,
+                         ignore_errors=True) as analyzer:
+        analyzer.analyze(['bad'], [analysis])
+        analyzer.analyze(['bad', 'good'], [analysis])
+    assert [task[1] for task, _ in analyzer.failed] == [['bad']]
+    table = {'sentiment': 'sentiments', 'categories': 'categories',
+             'absa': 'absa_normalized_texts'}[analysis]
+    assert set(writer.frames[table].doc_id) == {2}
+    assert writer.ids['analyze'] == 3
+
+
+def test_fan_out_of_failed_text():
+    tasks = [(codes.ANALYZE, ['bad'], ['sentiment'], None, False),
+             (codes.ANALYZE, ['bad', 'good'], ['sentiment'], None, False)]
+    unique, plan, _ = client._deduplicate(tasks)
+    results = [client._empty_result(unique[0]),
+               {'sentiment': [{'sentiment_value': 0.5}]}]
+    fanned = client._fan_out(results, plan)
+    assert fanned[1] == {'categories': [[], None],
+                         'sentiment': [None, {'sentiment_value': 0.5}]}
+
+
+@pytest.mark.parametrize('deduplicate', [False, True])
+def test_reorder_commits_in_submission_order(api, deduplicate):
+    started = [threading.Event() for _ in range(20)]
+    overlapped = []
+
+    def first_text_waits_for_next_bulk(task):
+        index = task[1][0]
+        started[index].set()
+        if index % 5 == 0 and index + 5 < 20:
+            overlapped.append(started[index + 5].wait(5))
+        return sentiment_of_text(task)
+
+    api.call = first_text_waits_for_next_bulk
+    writer = writers.DataFrameWriter()
+    analyzer = client.Analyzer(api, writer, threads=4, bulk_size=5,
+                               reorder=True, deduplicate=deduplicate)
+    with analyzer:
+        for index in range(20):
+            analyzer.analyze([index, index], ['sentiment'])
+    # first task of every bulk finished only after next bulk was started
+    assert overlapped == [True] * 3
+    sentiments = writer.frames['sentiments']
+    assert sentiments.doc_id.tolist() == list(range(40))
+    assert sentiments.sentiment_value.tolist() == \
+        [i for i in range(20) for _ in range(2)]
+
+
+def test_reorder_window_limits_in_flight(api):
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def tracked(task):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return sentiment_of_text(task)
+
+    api.call = tracked
+    writer = writers.DataFrameWriter()
+    with client.Analyzer(api, writer, threads=8, bulk_size=10, reorder=True,
+                         window=3) as analyzer:
+        for index in range(30):
+            analyzer.analyze([index], ['sentiment'])
+    assert peak[0] <= 3
+    assert writer.frames['sentiments'].doc_id.tolist() == list(range(30))
+
+
+def test_reorder_window_counts_unwritten_results(api):
+    release = threading.Event()
+    calls = []
+
+    def first_task_held_back(task):
+        calls.append(task[1][0])
+        if task[1][0] == 0:
+            release.wait(5)
+        return sentiment_of_text(task)
+
+    api.call = first_task_held_back
+    writer = writers.DataFrameWriter()
+    analyzer = client.Analyzer(api, writer, threads=4, bulk_size=1,
+                               reorder=True, window=3)
+
+    def submit():
+        with analyzer:
+            for index in range(10):
+                analyzer.analyze([index], ['sentiment'])
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    for _ in range(500):
+        if len(calls) == 3 and analyzer._bulks[0].ready() == 0 and \
+                all(analyzer._bulks[i].done[0] for i in (1, 2)):
+            break
+        time.sleep(0.01)
+    # two finished tasks wait for the first one and submission is stalled
+    thread.join(0.1)
+    assert sorted(calls) == [0, 1, 2]
+    assert analyzer._unwritten == 3
+    release.set()
+    thread.join(5)
+    assert sorted(calls) == list(range(10))
+    assert writer.frames['sentiments'].doc_id.tolist() == list(range(10))
+
+
+def test_reorder_raises_task_error(api):
+    api.call = fail_odd_documents
+    analyzer = client.Analyzer(api, writers.Writer(), threads=2, bulk_size=4,
+                               reorder=True)
+    with pytest.raises(requests.HTTPError):
+        with analyzer:
+            for index in range(8):
+                analyzer.analyze([index], ['sentiment'])
+
+
+def test_reorder_not_with_pipeline(api):
+    with pytest.raises(ValueError):
+        client.Analyzer(api, writers.Writer(), threads=2, pipeline=True,
+                        reorder=True)
+
+
+def raw_concepts(task):
+    concepts = [[{'concept': 'Text%s' % t, 'freq': 1, 'relevance_score': 1.,
+                  'type': 'feature', 'surface': []}] for t in task[1]]
+    result = {'concepts': concepts}
+    if task[4]:
+        result['single_document'] = True
+    return json.dumps(result).encode('utf-8')
+
+
+@pytest.mark.parametrize('threads,mode', [(1, {}), (3, {'pipeline': True}),
+                                          (3, {'reorder': True})])
+def test_processes_flatten_results(api, threads, mode):
+    api.call_raw = raw_concepts
+    writer = writers.DataFrameWriter()
+    with client.Analyzer(api, writer, threads=threads, bulk_size=4,
+                         processes=2, **mode) as analyzer:
+        for index in range(10):
+            analyzer.analyze([index, index], ['concepts'])
+        analyzer.analyze([10, 11], ['concepts'], single_document=True)
+        analyzer.analyze([12], ['concepts'])
+    concepts = writer.frames['concepts']
+    assert concepts.doc_id.tolist() == list(range(20)) + [20, 20, 21]
+    assert concepts.text_order.tolist() == [0] * 21 + [1, 0]
+    assert concepts.concept.tolist() == \
+        ['Text%d' % (i // 2) for i in range(20)] + \
+        ['Text10', 'Text11', 'Text12']
+
+
+class RecordingInitWriter(writers.DataFrameWriter):
+    def init(self):
+        self.children_at_init = len(multiprocessing.active_children())
+        super(RecordingInitWriter, self).init()
+
+
+def test_worker_processes_not_forked(api):
+    api.call_raw = raw_concepts
+    writer = RecordingInitWriter()
+    with client.Analyzer(api, writer, threads=3, pipeline=True,
+                         processes=1) as analyzer:
+        pool = analyzer._process_pool
+        assert pool._ctx.get_start_method() != 'fork'
+        analyzer.analyze([0], ['concepts'])
+    assert writer.frames['concepts'].concept.tolist() == ['Text0']
+    # workers were started before writer could start its threads
+    assert writer.children_at_init == 1
+
+
+UNGUARDED_SCRIPT = """
+from anacode.api import client, writers
+with client.Analyzer(client.AnacodeClient('token'), writers.Writer(),
+                     processes=1):
+    pass
+"""
+
+
+def test_unguarded_main_with_processes(tmpdir):
+    script = tmpdir.join('script.py')
+    script.write(UNGUARDED_SCRIPT)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(client.__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    process = subprocess.Popen([sys.executable, str(script)], env=env,
+                               stderr=subprocess.PIPE)
+    _, stderr = process.communicate(timeout=60)
+    assert b'Create the analyzer under' in stderr
+
+
+@pytest.mark.parametrize('mode', [{}, {'pipeline': True}, {'reorder': True}])
+def test_scrape_and_analyze(mode):
+    links = ['http://example.com/%d' % index for index in range(20)]
+    pages = []
+    with mockserver.MockServer(latency=0.05) as server:
+        api = client.AnacodeClient('token', base_url=server.url,
+                                   session_pool=client.SessionPool(size=2))
+        writer = writers.DataFrameWriter()
+        with client.Analyzer(api, writer, threads=2, bulk_size=2,
+                             **mode) as analyzer:
+            count = analyzer.scrape_and_analyze(
+                links, ['absa'], max_size=400, scrape_threads=10,
+                callback=lambda link, page: pages.append(link))
+    assert count == 20
+    assert pages == links
+    # scrapes do not take sessions from analysis requests
+    assert api.session_pool.size == 12
+    texts = writer.frames['absa_normalized_texts']
+    generator = mockserver.ResultGenerator()
+    assert texts.doc_id.tolist() == list(range(20))
+    assert texts.normalized_text.tolist() == \
+        [generator.scrape(link)['text'] for link in links]
+
+
+def test_scrape_overlaps_analysis(api):
+    analyzing = threading.Event()
+    lock = threading.Lock()
+    scraping, waited, seen_scraping = [0], [], []
+
+    def scrape(link):
+        with lock:
+            scraping[0] += 1
+        try:
+            if int(link) >= 10:
+                # later pages are scraped only after analysis started
+                waited.append(analyzing.wait(5))
+            return {'text': 'x' * 100}
+        finally:
+            with lock:
+                scraping[0] -= 1
+
+    def call(task):
+        with lock:
+            seen_scraping.append(scraping[0] > 0)
+        analyzing.set()
+        return sentiment_of_text(task)
+
+    api.scrape = scrape
+    api.call = call
+    writer = writers.DataFrameWriter()
+    with client.Analyzer(api, writer, threads=2, bulk_size=2) as analyzer:
+        count = analyzer.scrape_and_analyze(
+            [str(index) for index in range(20)], ['sentiment'],
+            max_size=400, scrape_threads=10)
+    assert count == 20
+    assert waited == [True] * 10
+    assert seen_scraping[0]
+    assert writer.frames['sentiments'].doc_id.tolist() == list(range(20))
+
+
+def test_scrapes_limited_and_counted(api):
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def tracked(function):
+        def call(*args):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.005)
+            with lock:
+                active[0] -= 1
+            return function(*args)
+        return call
+
+    api.scrape = tracked(lambda link: {'text': link})
+    api.call = tracked(sentiment_of_text)
+    limiter = limits.AIMDLimiter(initial_limit=2, max_limit=2)
+    with client.Analyzer(api, writers.Writer(), limiter=limiter,
+                         bulk_size=1) as analyzer:
+        analyzer.scrape_and_analyze(['link%d' % i for i in range(10)],
+                                    ['sentiment'], scrape_threads=6)
+        stats = analyzer.stats()
+    assert peak[0] <= 2
+    # ten scrapes and at least one analyze request
+    assert stats['completed'] >= 11
+    assert stats['queued'] == 0
+
+
+def test_scrape_and_analyze_skips_failed_pages(api):
+    def scrape(link):
+        if link.endswith('1'):
+            raise requests.HTTPError('404 Not Found')
+        return {'text': '' if link.endswith('2') else link}
+
+    api.scrape = scrape
+    api.call = sentiment_of_text
+    writer = writers.DataFrameWriter()
+    links = ['link%d' % index for index in range(5)]
+    with client.Analyzer(api, writer, threads=2,
+                         ignore_errors=True) as analyzer:
+        assert analyzer.scrape_and_analyze(links, ['sentiment']) == 3
+    assert writer.frames['sentiments'].sentiment_value.tolist() == \
+        ['link0', 'link3', 'link4']
+    assert [task for task, _ in analyzer.failed] == \
+        [(codes.SCRAPE, 'link1')]
+    api.scrape = lambda link: scrape('link1')
+    with pytest.raises(requests.HTTPError):
+        with client.Analyzer(api, writers.Writer()) as analyzer:
+            analyzer.scrape_and_analyze(links, ['sentiment'])
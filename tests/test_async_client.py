@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import time
+import asyncio
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from anacode.api import aio
+from anacode.api import writers
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_analyze_call(auth='1234567890'):
+    received = []
+
+    async def analyze(request):
+        received.append((request.headers['Authorization'],
+                         await request.json()))
+        return web.json_response({'categories': [[]]})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/analyze/', analyze)
+        async with TestServer(app) as server:
+            url = str(server.make_url('/'))
+            async with aio.AsyncAnacodeClient(auth, url) as api:
+                return await api.analyze(['安全性能很好，很帅气。'],
+                                         ['categories'])
+
+    result = run(scenario())
+    assert result == {'categories': [[]]}
+    assert received == [('Token %s' % auth, {
+        'texts': ['安全性能很好，很帅气。'], 'analyses': ['categories']
+    })]
+
+
+class DelayedClient(object):
+    def __init__(self, delays):
+        self.delays = delays
+        self.in_flight = self.max_in_flight = 0
+        self.closed = False
+
+    async def call(self, task):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delays[task[1][0]])
+        self.in_flight -= 1
+        return {'sentiment': [{'sentiment_value': task[1][0]}]}
+
+    async def close(self):
+        self.closed = True
+
+
+def test_concurrent_requests_written_in_order():
+    delays = [0.1, 0.01, 0.05, 0.0, 0.02] * 20
+    api = DelayedClient(delays)
+    writer = writers.DataFrameWriter()
+
+    async def scenario():
+        async with aio.AsyncAnalyzer(api, writer, concurrency=100,
+                                     bulk_size=10) as analyzer:
+            for index in range(len(delays)):
+                await analyzer.analyze([index], ['sentiment'])
+
+    start = time.time()
+    run(scenario())
+    assert time.time() - start < 0.5
+    assert api.max_in_flight == 100
+    assert api.closed
+    sentiments = writer.frames['sentiments']
+    assert sentiments.doc_id.tolist() == list(range(len(delays)))
+    assert sentiments.sentiment_value.tolist() == list(range(len(delays)))
+
+
+def test_concurrency_is_limited():
+    api = DelayedClient([0.01] * 30)
+
+    async def scenario():
+        async with aio.AsyncAnalyzer(api, writers.Writer(),
+                                     concurrency=4) as analyzer:
+            for index in range(30):
+                await analyzer.analyze([index], ['sentiment'])
+
+    run(scenario())
+    assert api.max_in_flight == 4
+
+
+def test_window_limits_results_held_back_by_slow_task():
+    delays = [0.2] + [0.0] * 200
+    api = DelayedClient(delays)
+    held = []
+
+    async def scenario():
+        async with aio.AsyncAnalyzer(api, writers.Writer(), concurrency=10,
+                                     window=20) as analyzer:
+            for index in range(len(delays)):
+                await analyzer.analyze([index], ['sentiment'])
+                held.append(len(analyzer.task_queue))
+
+    run(scenario())
+    assert max(held) == 20
+
+
+def test_writer_type_resolution():
+    frames = {}
+    analyzer = aio.async_analyzer('token', frames)
+    assert isinstance(analyzer.writer, writers.DataFrameWriter)
+    assert analyzer.writer.frames is frames
+
+
+def test_throttled_request_retried():
+    statuses = [429, 200]
+
+    async def analyze(request):
+        status = statuses.pop(0)
+        return web.json_response({}, status=status,
+                                 headers={'Retry-After': '0'})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/analyze/', analyze)
+        async with TestServer(app) as server:
+            url = str(server.make_url('/'))
+            async with aio.AsyncAnacodeClient('token', url) as api:
+                return await api.analyze(['安全性能很好，很帅气。'],
+                                         ['categories'])
+
+    assert run(scenario()) == {}
+    assert statuses == []
+
+
+def test_client_error_not_retried():
+    async def analyze(request):
+        return web.json_response({}, status=400)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/analyze/', analyze)
+        async with TestServer(app) as server:
+            url = str(server.make_url('/'))
+            async with aio.AsyncAnacodeClient('token', url) as api:
+                await api.analyze(['安全性能很好，很帅气。'], ['categories'])
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(scenario())
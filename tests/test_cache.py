@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import json
+import mock
+import pytest
+import requests
+
+from anacode.api import cache
+from anacode.api import client
+
+
+RESULT = {'categories': [[{'label': 'auto', 'probability': 0.9}]]}
+
+
+def categories_response(*args, **kwargs):
+    resp = requests.Response()
+    resp._content = b'{"categories": [[{"label": "auto", ' \
+                    b'"probability": 0.9}]]}'
+    resp.status_code = 200
+    return resp
+
+
+@pytest.fixture(params=['sqlite', 'directory'])
+def make_cache(request, tmpdir):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            return cache.SQLiteCache(str(tmpdir.join('cache.db')), **kwargs)
+        return cache.DirectoryCache(str(tmpdir.join('cache')), **kwargs)
+    return make
+
+
+def test_key_depends_on_content():
+    key = cache.cache_key(['text'], ['concepts', 'absa'])
+    assert key == cache.cache_key(['text'], ['absa', 'concepts'])
+    assert key != cache.cache_key(['text'], ['concepts'])
+    assert key != cache.cache_key(['text'], ['concepts', 'absa'],
+                                  single_document=True)
+    assert key != cache.cache_key(['text'], ['concepts', 'absa'],
+                                  {'Lenovo': ['联想']})
+    assert cache.cache_key(['a', 'b'], ['concepts']) != \
+        cache.cache_key(['b', 'a'], ['concepts'])
+
+
+def test_get_and_set(make_cache):
+    results = make_cache()
+    assert results.get('key') is None
+    results.set('key', RESULT)
+    assert results.get('key') == RESULT
+    stats = results.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+    assert stats['size'] > 0
+
+
+def test_entries_persist(make_cache):
+    results = make_cache()
+    results.set('key', RESULT)
+    results.close()
+    assert make_cache().get('key') == RESULT
+
+
+def test_expired_entries_are_missing(make_cache):
+    results = make_cache(ttl=10)
+    with mock.patch('anacode.api.cache.time.time', return_value=100):
+        results.set('key', RESULT)
+    with mock.patch('anacode.api.cache.time.time', return_value=105):
+        assert results.get('key') == RESULT
+    with mock.patch('anacode.api.cache.time.time', return_value=111):
+        assert results.get('key') is None
+    assert results.stats()['entries'] == 0
+
+
+def test_least_recently_used_evicted(make_cache):
+    results = make_cache()
+    results.set('size', RESULT)
+    results.max_size = 2 * results.stats()['size']
+    results.clear()
+    now = [100]
+    with mock.patch('anacode.api.cache.time.time', lambda: now[0]):
+        for key in ('first', 'second'):
+            results.set(key, RESULT)
+            now[0] += 1
+        results.get('first')
+        now[0] += 1
+        results.set('third', RESULT)
+    assert results.get('second') is None
+    assert results.get('first') == RESULT
+    assert results.get('third') == RESULT
+    assert results.stats()['entries'] == 2
+
+
+def test_size_kept_without_rescans(make_cache):
+    results = make_cache()
+    now = [100]
+    with mock.patch('anacode.api.cache.time.time', lambda: now[0]):
+        results.set('size', RESULT)
+        entry = results.stats()['size']
+        results.clear()
+        assert results.stats()['size'] == 0
+        results.max_size = 10 * entry
+        for index in range(50):
+            results.set('key %d' % (index % 30), RESULT)
+            now[0] += 1
+    stats = results.stats()
+    assert stats['entries'] == 10
+    assert stats['size'] == 10 * entry
+    assert results.get('key 10') == RESULT
+    assert results.get('key 29') is None
+    results.close()
+    assert make_cache().stats()['size'] == 10 * entry
+
+
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=categories_response)
+def test_client_answers_from_cache(post, make_cache):
+    api = client.AnacodeClient('token', cache=make_cache())
+    for _ in range(3):
+        assert api.analyze(['安全性能很好'], ['categories']) == RESULT
+    assert post.call_count == 1
+    api.analyze(['安全性能很好'], ['categories'], single_document=True)
+    assert post.call_count == 2
+
+
+@mock.patch('requests.Session.post', autospec=True,
+            side_effect=categories_response)
+def test_raw_results_share_cache(post, make_cache):
+    api = client.AnacodeClient('token', cache=make_cache())
+    raw = api.analyze_raw(['安全性能很好'], ['categories'])
+    assert json.loads(raw.decode('utf-8')) == RESULT
+    assert api.analyze(['安全性能很好'], ['categories']) == RESULT
+    assert json.loads(api.analyze_raw(['安全性能很好'], ['categories'])
+                      .decode('utf-8')) == RESULT
+    assert post.call_count == 1
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import io
+import csv
+import pytest
+
+from anacode import cli
+from anacode.api import client
+from anacode.api import writers
+from anacode.agg import aggregation as agg
+
+
+def sentiment_of_texts(api, task):
+    return {'sentiment': [{'sentiment_value': len(t)} for t in task[1]]}
+
+
+@pytest.fixture
+def texts_file(tmpdir):
+    path = tmpdir.join('texts.txt')
+    path.write_text(u'\n'.join(u'很好' * i for i in range(1, 31)),
+                    encoding='utf-8')
+    return str(path)
+
+
+def read_sentiments(output):
+    with open(str(output.join('sentiments.csv'))) as fp:
+        return list(csv.DictReader(fp))
+
+
+def test_analyze_writes_csv(mocker, tmpdir, texts_file):
+    mocker.patch('anacode.api.client.AnacodeClient.call', autospec=True,
+                 side_effect=sentiment_of_texts)
+    output = tmpdir.join('out')
+    stderr = io.StringIO()
+    mocker.patch('sys.stderr', stderr)
+    code = cli.main(['analyze', texts_file, '-a', 'sentiment', '-o',
+                     str(output), '--token', 'token', '--max-size', '200',
+                     '--threads', '2', '--progress-interval', '0'])
+    assert code == 0
+    rows = read_sentiments(output)
+    assert [int(r['doc_id']) for r in rows] == list(range(30))
+    assert [int(r['sentiment_value']) for r in rows] == \
+        [2 * i for i in range(1, 31)]
+    assert stderr.getvalue().startswith('30 docs, ')
+    assert client.AnacodeClient.call.call_count > 1
+
+
+def test_resume_uses_journal(mocker, tmpdir, texts_file):
+    mocker.patch('anacode.api.client.AnacodeClient.call', autospec=True,
+                 side_effect=sentiment_of_texts)
+    mocker.patch('sys.stderr', io.StringIO())
+    output = tmpdir.join('out')
+    args = ['analyze', texts_file, '-a', 'sentiment', '-o', str(output),
+            '--token', 'token', '--resume', '--progress-interval', '0']
+    assert cli.main(args) == 0
+    calls = client.AnacodeClient.call.call_count
+    assert output.join('journal.jsonl').check()
+    assert cli.main(args) == 0
+    assert client.AnacodeClient.call.call_count == calls
+    assert len(read_sentiments(output)) == 30
+
+
+def test_missing_token(mocker, monkeypatch, texts_file):
+    monkeypatch.delenv('ANACODE_TOKEN', raising=False)
+    stderr = io.StringIO()
+    mocker.patch('sys.stderr', stderr)
+    assert cli.main(['analyze', texts_file, '-a', 'sentiment',
+                     '--token', '']) == 2
+    assert 'token' in stderr.getvalue()
+
+
+def test_unknown_analysis(mocker, texts_file):
+    mocker.patch('sys.stderr', io.StringIO())
+    with pytest.raises(SystemExit):
+        cli.main(['analyze', texts_file, '-a', 'concepts,syntax'])
+
+
+def test_reporter_summary():
+    transfer = client.TransferStats()
+    transfer._latencies.extend([0.01 * i for i in range(1, 101)])
+    transfer.retries = 3
+    analyzer = type('Analyzer', (), {})()
+    analyzer.client = type('Client', (), {'transfer': transfer})()
+    analyzer.writer = type('Writer', (), {'ids': {'analyze': 10}})()
+    reporter = cli.ProgressReporter(analyzer, interval=0)
+    reporter.start()
+    summary = reporter.summary()
+    assert summary.startswith('10 docs, ')
+    assert 'p50 510 ms' in summary
+    assert 'p99 990 ms' in summary
+    assert '3 retries' in summary
+
+
+def _load_csv(output):
+    return agg.DatasetLoader.from_path(str(output))
+
+
+def _load_parquet(output):
+    return agg.DatasetLoader.from_parquet(str(output))
+
+
+def _load_sqlite(output):
+    return agg.DatasetLoader.from_sqlite(str(output.join('anacode.db')))
+
+
+@pytest.mark.parametrize('writer,load', [
+    ('csv', _load_csv),
+    pytest.param('parquet', _load_parquet, marks=pytest.mark.skipif(
+        writers.pyarrow is None, reason='needs pyarrow')),
+    ('sqlite', _load_sqlite),
+])
+def test_analyze_writer_choice(mocker, tmpdir, texts_file, writer, load):
+    mocker.patch('anacode.api.client.AnacodeClient.call', autospec=True,
+                 side_effect=sentiment_of_texts)
+    mocker.patch('sys.stderr', io.StringIO())
+    output = tmpdir.join('out')
+    code = cli.main(['analyze', texts_file, '-a', 'sentiment', '-o',
+                     str(output), '--token', 'token', '--writer', writer,
+                     '--resume', '--progress-interval', '0'])
+    assert code == 0
+    sentiments = load(output)['sentiments']
+    assert sentiments.doc_id.tolist() == list(range(30))
+    assert sentiments.sentiment_value.tolist() == \
+        [2 * i for i in range(1, 31)]
+
+
+def test_unknown_writer(mocker, texts_file):
+    mocker.patch('sys.stderr', io.StringIO())
+    with pytest.raises(SystemExit):
+        cli.main(['analyze', texts_file, '-a', 'sentiment', '--writer',
+                  'excel'])
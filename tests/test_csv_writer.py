@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import pytest
+import threading
 from datetime import datetime
 from freezegun import freeze_time
+from anacode import codes
 from anacode.api import writers
 
 
@@ -296,3 +298,209 @@ class TestCsvWriterAbsa:
         assert entity1 == ['0', '0', '0', 'feature_quantitative', 'Safety']
         assert entity2 == ['0', '0', '1', 'feature_subjective',
                            'VisualAppearance']
+
+
+def write_results(writer, categories, absa, times=3):
+    writer.init()
+    for _ in range(times):
+        writer.write_bulk([(codes.ANALYZE, {'categories': categories,
+                                            'absa': absa})])
+    writer.close()
+
+
+def test_background_mode_writes_same_files(tmpdir, categories, absa):
+    sync, background = tmpdir.mkdir('sync'), tmpdir.mkdir('background')
+    write_results(writers.CSVWriter(str(sync)), categories, absa)
+    write_results(writers.CSVWriter(str(background), background=True,
+                                    queue_size=1, buffer_size=2 ** 20),
+                  categories, absa)
+    names = sorted(f.basename for f in sync.listdir())
+    assert names == sorted(f.basename for f in background.listdir())
+    for name in names:
+        assert sync.join(name).read() == background.join(name).read()
+
+
+def test_background_mode_does_not_block_writes(target, sentiments):
+    writer = writers.CSVWriter(str(target), background=True, queue_size=4)
+    writer.init()
+    written = threading.Event()
+    release = threading.Event()
+    write_rows = writer._write_rows
+
+    def slow_write(new_data):
+        release.wait(5)
+        write_rows(new_data)
+        written.set()
+
+    writer._write_rows = slow_write
+    writer.write_sentiment(sentiments)
+    assert not written.is_set()
+    release.set()
+    writer.wait()
+    assert written.is_set()
+    writer.close()
+    assert len(target.join('sentiments.csv').readlines()) == 3
+
+
+def test_background_error_raised(target, sentiments):
+    writer = writers.CSVWriter(str(target), background=True)
+    writer.init()
+
+    def broken(new_data):
+        raise IOError('disk full')
+
+    writer._write_rows = broken
+    writer.write_sentiment(sentiments)
+    with pytest.raises(IOError):
+        writer.wait()
+    with pytest.raises(IOError):
+        writer.write_sentiment(sentiments)
+    with pytest.raises(IOError):
+        writer.close()
+    assert writer._thread is None
+
+
+def test_checkpoint_waits_for_queue(target, sentiments):
+    writer = writers.CSVWriter(str(target), background=True)
+    writer.init()
+    writer.write_sentiment(sentiments)
+    state = writer.checkpoint()
+    assert state['sizes']['sentiments'] == \
+        target.join('sentiments.csv').size() > len('doc_id') * 2
+    writer.close()
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_bulk_flush_policy(target, sentiments, monkeypatch, background):
+    synced = []
+    monkeypatch.setattr(writers.os, 'fsync', synced.append)
+    writer = writers.CSVWriter(str(target), background=background,
+                               buffer_size=2 ** 20, flush_policy='bulk',
+                               fsync=True)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    writer.wait()
+    assert len(synced) == len(writers.HEADERS)
+    assert len(target.join('sentiments.csv').readlines()) == 3
+    writer.close()
+
+
+def test_buffered_rows_reach_file_on_flush(target, sentiments):
+    writer = writers.CSVWriter(str(target), buffer_size=2 ** 20)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    assert target.join('sentiments.csv').size() == 0
+    writer.flush()
+    assert len(target.join('sentiments.csv').readlines()) == 3
+    writer.close()
+
+
+def test_unknown_flush_policy():
+    with pytest.raises(ValueError):
+        writers.CSVWriter(flush_policy='always')
+
+
+def test_append_continues_document_ids(target, categories, sentiments):
+    for _ in range(2):
+        writer = writers.CSVWriter(str(target), append=True)
+        writer.init()
+        writer.write_categories(categories)
+        writer.write_sentiment(sentiments)
+        writer.ids['analyze'] += 2
+        writer.close()
+    writer = writers.CSVWriter(str(target), append=True)
+    writer.init()
+    assert writer.ids['analyze'] == 4
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    assert sorted(f.basename for f in target.listdir()) == \
+        ['categories.csv', 'sentiments.csv']
+    lines = target.join('sentiments.csv').readlines()
+    assert lines[0].strip() == 'doc_id,text_order,sentiment_value'
+    assert [line.split(',')[0] for line in lines[1:]] == \
+        ['0', '1', '2', '3', '4', '5']
+
+
+def test_append_to_empty_directory(target, sentiments):
+    writer = writers.CSVWriter(str(target), append=True)
+    writer.init()
+    assert writer.ids['analyze'] == 0
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    assert len(target.join('sentiments.csv').readlines()) == 3
+
+
+def test_append_drops_incomplete_row(target, sentiments):
+    target.join('sentiments.csv').write(
+        'doc_id,text_order,sentiment_value\r\n0,0,0.5\r\n1,0,0.')
+    writer = writers.CSVWriter(str(target), append=True)
+    writer.init()
+    assert writer.ids['analyze'] == 1
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    assert target.join('sentiments.csv').read().splitlines()[1:] == \
+        ['0,0,0.5', '1,0,0.7299562892999195', '2,0,0.6668725094407698']
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 2 ** 16])
+@pytest.mark.parametrize('cut', [
+    b'1,"line one\nline two',
+    b'1,"line one\n',
+    b'1,"line one\n2,""two""\n',
+    b'1,"multi\r\n',
+    b'1',
+    b'12\r',
+])
+def test_drop_incomplete_quoted_row(target, block_size, cut):
+    path = target.join('texts.csv')
+    complete = b'doc_id,text\r\n0,"a\r\nb"\r\n'
+    path.write_binary(complete + cut)
+    writers.CSVWriter._drop_incomplete_row(str(path), 2, block_size)
+    assert path.read_binary() == complete
+    writers.CSVWriter._drop_incomplete_row(str(path), 2, block_size)
+    assert path.read_binary() == complete
+
+
+def test_append_drops_incomplete_quoted_row(target):
+    path = target.join('absa_normalized_texts.csv')
+    path.write_binary(b'doc_id,text_order,normalized_text\r\n'
+                      b'0,0,"first\nline"\r\n1,0,"second\n2,0,cut')
+    writer = writers.CSVWriter(str(target), append=True)
+    writer.init()
+    assert writer.ids['analyze'] == 1
+    writer.close()
+    assert path.read_binary() == b'doc_id,text_order,normalized_text\r\n' \
+        b'0,0,"first\nline"\r\n'
+
+
+def test_append_drops_cut_document_id(target, sentiments):
+    target.join('sentiments.csv').write(
+        'doc_id,text_order,sentiment_value\r\n0,0,0.5\r\n1,0,0.5\r\n'
+        '2,0,0.5\r\n3')
+    writer = writers.CSVWriter(str(target), append=True)
+    writer.init()
+    assert writer.ids['analyze'] == 3
+    writer.close()
+    rows = target.join('sentiments.csv').read().splitlines()[1:]
+    assert [row.split(',')[0] for row in rows] == ['0', '1', '2']
+
+
+def test_drop_incomplete_row_without_boundary(target):
+    path = target.join('texts.csv')
+    path.write_binary(b'"broken\nfile')
+    with pytest.raises(ValueError):
+        writers.CSVWriter._drop_incomplete_row(str(path), 2, 4)
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 2 ** 16])
+def test_last_csv_row(target, block_size):
+    path = target.join('texts.csv')
+    path.write_binary(u'doc_id,text\r\n1,"a\r\n2,""b""\r\n"\r\n2,安全\r\n'
+                      u'3,"x\r\n4,y"\r\n'.encode('utf-8'))
+    assert writers.last_csv_row(str(path), block_size) == ['3', 'x\r\n4,y']
+    path.write_binary(u'doc_id,text\r\n2,安全\r\n'.encode('utf-8'))
+    assert writers.last_csv_row(str(path), block_size) == ['2', u'安全']
+    path.write_binary(b'doc_id,text\r\n')
+    assert writers.last_csv_row(str(path), block_size) == ['doc_id', 'text']
+    path.write_binary(b'')
+    assert writers.last_csv_row(str(path), block_size) is None
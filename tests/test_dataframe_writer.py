@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import pytest
+import numpy as np
+import pandas as pd
 from anacode.api import writers
 
 
@@ -222,3 +224,102 @@ class TestDataFrameWriterAbsa:
         entity1, entity2 = entities.iloc[0].tolist(), entities.iloc[1].tolist()
         assert entity1 == [0, 0, 0, 'feature_quantitative', 'Safety']
         assert entity2 == [0, 0, 1, 'feature_subjective', 'VisualAppearance']
+
+
+def write_frames(writer, concepts, sentiments, categories, absa, times=1):
+    writer.init()
+    for _ in range(times):
+        writer.write_analysis({'categories': categories, 'concepts': concepts,
+                               'sentiment': sentiments, 'absa': absa})
+    writer.close()
+    return writer.frames
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100000])
+def test_chunked_frames_match_rows(concepts, sentiments, categories, absa,
+                                   chunk_size):
+    frames = write_frames(writers.DataFrameWriter(chunk_size=chunk_size),
+                          concepts, sentiments, categories, absa, times=5)
+    collector = writers._RowCollector()
+    collector.init()
+    for _ in range(5):
+        collector.write_analysis({'categories': categories,
+                                  'concepts': concepts,
+                                  'sentiment': sentiments, 'absa': absa})
+    assert sorted(frames) == sorted(collector.rows)
+    for name, rows in collector.rows.items():
+        expected = pd.DataFrame(rows, columns=writers.HEADERS[name])
+        pd.testing.assert_frame_equal(frames[name], expected,
+                                      check_dtype=False)
+    assert frames['sentiments'].doc_id.tolist() == list(range(10))
+
+
+def test_buffers_consolidated(sentiments):
+    writer = writers.DataFrameWriter(chunk_size=4)
+    writer.init()
+    for _ in range(5):
+        writer.write_analysis({'sentiment': sentiments})
+    doc_ids = writer._columns['sentiments'][0]
+    assert len(doc_ids.chunks) == 2
+    assert len(doc_ids.values) == 2
+    writer.close()
+    assert writer.frames['sentiments'].shape == (10, 3)
+
+
+def test_columns_are_typed(concepts, sentiments, categories, absa):
+    frames = write_frames(writers.DataFrameWriter(), concepts, sentiments,
+                          categories, absa)
+    relations = frames['absa_relations']
+    assert relations.doc_id.dtype == np.int64
+    assert relations.sentiment_value.dtype == np.float64
+    assert relations.is_external.dtype == np.bool_
+    assert frames['categories'].probability.dtype == np.float64
+
+
+def test_strings_are_interned():
+    writer = writers.DataFrameWriter()
+    writer.init()
+    names = [''.join(['Len', 'ovo']) for _ in range(2)]
+    assert names[0] is not names[1]
+    writer._add_new_data_from_dict({'concepts': [
+        [i, 0, name, 1, 1.0, 'brand'] for i, name in enumerate(names)]})
+    concepts = writer._columns['concepts'][2].values
+    assert concepts[0] is concepts[1]
+    writer.close()
+    assert writer._strings == {}
+
+
+def test_intern_table_is_bounded():
+    writer = writers.DataFrameWriter(max_strings=3)
+    writer.init()
+    for i in range(10):
+        writer._add_new_data_from_dict({'concepts': [
+            [i, 0, 'Concept %d' % i, 1, 1.0, 'brand']]})
+        assert len(writer._strings) < 3
+    writer.close()
+    assert writer.frames['concepts'].concept.tolist() == \
+        ['Concept %d' % i for i in range(10)]
+
+
+def test_categorical_strings(concepts, sentiments, categories, absa):
+    frames = write_frames(writers.DataFrameWriter(categorical=True), concepts,
+                          sentiments, categories, absa)
+    assert isinstance(frames['categories'].category.dtype,
+                      pd.CategoricalDtype)
+    assert frames['categories'].doc_id.dtype == np.int64
+    assert frames['concepts'].concept.tolist() == ['Lenovo', 'Samsung']
+
+
+def test_missing_numbers(sentiments):
+    writer = writers.DataFrameWriter(chunk_size=2)
+    writer.init()
+    writer._add_new_data_from_dict({'concepts': [
+        [0, 0, 'Lenovo', 1, 0.5, 'brand'],
+        [1, 0, 'Samsung', None, 1.0, 'brand'],
+        [2, 0, 'Apple', 3, None, 'brand'],
+    ]})
+    writer.close()
+    concepts = writer.frames['concepts']
+    assert concepts.freq.tolist()[::2] == [1, 3]
+    assert pd.isnull(concepts.freq[1])
+    assert pd.isnull(concepts.relevance_score[2])
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import csv
+import pytest
+import requests
+
+from anacode.api import client
+from anacode.api import journal
+from anacode.api import writers
+
+
+def sentiment_of_text(task):
+    return {'sentiment': [{'sentiment_value': t} for t in task[1]]}
+
+
+class CrashingClient(object):
+    def __init__(self, crash_at=None):
+        self.crash_at = crash_at
+        self.sent = []
+
+    def call(self, task):
+        if task[1][0] == self.crash_at:
+            raise requests.ConnectionError('Connection lost')
+        self.sent.append(task[1][0])
+        return sentiment_of_text(task)
+
+
+def run(api, target, path, mode=None):
+    analyzer = client.Analyzer(api, writers.CSVWriter(target), bulk_size=3,
+                               threads=1 if mode is None else 2,
+                               pipeline=mode == 'pipeline',
+                               reorder=mode == 'reorder',
+                               journal=journal.Journal(path))
+    with analyzer:
+        for index in range(10):
+            analyzer.analyze([index, index + 0.5], ['sentiment'])
+    return analyzer
+
+
+def read_sentiments(target):
+    with open(str(target.join('sentiments.csv'))) as fp:
+        return list(csv.reader(fp))
+
+
+@pytest.mark.parametrize('mode', [None, 'pipeline', 'reorder'])
+def test_resume_after_crash(tmpdir, mode):
+    path = str(tmpdir.join('journal.jsonl'))
+    target = tmpdir.mkdir('out')
+    with pytest.raises(requests.ConnectionError):
+        run(CrashingClient(crash_at=7), str(target), path, mode)
+    # reorder mode may commit task preceding the failed one
+    written = journal.Journal(path).written_tasks
+    assert written in (6, 7)
+
+    # rows written after last checkpoint are dropped on restart
+    with open(str(target.join('sentiments.csv')), 'a') as fp:
+        fp.write('99,0,99\n')
+
+    api = CrashingClient()
+    analyzer = run(api, str(target), path, mode)
+    assert sorted(api.sent) == list(range(written, 10))
+    assert analyzer.stats()['skipped'] == written
+    rows = read_sentiments(target)
+    assert rows[0] == writers.HEADERS['sentiments']
+    assert [int(r[0]) for r in rows[1:]] == list(range(20))
+    assert [float(r[2]) for r in rows[1:]] == \
+        [i + j for i in range(10) for j in (0, 0.5)]
+
+
+class FailingCSVWriter(writers.CSVWriter):
+    """CSV writer that fails to write bulk with result of *text*."""
+    def __init__(self, target, text):
+        super(FailingCSVWriter, self).__init__(target)
+        self.text = text
+
+    def write_bulk(self, results):
+        texts = [r['sentiment'][0]['sentiment_value'] for _, r in results]
+        if self.text in texts:
+            raise IOError('Disk full')
+        super(FailingCSVWriter, self).write_bulk(results)
+
+
+def test_resume_after_pipeline_write_error(tmpdir):
+    path = str(tmpdir.join('journal.jsonl'))
+    target = tmpdir.mkdir('out')
+    analyzer = client.Analyzer(CrashingClient(),
+                               FailingCSVWriter(str(target), 4),
+                               bulk_size=3, threads=2, pipeline=True,
+                               journal=journal.Journal(path))
+    with pytest.raises(IOError):
+        with analyzer:
+            for index in range(10):
+                try:
+                    analyzer.analyze([index, index + 0.5], ['sentiment'])
+                except IOError:
+                    pass
+    # bulk with task 4 failed, nothing after it counts as written
+    assert journal.Journal(path).written_tasks == 3
+
+    api = CrashingClient()
+    run(api, str(target), path, 'pipeline')
+    assert sorted(api.sent) == list(range(3, 10))
+    rows = read_sentiments(target)
+    assert [int(r[0]) for r in rows[1:]] == list(range(20))
+    assert [float(r[2]) for r in rows[1:]] == \
+        [i + j for i in range(10) for j in (0, 0.5)]
+
+
+def test_bulk_after_gap_not_journaled(tmpdir):
+    path = str(tmpdir.join('journal.jsonl'))
+    analyzer = client.Analyzer(CrashingClient(),
+                               writers.CSVWriter(str(tmpdir.mkdir('out'))),
+                               journal=journal.Journal(path))
+    with analyzer:
+        analyzer._record_written(0, 3)
+        analyzer._record_written(6, 3)
+        analyzer._record_written(9, 3)
+    assert journal.Journal(path).written_tasks == 3
+
+
+def test_finished_run_is_skipped(tmpdir):
+    path = str(tmpdir.join('journal.jsonl'))
+    target = tmpdir.mkdir('out')
+    run(CrashingClient(), str(target), path)
+    api = CrashingClient()
+    run(api, str(target), path)
+    assert api.sent == []
+    assert len(read_sentiments(target)) == 21
+
+
+def test_unfinished_record_ignored(tmpdir):
+    path = tmpdir.join('journal.jsonl')
+    progress = journal.Journal(str(path))
+    progress.submitted(0, 3)
+    progress.written(0, 3, {'ids': {'scrape': 0, 'analyze': 3}})
+    progress.close()
+    path.write('{"event": "written", "fi', mode='a')
+    progress = journal.Journal(str(path))
+    assert progress.written_tasks == 3
+    assert progress.writer_state == {'ids': {'scrape': 0, 'analyze': 3}}
+    progress.submitted(3, 3)
+    progress.close()
+    assert len(path.readlines()) == 3
+
+
+@pytest.mark.parametrize('writer', [writers.Writer(),
+                                    writers.DataFrameWriter()])
+def test_writer_without_resume_rejected(tmpdir, writer):
+    progress = journal.Journal(str(tmpdir.join('journal.jsonl')))
+    with pytest.raises(ValueError):
+        client.Analyzer(CrashingClient(), writer, journal=progress)
+    progress.close()
+
+
+def test_resumable_writers():
+    assert writers.CSVWriter.supports_resume
+    assert writers.SQLiteWriter.supports_resume
+    assert not writers.DataFrameWriter.supports_resume
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import multiprocessing
+from email.utils import formatdate
+import pytest
+import requests
+
+from anacode.api import limits
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize('error,overload', [
+    (http_error(429), True),
+    (http_error(503), True),
+    (http_error(500), False),
+    (http_error(400), False),
+    (requests.ConnectionError(), True),
+    (requests.Timeout(), True),
+    (ValueError(), False),
+])
+def test_is_overload(error, overload):
+    assert limits.is_overload(error) == overload
+
+
+class TestAIMDLimiter:
+    def test_invalid_limits(self):
+        with pytest.raises(ValueError):
+            limits.AIMDLimiter(initial_limit=10, max_limit=5)
+        with pytest.raises(ValueError):
+            limits.AIMDLimiter(backoff_ratio=1)
+
+    def test_additive_increase_per_window(self):
+        limiter = limits.AIMDLimiter(initial_limit=4, max_limit=10)
+        for _ in range(4):
+            limiter.release(limiter.acquire())
+        assert limiter.limit == 4
+        assert 4.9 < limiter._limit < 5
+
+    def test_increase_capped(self):
+        limiter = limits.AIMDLimiter(initial_limit=2, max_limit=3)
+        for _ in range(100):
+            limiter.release(limiter.acquire())
+        assert limiter.limit == 3
+
+    def test_multiplicative_decrease(self):
+        limiter = limits.AIMDLimiter(initial_limit=8, min_limit=3)
+        limiter.release(limiter.acquire(), overloaded=True)
+        assert limiter.limit == 4
+        limiter.release(limiter.acquire(), overloaded=True)
+        assert limiter.limit == 3
+
+    def test_one_decrease_for_concurrent_requests(self):
+        limiter = limits.AIMDLimiter(initial_limit=8)
+        tokens = [limiter.acquire() for _ in range(8)]
+        for token in tokens:
+            limiter.release(token, overloaded=True)
+        assert limiter.limit == 4
+        assert limiter.in_flight == 0
+
+    def test_slow_request_is_overload(self):
+        limiter = limits.AIMDLimiter(initial_limit=8, latency_threshold=0.01)
+        token = limiter.acquire()
+        time.sleep(0.02)
+        limiter.release(token)
+        assert limiter.limit == 4
+
+    def test_observed_attempts_adapt_limit(self):
+        limiter = limits.AIMDLimiter(initial_limit=8)
+        token = limiter.acquire()
+        limiter.request_end('analyze/', 503, 0., 10, 0)
+        assert limiter.limit == 4
+        limiter.request_end('analyze/', 429, 0., 10, 0)
+        assert limiter.limit == 2
+        limiter.request_end('analyze/', None, 0., 10, 0)
+        assert limiter.limit == 1
+        limiter.request_end('analyze/', 200, 0., 10, 2)
+        assert limiter._limit == 2
+        limiter.release(token, adapt=False)
+        assert limiter._limit == 2
+        assert limiter.in_flight == 0
+
+    def test_observed_attempt_latency(self):
+        limiter = limits.AIMDLimiter(initial_limit=8, latency_threshold=0.05)
+        limiter.request_end('analyze/', 200, 0.01, 10, 2)
+        assert limiter.limit == 8
+        limiter.request_end('analyze/', 200, 0.1, 10, 2)
+        assert limiter.limit == 4
+
+    def test_acquire_waits_for_free_slot(self):
+        limiter = limits.AIMDLimiter(initial_limit=1)
+        token = limiter.acquire()
+        acquired = []
+
+        def take():
+            acquired.append(limiter.acquire())
+
+        thread = threading.Thread(target=take)
+        thread.start()
+        time.sleep(0.05)
+        assert acquired == []
+        limiter.release(token)
+        thread.join(1)
+        assert len(acquired) == 1
+
+
+def acquire_many(limiter, count):
+    for _ in range(count):
+        limiter.acquire()
+
+
+class TestRateLimiter:
+    def test_unlimited(self):
+        limiter = limits.RateLimiter()
+        start = time.time()
+        for _ in range(1000):
+            limiter.acquire(1000)
+        assert time.time() - start < 0.5
+
+    def test_request_rate(self):
+        limiter = limits.RateLimiter(requests_per_second=100, burst=0.05)
+        start = time.time()
+        acquire_many(limiter, 25)
+        duration = time.time() - start
+        # 5 requests from initial burst, 20 at 100 per second
+        assert 0.18 < duration < 0.35
+
+    def test_char_rate(self):
+        limiter = limits.RateLimiter(chars_per_second=1000, burst=0.1)
+        start = time.time()
+        for _ in range(4):
+            limiter.acquire(50)
+        duration = time.time() - start
+        # 100 characters from initial burst, 100 at 1000 per second
+        assert 0.08 < duration < 0.2
+
+    def test_oversized_request_paid_back(self):
+        limiter = limits.RateLimiter(chars_per_second=1000, burst=0.1)
+        assert limiter.try_acquire(300) == 0
+        wait = limiter.try_acquire(1)
+        assert 0.2 < wait <= 0.301
+
+    def test_try_acquire_returns_wait(self):
+        limiter = limits.RateLimiter(requests_per_second=10, burst=0.1)
+        assert limiter.try_acquire() == 0
+        assert 0.05 < limiter.try_acquire() <= 0.1
+
+    @pytest.mark.parametrize('headers', [
+        {'Retry-After': '0.1'},
+        {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0.1'},
+    ])
+    def test_server_headers_block(self, headers):
+        limiter = limits.RateLimiter()
+        limiter.update(headers)
+        assert 0.05 < limiter.try_acquire() <= 0.1
+
+    def test_remaining_quota_does_not_block(self):
+        limiter = limits.RateLimiter()
+        limiter.update({'X-RateLimit-Remaining': '10',
+                        'X-RateLimit-Reset': '100'})
+        assert limiter.try_acquire() == 0
+
+    def test_shared_between_processes(self):
+        context = multiprocessing.get_context('fork')
+        limiter = limits.RateLimiter(requests_per_second=100, burst=0.05,
+                                     shared=True)
+        start = time.time()
+        workers = [context.Process(target=acquire_many, args=(limiter, 10))
+                   for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duration = time.time() - start
+        # 5 requests from initial burst, 25 at 100 per second
+        assert 0.2 < duration < 0.5
+
+
+def test_parse_retry_after_date():
+    in_a_minute = formatdate(time.time() + 60, usegmt=True)
+    assert 55 < limits.parse_retry_after(in_a_minute) <= 60
+    assert limits.parse_retry_after('nonsense') is None
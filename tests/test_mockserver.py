@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+
+from anacode.api import client
+from anacode.api import writers
+from anacode.api import mockserver
+from anacode.api import retry
+
+
+ANALYSES = ['categories', 'concepts', 'sentiment', 'absa']
+
+
+@pytest.fixture
+def server():
+    with mockserver.MockServer() as server:
+        yield server
+
+
+def test_results_are_deterministic():
+    generator = mockserver.ResultGenerator(seed=1)
+    first = generator.analyze([u'安全性能很好'], ANALYSES)
+    assert first == mockserver.ResultGenerator(seed=1).analyze(
+        [u'安全性能很好'], ANALYSES)
+    assert first != mockserver.ResultGenerator(seed=2).analyze(
+        [u'安全性能很好'], ANALYSES)
+
+
+def test_payload_size_multiplies_items():
+    small = mockserver.ResultGenerator(payload_size=1)
+    big = mockserver.ResultGenerator(payload_size=5)
+    text = u'安全性能很好'
+    assert len(big.concepts(text)) == 5 * len(small.concepts(text))
+    assert len(big.absa(text)['entities']) == \
+        5 * len(small.absa(text)['entities'])
+
+
+def test_single_document_sentiment():
+    result = mockserver.ResultGenerator().analyze([u'a', u'b'],
+                                                  ['sentiment'], True)
+    assert len(result['sentiment']) == 1
+
+
+@pytest.mark.parametrize('options', [{}, {'utf8': True},
+                                     {'compression': 'gzip'}])
+def test_results_are_writable(server, options):
+    api = client.AnacodeClient('token', base_url=server.url, **options)
+    result = api.analyze([u'安全性能很好', u'很帅气'], ANALYSES)
+    writer = writers.DataFrameWriter()
+    writer.init()
+    writer.write_analysis(result)
+    writer.close()
+    assert writer.frames['categories'].doc_id.unique().tolist() == [0, 1]
+    assert writer.frames['absa_normalized_texts'].normalized_text.tolist() \
+        == [u'安全性能很好', u'很帅气']
+    assert set(api.scrape('http://example.com')) == \
+        {'url', 'title', 'date', 'text'}
+    assert server.requests == 2
+
+
+def test_errors_are_retried():
+    with mockserver.MockServer(error_rate=0.5, seed=3) as server:
+        api = client.AnacodeClient(
+            'token', base_url=server.url,
+            retry_policy=retry.RetryPolicy(max_retries=20,
+                                           backoff_factor=0.001))
+        for _ in range(10):
+            api.analyze([u'text'], ['sentiment'])
+    assert server.errors > 0
+    assert server.requests == server.errors + 10
+
+
+def test_unknown_path(server):
+    res = requests.post(server.url + 'unknown/', json={})
+    assert res.status_code == 404
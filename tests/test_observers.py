@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import mock
+import pytest
+import requests
+
+from anacode.api import client
+from anacode.api import writers
+from anacode.api import observers
+
+
+def response(status, content=b'{}'):
+    resp = requests.Response()
+    resp._content = content
+    resp.status_code = status
+    return resp
+
+
+class Recorder(observers.Observer):
+    def __init__(self):
+        self.events = []
+
+    def request_start(self, *args):
+        self.events.append(('request_start',) + args)
+
+    def request_end(self, *args):
+        self.events.append(('request_end',) + args)
+
+    def retry(self, *args):
+        self.events.append(('retry',) + args)
+
+    def decode(self, *args):
+        self.events.append(('decode',) + args)
+
+    def bulk_flush(self, *args):
+        self.events.append(('bulk_flush',) + args)
+
+    def writer_flush(self, *args):
+        self.events.append(('writer_flush',) + args)
+
+    def names(self):
+        return [event[0] for event in self.events]
+
+
+@pytest.fixture
+def sleep():
+    with mock.patch('anacode.api.client.time.sleep') as sleep:
+        yield sleep
+
+
+def test_histogram_percentiles():
+    histogram = observers.LatencyHistogram()
+    assert histogram.percentile(50) is None
+    for ms in range(1, 101):
+        histogram.add(ms / 1000.)
+    assert histogram.percentile(50) == pytest.approx(0.05, rel=0.05)
+    assert histogram.percentile(90) == pytest.approx(0.09, rel=0.05)
+    assert histogram.percentile(99) == pytest.approx(0.099, rel=0.05)
+    assert histogram.percentile(100) == pytest.approx(0.1, rel=0.05)
+    assert histogram.count == 100
+
+
+def test_failing_observer_does_not_interrupt():
+    class Broken(observers.Observer):
+        def decode(self, seconds, size):
+            raise RuntimeError('broken')
+
+    recorder = Recorder()
+    observers.notify([Broken(), recorder], 'decode', 0.1, 10)
+    assert recorder.events == [('decode', 0.1, 10)]
+
+
+def test_client_emits_request_events(sleep):
+    recorder = Recorder()
+    api = client.AnacodeClient('token', codec='json', observers=[recorder])
+    answers = [response(503), response(200, b'{"sentiment": []}')]
+    with mock.patch('requests.Session.post', side_effect=answers):
+        assert api.analyze(['text'], ['sentiment']) == {'sentiment': []}
+    assert recorder.names() == ['request_start', 'request_end', 'retry',
+                                'request_start', 'request_end', 'decode']
+    _, endpoint, status, latency, sent, received = recorder.events[1]
+    assert endpoint.endswith('/analyze/')
+    assert status == 503
+    assert sent == recorder.events[0][2] > 0
+    assert received == 2
+    assert recorder.events[2][1:] == (endpoint, 0, sleep.call_args[0][0], 503)
+    assert recorder.events[4][2] == 200
+    assert recorder.events[5][2] == len(b'{"sentiment": []}')
+
+
+def test_connection_error_reported_without_status(sleep):
+    recorder = Recorder()
+    api = client.AnacodeClient('token', codec='json', observers=[recorder])
+    answers = [requests.ConnectionError(), response(200)]
+    with mock.patch('requests.Session.post', side_effect=answers):
+        api.scrape('http://example.com')
+    assert recorder.events[1][2] is None
+    assert recorder.events[2][4] is None
+
+
+@pytest.mark.parametrize('mode', [{}, {'threads': 2, 'pipeline': True},
+                                  {'threads': 2, 'reorder': True}])
+def test_analyzer_emits_bulk_and_writer_events(mode):
+    recorder = Recorder()
+    api = client.AnacodeClient('token', codec='json')
+    api.call = lambda task: {'sentiment': [{'sentiment_value': 0.5}
+                                           for _ in task[1]]}
+    writer = writers.DataFrameWriter()
+    with client.Analyzer(api, writer, bulk_size=2, observers=[recorder],
+                         **mode) as analyzer:
+        for index in range(4):
+            analyzer.analyze([str(index)], ['sentiment'])
+    bulks = [e for e in recorder.events if e[0] == 'bulk_flush']
+    flushes = [e for e in recorder.events if e[0] == 'writer_flush']
+    assert [e[1] for e in bulks] == [2, 2]
+    assert sum(e[1] for e in flushes) == 4
+    for _, results, seconds, flatten, write in flushes:
+        assert 0 <= flatten <= seconds
+        assert 0 <= write <= seconds
+
+
+def test_collector_summary(sleep):
+    collector = observers.MetricsCollector()
+    api = client.AnacodeClient('token', codec='json', observers=[collector])
+    writer = writers.DataFrameWriter()
+    answers = [response(500)] + [response(200, b'{"sentiment": []}')] * 3
+    with mock.patch('requests.Session.post', side_effect=answers):
+        with client.Analyzer(api, writer, bulk_size=3,
+                             observers=[collector]) as analyzer:
+            for index in range(3):
+                analyzer.analyze([str(index)], ['sentiment'])
+    summary = collector.summary()
+    counters = summary['counters']
+    assert counters['requests'] == 4
+    assert counters['errors'] == 1
+    assert counters['retries'] == 1
+    assert counters['bulks'] == 1
+    assert counters['written'] == 3
+    assert counters['received_bytes'] == 2 + 3 * 17
+    latency = summary['latency']
+    assert latency['p50'] <= latency['p90'] <= latency['p99'] <= \
+        latency['max']
+    assert summary['throughput']['requests'] > 0
+    assert set(summary['times']) == {'network', 'decode', 'flatten', 'write'}
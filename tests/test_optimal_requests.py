@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import pytest
+
+from anacode.api import client
+
+
+ANALYSES = ['concepts', 'absa']
+
+
+def body_size(texts, utf8, codec=None):
+    body = client.get_codec(codec).dumps({'texts': texts,
+                                          'analyses': ANALYSES}, utf8)
+    return len(body)
+
+
+@pytest.fixture
+def texts():
+    rand = random.Random(42)
+    base = '安全性能很好，很帅气。Lenovo 很好'
+    return [base * rand.randint(1, 30) for _ in range(200)]
+
+
+def test_unsupported_analysis():
+    with pytest.raises(ValueError):
+        list(client.optimal_requests(['text'], ['concepts', 'syntax']))
+
+
+@pytest.mark.parametrize('utf8', [False, True])
+def test_requests_fill_max_size_exactly(texts, utf8):
+    max_size = 5000
+    batches = list(client.optimal_requests(texts, ANALYSES, max_size,
+                                           utf8=utf8))
+    assert [t for batch in batches for t in batch] == texts
+    position = 0
+    for batch in batches:
+        position += len(batch)
+        assert body_size(batch, utf8) <= max_size
+        if position < len(texts):
+            assert body_size(batch + [texts[position]], utf8) > max_size
+
+
+def test_utf8_needs_fewer_requests(texts):
+    escaped = list(client.optimal_requests(texts, ANALYSES, 5000))
+    utf8 = list(client.optimal_requests(texts, ANALYSES, 5000, utf8=True))
+    assert len(utf8) < len(escaped) * 0.6
+
+
+def test_oversized_text_alone():
+    batches = list(client.optimal_requests(['a', 'b' * 100, 'c'], ANALYSES,
+                                           80))
+    assert batches == [['a'], ['b' * 100], ['c']]
+
+
+@pytest.mark.parametrize('utf8', [False, True])
+def test_packed_requests(texts, utf8):
+    max_size = 5000
+    batches, permutation = client.packed_requests(texts, ANALYSES, max_size,
+                                                  utf8=utf8)
+    assert sorted(permutation) == list(range(len(texts)))
+    flat = [t for batch in batches for t in batch]
+    assert flat == [texts[i] for i in permutation]
+    for batch in batches:
+        assert body_size(batch, utf8) <= max_size
+    greedy = list(client.optimal_requests(texts, ANALYSES, max_size,
+                                          utf8=utf8))
+    assert len(batches) <= len(greedy)
+
+
+def test_packing_beats_greedy():
+    # greedy packing needs separate request for every text
+    texts = ['a' * 60, 'b' * 20, 'c' * 60, 'd' * 20]
+    max_size = body_size(['a' * 60, 'b' * 20], False)
+    greedy = list(client.optimal_requests(texts, ANALYSES, max_size - 1))
+    batches, permutation = client.packed_requests(texts, ANALYSES,
+                                                  max_size - 1)
+    assert len(greedy) == 4
+    assert len(batches) == 3
+    batches, permutation = client.packed_requests(texts, ANALYSES, max_size)
+    assert len(batches) == 2
+    assert permutation == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'deflate'])
+@pytest.mark.parametrize('utf8', [False, True])
+def test_compressed_requests_fit_max_size(texts, utf8, compression):
+    max_size = 2000
+    batches = list(client.optimal_requests(texts, ANALYSES, max_size,
+                                           utf8=utf8,
+                                           compression=compression))
+    assert [t for batch in batches for t in batch] == texts
+    for batch in batches:
+        _, body, _ = client._request_body(
+            {'texts': batch, 'analyses': ANALYSES}, utf8, compression)
+        assert len(body['data']) <= max_size
+    plain = list(client.optimal_requests(texts, ANALYSES, max_size,
+                                         utf8=utf8))
+    assert len(batches) < len(plain)
+
+
+def test_unsupported_compression():
+    with pytest.raises(ValueError):
+        list(client.optimal_requests(['text'], ANALYSES, compression='br'))
+
+
+@pytest.mark.parametrize('codec', ['json', 'orjson', 'ujson'])
+@pytest.mark.parametrize('utf8', [False, True])
+def test_sizes_match_codec(texts, codec, utf8):
+    try:
+        client.get_codec(codec)
+    except ImportError:
+        pytest.skip('{} is not installed'.format(codec))
+    batches = list(client.optimal_requests(texts, ANALYSES, 5000, utf8=utf8,
+                                           codec=codec))
+    position = 0
+    for batch in batches:
+        position += len(batch)
+        assert body_size(batch, utf8, codec) <= 5000
+        if position < len(texts):
+            assert body_size(batch + [texts[position]], utf8, codec) > 5000
+
+
+def test_stdlib_codec_matches_json_module():
+    codec = client.get_codec('json')
+    data = {'texts': ['安全性能很好'], 'analyses': ['concepts']}
+    assert codec.dumps(data) == json.dumps(data).encode('utf-8')
+    assert codec.loads(codec.dumps(data, utf8=True)) == data
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        client.get_codec('yaml')
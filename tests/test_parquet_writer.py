@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+import pandas as pd
+from anacode.api import client
+from anacode.api import journal
+from anacode.api import writers
+from anacode.agg import aggregation as agg
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.parquet
+
+
+@pytest.fixture
+def target(tmpdir):
+    return tmpdir.mkdir('target')
+
+
+@pytest.fixture
+def parquet_writer(target, concepts, sentiments, categories, absa):
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.write_categories(categories)
+    writer.write_sentiment(sentiments)
+    writer.write_concepts(concepts)
+    writer.write_absa(absa)
+    writer.close()
+    return writer
+
+
+@pytest.fixture
+def frame_writer(concepts, sentiments, categories, absa):
+    writer = writers.DataFrameWriter()
+    writer.init()
+    writer.write_categories(categories)
+    writer.write_sentiment(sentiments)
+    writer.write_concepts(concepts)
+    writer.write_absa(absa)
+    writer.close()
+    return writer
+
+
+def test_files_for_all_tables(target, parquet_writer):
+    contents = sorted(f.basename for f in target.listdir())
+    assert contents == sorted(name + '.parquet' for name in writers.HEADERS)
+
+
+def test_only_tables_with_rows_written(target, sentiments):
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.write_sentiment(sentiments)
+    writer.close()
+    assert [f.basename for f in target.listdir()] == ['sentiments.parquet']
+
+
+def test_columns_are_typed(target, parquet_writer):
+    schema = pyarrow.parquet.read_schema(
+        str(target.join('absa_relations.parquet')))
+    assert schema.names == writers.HEADERS['absa_relations']
+    assert schema.field('doc_id').type == pyarrow.int64()
+    assert schema.field('sentiment_value').type == pyarrow.float64()
+    assert schema.field('is_external').type == pyarrow.bool_()
+    assert schema.field('surface_string').type == pyarrow.string()
+
+
+def test_string_columns_dictionary_encoded(target, parquet_writer):
+    metadata = pyarrow.parquet.ParquetFile(
+        str(target.join('categories.parquet'))).metadata
+    names = writers.HEADERS['categories']
+    row_group = metadata.row_group(0)
+    encodings = {names[i]: row_group.column(i).encodings
+                 for i in range(len(names))}
+    assert any('DICTIONARY' in e for e in encodings['category'])
+
+
+def test_row_groups_flushed(target, sentiments):
+    writer = writers.ParquetWriter(str(target), row_group_size=4)
+    writer.init()
+    for _ in range(5):
+        writer.write_analysis({'sentiment': sentiments})
+    doc_ids, _, values = writer._columns['sentiments']
+    assert len(doc_ids.values) == 2
+    # numbers wait for next row group in typed arrays, not python lists
+    assert doc_ids.values.typecode == 'q'
+    assert values.values.typecode == 'd'
+    writer.close()
+    parquet = pyarrow.parquet.ParquetFile(str(target.join(
+        'sentiments.parquet')))
+    assert parquet.metadata.num_rows == 10
+    assert parquet.metadata.num_row_groups == 3
+    frame = parquet.read().to_pandas()
+    assert frame.doc_id.tolist() == list(range(10))
+
+
+def test_previous_files_backed_up(target, sentiments):
+    for _ in range(2):
+        writer = writers.ParquetWriter(str(target))
+        writer.init()
+        writer.write_sentiment(sentiments)
+        writer.close()
+    contents = [f.basename for f in target.listdir()]
+    assert len(contents) == 2
+    assert 'sentiments.parquet' in contents
+
+
+def _nulls_as_none(frame):
+    return frame.astype(object).where(frame.notna(), None)
+
+
+@pytest.mark.parametrize('dataset_name', [
+    '_categories', '_sentiments', '_concepts', '_concepts_surface_strings',
+    '_absa_entities', '_absa_normalized_texts', '_absa_relations',
+    '_absa_relations_entities', '_absa_evaluations',
+    '_absa_evaluations_entities',
+])
+def test_data_load_from_parquet_writer(parquet_writer, frame_writer,
+                                       dataset_name):
+    loaded = getattr(agg.DatasetLoader.from_writer(parquet_writer),
+                     dataset_name)
+    expected = getattr(agg.DatasetLoader.from_writer(frame_writer),
+                       dataset_name)
+    pd.testing.assert_frame_equal(_nulls_as_none(loaded),
+                                  _nulls_as_none(expected), check_dtype=False)
+
+
+def test_load_selected_columns(parquet_writer):
+    dataset = agg.DatasetLoader.from_parquet(
+        parquet_writer.target_dir, columns={'concepts': ['doc_id', 'concept']})
+    assert dataset['concepts'].columns.tolist() == ['doc_id', 'concept']
+    assert dataset['sentiments'].shape == (2, 3)
+
+
+def test_load_from_empty_directory(target):
+    with pytest.raises(ValueError):
+        agg.DatasetLoader.from_parquet(str(target))
+
+
+def test_checkpoint_finishes_parts(target, sentiments):
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.write_analysis({'sentiment': sentiments})
+    state = writer.checkpoint(force=True)
+    assert state['parts'] == {'sentiments': 1}
+    assert pyarrow.parquet.ParquetFile(str(target.join(
+        'sentiments.parquet'))).metadata.num_rows == 2
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    assert sorted(f.basename for f in target.listdir()) == \
+        ['sentiments.1.parquet', 'sentiments.parquet']
+    frame = agg.DatasetLoader.from_parquet(str(target))['sentiments']
+    assert frame.doc_id.tolist() == [0, 1, 2, 3]
+
+
+def test_restore_drops_parts_after_checkpoint(target, sentiments):
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.write_analysis({'sentiment': sentiments})
+    state = writer.checkpoint(force=True)
+    writer.write_analysis({'sentiment': sentiments})
+    writer._flush('sentiments')
+    # killed before the part was finished, file has no footer
+    assert target.join('sentiments.1.parquet').check()
+
+    writer = writers.ParquetWriter(str(target))
+    writer.restore(state)
+    writer.init()
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    assert sorted(f.basename for f in target.listdir()) == \
+        ['sentiments.1.parquet', 'sentiments.parquet']
+    frame = agg.DatasetLoader.from_parquet(str(target))['sentiments']
+    assert frame.doc_id.tolist() == [0, 1, 2, 3]
+
+
+def test_parts_backed_up(target, sentiments):
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.write_analysis({'sentiment': sentiments})
+    writer.checkpoint(force=True)
+    writer.write_analysis({'sentiment': sentiments})
+    writer.close()
+    writer = writers.ParquetWriter(str(target))
+    writer.init()
+    writer.close()
+    assert [name for _, name in writers.parquet_parts(str(target),
+                                                      'sentiments')] == []
+    assert len(target.listdir()) == 2
+
+
+def test_checkpoint_postponed(target, sentiments):
+    writer = writers.ParquetWriter(str(target), checkpoint_rows=3)
+    writer.init()
+    writer.write_analysis({'sentiment': sentiments})
+    assert writer.checkpoint() is None
+    assert target.listdir() == []
+    writer.write_analysis({'sentiment': sentiments})
+    assert writer.checkpoint()['parts'] == {'sentiments': 1}
+    writer.write_analysis({'sentiment': sentiments})
+    assert writer.checkpoint() is None
+    writer.close()
+    assert len(target.listdir()) == 2
+
+
+def test_journal_checkpoints_do_not_split_parts(tmpdir, target):
+    path = str(tmpdir.join('journal.jsonl'))
+    api = client.AnacodeClient('token')
+    api.call = lambda task: {'sentiment': [{'sentiment_value': t}
+                                           for t in task[1]]}
+    log = journal.Journal(path)
+    writer = writers.ParquetWriter(str(target), checkpoint_rows=200)
+    with client.Analyzer(api, writer, bulk_size=10,
+                         journal=log) as analyzer:
+        for index in range(500):
+            analyzer.analyze([index], ['sentiment'])
+    assert len(writers.parquet_parts(str(target), 'sentiments')) == 3
+    assert journal.Journal(path).written_tasks == 500
+    frame = agg.DatasetLoader.from_parquet(str(target))['sentiments']
+    assert frame.doc_id.tolist() == list(range(500))
+
+
+@pytest.mark.parametrize('checkpoint_rows', [1, 3, 100])
+def test_resume_with_journal(tmpdir, target, checkpoint_rows):
+    path = str(tmpdir.join('journal.jsonl'))
+
+    def run(crash_at=None):
+        api = client.AnacodeClient('token')
+
+        def call(task):
+            if task[1][0] == crash_at:
+                raise requests.ConnectionError('Connection lost')
+            return {'sentiment': [{'sentiment_value': t} for t in task[1]]}
+
+        api.call = call
+        writer = writers.ParquetWriter(str(target),
+                                       checkpoint_rows=checkpoint_rows)
+        with client.Analyzer(api, writer, bulk_size=2,
+                             journal=journal.Journal(path)) as analyzer:
+            for index in range(10):
+                analyzer.analyze([index], ['sentiment'])
+
+    with pytest.raises(requests.ConnectionError):
+        run(crash_at=7)
+    run()
+    frame = agg.DatasetLoader.from_parquet(str(target))['sentiments']
+    assert frame.doc_id.tolist() == list(range(10))
+    assert frame.sentiment_value.tolist() == list(range(10))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import mock
+import pytest
+import requests
+
+from anacode.api import client
+from anacode.api import retry
+
+
+def response(status_code, headers=None):
+    resp = requests.Response()
+    resp._content = b'{}'
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    return resp
+
+
+class FakeSession(object):
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleep(mocker):
+    return mocker.patch('anacode.api.client.time.sleep')
+
+
+def analysis(session, policy):
+    return client._analysis('http://api/analyze/', 'token', session=session,
+                            retry_policy=policy, texts=['text'],
+                            analyses=['sentiment'])
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retryable_statuses(sleep, status):
+    session = FakeSession([response(status), response(200)])
+    res = analysis(session, retry.RetryPolicy())
+    assert res.status_code == 200
+    assert session.calls == 2
+
+
+@pytest.mark.parametrize('status', [400, 401, 404])
+def test_client_errors_raised_immediately(sleep, status):
+    session = FakeSession([response(status)])
+    with pytest.raises(requests.HTTPError):
+        analysis(session, retry.RetryPolicy())
+    assert session.calls == 1
+    assert sleep.call_count == 0
+
+
+def test_error_raised_after_max_retries(sleep):
+    session = FakeSession([response(503)] * 3)
+    with pytest.raises(requests.HTTPError) as error:
+        analysis(session, retry.RetryPolicy(max_retries=2))
+    assert error.value.response.status_code == 503
+    assert session.calls == 3
+
+
+def test_connection_errors_retried(sleep):
+    session = FakeSession([requests.ConnectionError(), response(200)])
+    assert analysis(session, retry.RetryPolicy()).status_code == 200
+    session = FakeSession([requests.ConnectionError()] * 2)
+    with pytest.raises(requests.ConnectionError):
+        analysis(session, retry.RetryPolicy(max_retries=1))
+
+
+def test_status_retries_override(sleep):
+    policy = retry.RetryPolicy(max_retries=1, status_retries={429: 4,
+                                                              500: 0})
+    session = FakeSession([response(429)] * 4 + [response(200)])
+    assert analysis(session, policy).status_code == 200
+    session = FakeSession([response(500)])
+    with pytest.raises(requests.HTTPError):
+        analysis(session, policy)
+
+
+def test_retry_after_respected(sleep):
+    session = FakeSession([response(429, {'Retry-After': '7'}),
+                           response(200)])
+    analysis(session, retry.RetryPolicy())
+    sleep.assert_called_once_with(7.)
+
+
+def test_exponential_backoff_without_jitter():
+    policy = retry.RetryPolicy(backoff_factor=0.5, max_backoff=3,
+                               jitter=False)
+    assert [policy.backoff(a) for a in range(5)] == [0.5, 1, 2, 3, 3]
+
+
+def test_full_jitter():
+    policy = retry.RetryPolicy(backoff_factor=1)
+    delays = {policy.backoff(3) for _ in range(50)}
+    assert len(delays) > 1
+    assert all(0 <= d <= 8 for d in delays)
+
+
+def test_budget_limits_retries():
+    budget = retry.RetryBudget(ratio=0.5, min_retries=1)
+    for _ in range(4):
+        budget.deposit()
+    assert [budget.withdraw() for _ in range(4)] == [True, True, True, False]
+
+
+def test_budget_window_expires():
+    budget = retry.RetryBudget(ratio=0, min_retries=1, ttl=10)
+    with mock.patch('anacode.api.retry.time.time', return_value=100):
+        assert budget.withdraw()
+        assert not budget.withdraw()
+    with mock.patch('anacode.api.retry.time.time', return_value=111):
+        assert budget.withdraw()
+
+
+def test_exhausted_budget_stops_retries(sleep):
+    policy = retry.RetryPolicy(budget=retry.RetryBudget(ratio=0,
+                                                        min_retries=0))
+    session = FakeSession([response(503)])
+    with pytest.raises(requests.HTTPError):
+        analysis(session, policy)
+    assert session.calls == 1
+
+
+def test_retries_counted_in_transfer_stats(sleep):
+    session = FakeSession([response(503), response(503), response(200)])
+    transfer = client.TransferStats()
+    client._analysis('http://api/analyze/', 'token', session=session,
+                     retry_policy=retry.RetryPolicy(), transfer_stats=transfer,
+                     texts=['text'], analyses=['sentiment'])
+    stats = transfer.as_dict()
+    assert stats['requests'] == 3
+    assert stats['retries'] == 2
+    assert transfer.latency_percentile(50) is not None
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import zlib
+import threading
+import pytest
+
+try:
+    import socketserver
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    import SocketServer as socketserver
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from anacode.api import client
+from anacode.api import limits
+from anacode.api import writers
+
+
+class EmptyJsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    last_request = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        EmptyJsonHandler.last_request = (self.headers, self.rfile.read(length))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        if self.headers.get('Connection') == 'close':
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = HTTPServer(('127.0.0.1', 0), EmptyJsonHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d/' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_released_session_is_reused():
+    pool = client.SessionPool(size=2)
+    session = pool.acquire()
+    pool.release(session)
+    assert pool.acquire() is session
+
+
+def test_acquire_blocks_when_all_sessions_used():
+    pool = client.SessionPool(size=1)
+    first = pool.acquire()
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(0.1)
+    assert acquired == []
+    pool.release(first)
+    thread.join(5)
+    assert acquired == [first]
+    stats = pool.stats()
+    assert stats['sessions'] == 1
+    assert stats['idle'] == 0
+    assert stats['acquired'] == 2
+
+
+class CountingHandler(EmptyJsonHandler):
+    lock = threading.Lock()
+    connections = 0
+    active = 0
+    max_active = 0
+
+    def setup(self):
+        EmptyJsonHandler.setup(self)
+        with self.lock:
+            CountingHandler.connections += 1
+
+    def do_POST(self):
+        with self.lock:
+            CountingHandler.active += 1
+            CountingHandler.max_active = max(CountingHandler.max_active,
+                                             CountingHandler.active)
+        time.sleep(0.01)
+        with self.lock:
+            CountingHandler.active -= 1
+        EmptyJsonHandler.do_POST(self)
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def test_concurrent_connections_within_size():
+    server = ThreadingServer(('127.0.0.1', 0), CountingHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    api = client.AnacodeClient('token', url,
+                               session_pool=client.SessionPool(size=2))
+
+    def analyze():
+        for _ in range(5):
+            api.analyze(['安全性能很好，很帅气。'], ['categories'])
+
+    threads = [threading.Thread(target=analyze) for _ in range(6)]
+    try:
+        for analyzing in threads:
+            analyzing.start()
+        for analyzing in threads:
+            analyzing.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert api.connection_stats()['requests'] == 30
+    assert CountingHandler.max_active <= 2
+    assert CountingHandler.connections <= 2
+
+
+def test_grow_wakes_up_waiting_acquire():
+    pool = client.SessionPool(size=1)
+    pool.acquire()
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.daemon = True
+    thread.start()
+    thread.join(0.1)
+    assert acquired == []
+    pool.grow(2)
+    thread.join(5)
+    assert len(acquired) == 1
+    pool.grow(1)
+    assert pool.size == 2
+
+
+class BarrierHandler(EmptyJsonHandler):
+    barrier = None
+    broken = []
+
+    def do_POST(self):
+        try:
+            BarrierHandler.barrier.wait()
+        except threading.BrokenBarrierError:
+            BarrierHandler.broken.append(True)
+        EmptyJsonHandler.do_POST(self)
+
+
+class NullWriter(writers.Writer):
+    def _add_new_data_from_dict(self, new_data):
+        pass
+
+
+def test_default_pool_is_unbounded():
+    pool = client.SessionPool()
+    sessions = [pool.acquire() for _ in range(30)]
+    assert len(set(map(id, sessions))) == 30
+    pool.grow(5)
+    assert pool.size is None
+    for session in sessions:
+        pool.release(session)
+    assert pool.stats()['idle'] == 30
+    pool.close()
+
+
+def test_analyzer_not_limited_by_bounded_pool():
+    server = ThreadingServer(('127.0.0.1', 0), BarrierHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    # all 20 requests have to be in flight at once to pass the barrier
+    BarrierHandler.barrier = threading.Barrier(20, timeout=5)
+    BarrierHandler.broken = []
+    api = client.AnacodeClient('token', url,
+                               session_pool=client.SessionPool(size=10))
+    try:
+        with client.Analyzer(api, NullWriter(), threads=20,
+                             bulk_size=20) as analyzer:
+            for _ in range(20):
+                analyzer.analyze(['安全性能很好，很帅气。'], ['categories'])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert BarrierHandler.broken == []
+    assert api.session_pool.size == 20
+
+
+def test_adapter_limits():
+    pool = client.SessionPool(pool_connections=3, pool_maxsize=7)
+    with pool.session() as session:
+        adapter = session.get_adapter('https://api.anacode.de/')
+        assert adapter._pool_connections == 3
+        assert adapter._pool_maxsize == 7
+
+
+def test_keep_alive_connections_reused(server_url):
+    api = client.AnacodeClient('token', server_url)
+    for _ in range(5):
+        api.analyze(['安全性能很好，很帅气。'], ['categories'])
+    stats = api.connection_stats()
+    assert stats['requests'] == 5
+    assert stats['connections'] == 1
+    assert stats['reused'] == 4
+    api.close()
+    assert api.connection_stats()['sessions'] == 0
+
+
+def test_no_keep_alive_connections(server_url):
+    pool = client.SessionPool(keep_alive=False)
+    api = client.AnacodeClient('token', server_url, session_pool=pool)
+    for _ in range(3):
+        api.analyze(['安全性能很好，很帅气。'], ['categories'])
+    stats = api.connection_stats()
+    assert stats['requests'] == 3
+    assert stats['connections'] == 3
+    assert stats['reused'] == 0
+
+
+def test_rate_limited_client(server_url):
+    limiter = limits.RateLimiter(chars_per_second=200, burst=0.1)
+    api = client.AnacodeClient('token', server_url, rate_limiter=limiter)
+    start = time.time()
+    for _ in range(3):
+        api.analyze(['安全性能很好，很帅气。' * 2], ['categories'])
+    # 20 characters fit into bucket, 40 more at 200 per second
+    assert 0.15 < time.time() - start < 0.4
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'deflate'])
+def test_compressed_request_body(server_url, compression):
+    api = client.AnacodeClient('token', server_url, compression=compression)
+    texts = ['安全性能很好，很帅气。'] * 20
+    api.analyze(texts, ['categories'])
+    headers, body = EmptyJsonHandler.last_request
+    assert headers['Content-Encoding'] == compression
+    assert 'gzip' in headers['Accept-Encoding']
+    data = json.loads(zlib.decompress(body, client.COMPRESSION_WBITS[
+        compression]).decode('utf-8'))
+    assert data['texts'] == texts
+    stats = api.transfer_stats()
+    assert stats['requests'] == 1
+    assert stats['sent_bytes'] == len(body)
+    assert stats['body_bytes'] > 2 * stats['sent_bytes']
+    assert stats['received_bytes'] == 2
+
+
+def test_uncompressed_transfer_stats(server_url):
+    api = client.AnacodeClient('token', server_url)
+    api.analyze(['安全性能很好，很帅气。'], ['categories'])
+    headers, body = EmptyJsonHandler.last_request
+    assert 'Content-Encoding' not in headers
+    stats = api.transfer_stats()
+    assert stats['sent_bytes'] == stats['body_bytes'] == len(body)
+
+
+def test_unsupported_client_compression():
+    with pytest.raises(ValueError):
+        client.AnacodeClient('token', compression='br')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import io
+import gzip
+import json
+import pytest
+
+from anacode.api import client
+from anacode.api import sources
+from anacode.api import writers
+
+
+TEXTS = [u'安全性能很好，很帅气。', u'Lenovo 很好', u'很"帅",气']
+
+
+def test_iterable_passed_through():
+    generator = (text for text in TEXTS)
+    assert list(sources.iter_texts(generator)) == TEXTS
+
+
+@pytest.mark.parametrize('name,content', [
+    ('texts.txt', u'\n'.join(TEXTS) + u'\n\n'),
+    ('texts.jsonl', u'\n'.join(json.dumps({'text': t, 'id': i})
+                               for i, t in enumerate(TEXTS))),
+    ('texts.ndjson', u'\n'.join(json.dumps(t) for t in TEXTS)),
+    ('texts.csv', u'id,text\n' + u''.join(
+        u'{},"{}"\n'.format(i, t.replace('"', '""'))
+        for i, t in enumerate(TEXTS))),
+])
+def test_read_files(tmpdir, name, content):
+    path = tmpdir.join(name)
+    path.write_text(content, encoding='utf-8')
+    assert list(sources.iter_texts(str(path))) == TEXTS
+
+
+def test_read_gzipped_file(tmpdir):
+    path = str(tmpdir.join('texts.jsonl.gz'))
+    with gzip.open(path, 'wb') as fp:
+        for text in TEXTS:
+            fp.write(json.dumps({'body': text}).encode('utf-8') + b'\n')
+    assert list(sources.iter_texts(path, field='body')) == TEXTS
+
+
+def test_read_stdin(monkeypatch):
+    monkeypatch.setattr('sys.stdin', io.StringIO(u'\n'.join(TEXTS)))
+    assert list(sources.iter_texts('-')) == TEXTS
+
+
+def test_read_stdin_with_encoding(monkeypatch):
+    stdin = io.TextIOWrapper(io.BytesIO(u'\n'.join(TEXTS).encode('gbk')),
+                             encoding='utf-8')
+    monkeypatch.setattr('sys.stdin', stdin)
+    assert list(sources.iter_texts('-', encoding='gbk')) == TEXTS
+    assert not stdin.closed
+
+
+class Response(object):
+    def __init__(self, content):
+        self.content = content
+
+
+def test_analyze_stream_counts_external_entity_data():
+    external_entity_data = [{'type': 'brand', 'surface': [u'联想' * 20]}]
+    sizes = []
+    api = client.AnacodeClient('token')
+
+    def post(endpoint, **data):
+        assert data['absa'] == {'external_entity_data': external_entity_data}
+        sizes.append(len(client._request_body(data)[1]['data']))
+        return Response(json.dumps({'absa': [
+            {'entities': [], 'normalized_text': t, 'relations': [],
+             'evaluations': []} for t in data['texts']]}).encode('utf-8'))
+
+    api._post = post
+    texts = [u'text %d' % index for index in range(100)]
+    with client.Analyzer(api, writers.Writer(), bulk_size=2) as analyzer:
+        analyzer.analyze_stream(texts, ['absa'], external_entity_data,
+                                max_size=400)
+    assert len(sizes) > 2
+    assert max(sizes) <= 400
+
+
+def test_analyze_stream_is_lazy():
+    read = []
+
+    def generate():
+        for index in range(100):
+            read.append(index)
+            yield u'text %d' % index
+
+    class RecordingClient(object):
+        def call(self, task):
+            # only texts of current bulk of two requests are read ahead
+            assert len(read) - sum(map(len, sent)) < 40
+            sent.append(task[1])
+            return {'sentiment': [{'sentiment_value': 0.5}] * len(task[1])}
+
+    sent = []
+    writer = writers.DataFrameWriter()
+    analyzer = client.Analyzer(RecordingClient(), writer, bulk_size=2)
+    with analyzer:
+        count = analyzer.analyze_stream(generate(), ['sentiment'],
+                                        max_size=200)
+    assert count == 100
+    assert [t for texts in sent for t in texts] == \
+        [u'text %d' % i for i in range(100)]
+    assert all(len(texts) > 1 for texts in sent[:-1])
+    assert writer.frames['sentiments'].doc_id.tolist() == list(range(100))
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import sqlite3
+import subprocess
+import pytest
+import pandas as pd
+from anacode import codes
+from anacode.api import writers
+from anacode.agg import aggregation as agg
+from anacode.agg import sql
+
+
+@pytest.fixture
+def db_path(tmpdir):
+    return str(tmpdir.join('anacode.db'))
+
+
+def write_all(writer, concepts, sentiments, categories, absa):
+    writer.init()
+    writer.write_bulk([
+        (codes.ANALYZE, {'categories': categories,
+                         'sentiment': sentiments, 'concepts': concepts,
+                         'absa': absa}),
+        (codes.ANALYZE, {'categories': categories,
+                         'sentiment': sentiments, 'concepts': concepts,
+                         'absa': absa}),
+    ])
+    writer.close()
+    return writer
+
+
+@pytest.fixture
+def sqlite_writer(db_path, concepts, sentiments, categories, absa):
+    return write_all(writers.SQLiteWriter(db_path), concepts, sentiments,
+                     categories, absa)
+
+
+@pytest.fixture
+def frame_writer(concepts, sentiments, categories, absa):
+    return write_all(writers.DataFrameWriter(), concepts, sentiments,
+                     categories, absa)
+
+
+@pytest.fixture
+def loaders(sqlite_writer, frame_writer):
+    return (agg.DatasetLoader.from_writer(sqlite_writer),
+            agg.DatasetLoader.from_writer(frame_writer))
+
+
+def _nulls_as_none(frame):
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def test_tables_and_indexes(db_path, sqlite_writer):
+    db = sqlite3.connect(db_path)
+    tables = {row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == set(writers.HEADERS)
+    indexes = {row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'concepts_doc_id_text_order' in indexes
+    assert 'concepts_concept' in indexes
+    assert 'absa_entities_entity_name' in indexes
+    plan = db.execute('EXPLAIN QUERY PLAN SELECT * FROM absa_entities '
+                      'WHERE entity_name = ?', ('Safety',)).fetchall()
+    assert 'absa_entities_entity_name' in str(plan)
+
+
+def test_bulk_written_in_one_transaction(db_path, sentiments):
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    reader = sqlite3.connect(db_path)
+    original = writer._add_new_data_from_dict
+    counts = []
+
+    def add(new_data):
+        original(new_data)
+        counts.append(reader.execute(
+            'SELECT COUNT(*) FROM sentiments').fetchone()[0])
+
+    writer._add_new_data_from_dict = add
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})] * 3)
+    assert counts == [0, 0, 0]
+    assert reader.execute('SELECT COUNT(*) FROM sentiments').fetchone()[0] \
+        == 6
+    writer.close()
+
+
+def test_failed_bulk_rolled_back(db_path, categories, sentiments):
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    ids = dict(writer.ids)
+    original = writer._add_new_data_from_dict
+    calls = []
+
+    def add(new_data):
+        calls.append(new_data)
+        if len(calls) == 2:
+            raise IOError('Disk full')
+        original(new_data)
+
+    writer._add_new_data_from_dict = add
+    with pytest.raises(IOError):
+        writer.write_bulk([(codes.ANALYZE, {'categories': categories})] * 3)
+    assert writer.ids == ids
+    writer._add_new_data_from_dict = original
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    writer.close()
+    db = sqlite3.connect(db_path)
+    assert db.execute('SELECT COUNT(*) FROM categories').fetchone()[0] == 0
+    assert [row[0] for row in db.execute('SELECT doc_id FROM sentiments')] \
+        == [0, 1, 2, 3]
+    db.close()
+
+
+@pytest.mark.parametrize('name', sorted(writers.HEADERS))
+def test_tables_match_frame_writer(loaders, name):
+    sqlite_loader, frame_loader = loaders
+    pd.testing.assert_frame_equal(_nulls_as_none(sqlite_loader[name]),
+                                  _nulls_as_none(frame_loader[name]),
+                                  check_dtype=False)
+
+
+def test_restore_drops_rows_after_checkpoint(db_path, sentiments):
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    state = writer.checkpoint()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    writer.close()
+
+    writer = writers.SQLiteWriter(db_path)
+    writer.restore(state)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    writer.close()
+    frame = agg.DatasetLoader.from_sqlite(db_path)['sentiments']
+    assert frame.doc_id.tolist() == [0, 1, 2, 3]
+
+
+CRASHING_WRITER = """
+import os, sys, json
+from anacode import codes
+from anacode.api import writers
+writer = writers.SQLiteWriter(sys.argv[1])
+writer.init()
+writer.write_bulk([(codes.ANALYZE, {'sentiment': json.loads(sys.argv[2])})])
+writer.checkpoint()
+os._exit(1)
+"""
+
+
+def test_backup_of_crashed_database(tmpdir, sentiments):
+    db_path = str(tmpdir.join('anacode.db'))
+    code = subprocess.call([sys.executable, '-c', CRASHING_WRITER, db_path,
+                            json.dumps(sentiments)])
+    assert code == 1
+    assert os.path.exists(db_path + '-wal')
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    writer.close()
+    backups = [name for name in os.listdir(str(tmpdir))
+               if name != 'anacode.db']
+    assert len(backups) == 1
+    frame = agg.DatasetLoader.from_sqlite(
+        str(tmpdir.join(backups[0])))['sentiments']
+    assert frame.doc_id.tolist() == [0, 1]
+
+
+def test_loader_path_with_uri_characters(tmpdir, sentiments):
+    db_path = str(tmpdir.mkdir('sq #1?').join('anacode.db'))
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    writer.write_bulk([(codes.ANALYZE, {'sentiment': sentiments})])
+    writer.close()
+    frame = agg.DatasetLoader.from_sqlite(db_path)['sentiments']
+    assert frame.doc_id.tolist() == [0, 1]
+    assert os.listdir(str(tmpdir)) == ['sq #1?']
+
+
+def test_loader_reads_tables_lazily(loaders):
+    sqlite_loader, _ = loaders
+    assert isinstance(sqlite_loader, sql.SQLiteDatasetLoader)
+    concepts = sqlite_loader.concepts
+    assert isinstance(concepts, sql.SQLiteConceptsDataset)
+    concepts.most_common_concepts()
+    assert not sqlite_loader._tables.loaded('concepts')
+
+
+@pytest.mark.parametrize('method,args', [
+    ('concept_frequency', (['Samsung', 'Lenovo', 'Missing'],)),
+    ('concept_frequency', ('Lenovo', 'brand', True)),
+    ('most_common_concepts', (1,)),
+    ('most_common_concepts', (15, 'brand', True)),
+    ('least_common_concepts', (15,)),
+])
+def test_concept_aggregations_match_pandas(loaders, method, args):
+    sqlite_loader, frame_loader = loaders
+    result = getattr(sqlite_loader.concepts, method)(*args)
+    expected = getattr(frame_loader.concepts, method)(*args)
+    pd.testing.assert_series_equal(result.sort_index(),
+                                   expected.sort_index(), check_dtype=False,
+                                   check_names=False)
+    assert result.index.name == expected.index.name
+    # normalized pandas result loses its plot id
+    assert result._plot_id == getattr(expected, '_plot_id', result._plot_id)
+
+
+@pytest.mark.parametrize('method,args', [
+    ('entity_frequency', (['OperationQuality', 'Missing'],)),
+    ('entity_frequency', ('OperationQuality', 'feature', True)),
+    ('most_common_entities', (15,)),
+    ('most_common_entities', (15, 'feature_sub', True)),
+    ('least_common_entities', (1,)),
+])
+def test_entity_aggregations_match_pandas(loaders, method, args):
+    sqlite_loader, frame_loader = loaders
+    result = getattr(sqlite_loader.absa, method)(*args)
+    expected = getattr(frame_loader.absa, method)(*args)
+    pd.testing.assert_series_equal(result.sort_index(),
+                                   expected.sort_index(), check_dtype=False,
+                                   check_names=False)
+    assert result._plot_id == expected._plot_id
+
+
+def test_invalid_concept_type(loaders):
+    with pytest.raises(ValueError):
+        loaders[0].concepts.most_common_concepts(concept_type='nothing')
+
+
+def test_filter_reads_only_selected_documents(loaders):
+    sqlite_loader, frame_loader = loaders
+    filtered = sqlite_loader.filter([1, 3])
+    expected = frame_loader.filter([1, 3])
+    for name in writers.HEADERS:
+        pd.testing.assert_frame_equal(
+            _nulls_as_none(filtered[name]).reset_index(drop=True),
+            _nulls_as_none(expected[name]).reset_index(drop=True),
+            check_dtype=False)
+    assert not sqlite_loader._tables.loaded('concepts')
+
+
+def test_remove_concepts_falls_back_to_pandas(loaders):
+    sqlite_loader, _ = loaders
+    sqlite_loader.remove_concepts(['Lenovo'])
+    concepts = sqlite_loader.concepts
+    assert not isinstance(concepts, sql.SQLiteConceptsDataset)
+    assert concepts.concept_frequency(['Lenovo']).tolist() == [0]
+
+
+def test_other_aggregations_load_tables(loaders):
+    sqlite_loader, frame_loader = loaders
+    assert sqlite_loader.sentiments.average_sentiment() == \
+        pytest.approx(frame_loader.sentiments.average_sentiment())
+    assert sqlite_loader.categories.main_category() == \
+        frame_loader.categories.main_category()
+    assert sqlite_loader.concepts.co_occurring_concepts('Lenovo').tolist() \
+        == frame_loader.concepts.co_occurring_concepts('Lenovo').tolist()
+
+
+def test_empty_database(db_path):
+    writer = writers.SQLiteWriter(db_path)
+    writer.init()
+    writer.close()
+    with pytest.raises(ValueError):
+        agg.DatasetLoader.from_sqlite(db_path)